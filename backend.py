@@ -0,0 +1,138 @@
+"""
+Бэкенд выполнения yt-dlp.
+
+thread  - функции выполняются в потоках (asyncio.to_thread), как раньше.
+process - функции выполняются в пуле процессов: извлечение не делит GIL
+          с другими задачами и event loop Telegram, а пропускная
+          способность растет с числом ядер.
+
+Процессы пула запускаются заранее и сразу импортируют yt_dlp, поэтому
+первый запрос не платит за импорт. Результаты возвращаются обычными
+словарями (все функции downloader.py возвращают сериализуемые данные).
+"""
+import asyncio
+import functools
+import os
+import time
+
+from bandwidth import LocalValue
+from downloader import QueueProgressHook, warm_up
+
+# Настройки бэкенда
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "thread")  # thread или process
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(os.cpu_count() or 2)))
+
+
+def _init_worker():
+    """Инициализация процесса пула: заранее загружаем yt_dlp и его экстракторы."""
+    warm_up()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ExtractionBackend:
+    """Выполняет блокирующие функции yt-dlp в потоках или в пуле процессов."""
+
+    def __init__(self, kind: str = EXTRACT_BACKEND, processes: int = EXTRACT_PROCESSES):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Неизвестный бэкенд извлечения: {kind}")
+        self.kind = kind
+        self.processes = max(1, processes)
+        self._pool = None  # ProcessPoolExecutor в режиме process
+        self._manager = None
+
+    def start(self):
+        """Запускает пул процессов (для thread ничего не делает)."""
+        if self.kind != "process" or self._pool is not None:
+            return
+        # Пул нужен только в режиме process - не загружаем multiprocessing без нужды
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # fork небезопасен в процессе с потоками (httpx, event loop)
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # Сервер заранее импортирует только модули пула - процессы
+            # получают их готовыми, без бота и python-telegram-bot
+            context.set_forkserver_preload(["backend", "downloader"])
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=context,
+            initializer=_init_worker,
+        )
+        # Через очереди менеджера процессы пула передают прогресс скачивания
+        self._manager = context.Manager()
+        # Пул создает процессы по требованию - запускаем все сразу, чтобы они были "теплыми"
+        for _ in range(self.processes):
+            self._pool.submit(_ping)
+        print(f"✅ Пул извлечения запущен: {self.processes} процессов ({method})")
+
+    async def warm_up(self) -> float:
+        """
+        Прогревает yt-dlp до первого запроса: в потоке (thread) или во всех
+        процессах пула (process - ждет, пока каждый выполнит _init_worker).
+
+        Returns:
+            float: Длительность прогрева (секунды)
+        """
+        started = time.monotonic()
+        if self.kind == "thread":
+            await asyncio.to_thread(warm_up)
+        else:
+            self.start()
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.processes)))
+        return time.monotonic() - started
+
+    def shutdown(self):
+        """Останавливает пул процессов."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def shared_value(self, value: float = 0.0):
+        """
+        Значение с атрибутом value, изменения которого видят и процессы пула
+        (в режиме thread - обычный объект).
+        """
+        if self.kind == "thread":
+            return LocalValue(value)
+        if self._pool is None:
+            self.start()
+        return self._manager.Value('d', value)
+
+    def progress_hook(self, reporter, gate=None):
+        """
+        Хук прогресса для download_video, связанный с reporter.
+
+        В режиме thread хук сразу обновляет reporter, в режиме process -
+        пишет в очередь, которую reporter читает сам. gate (shared_value) -
+        пишет, только пока gate.value не 0: пока reporter не запущен,
+        очередь не растет.
+        """
+        if self.kind == "thread":
+            return reporter.update
+        if self._pool is None:
+            self.start()
+        reporter.channel = self._manager.Queue()
+        return QueueProgressHook(reporter.channel, gate)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) и возвращает результат.
+
+        В режиме process func должна быть функцией уровня модуля,
+        а аргументы и результат - сериализуемыми.
+        """
+        if self.kind == "thread":
+            return await asyncio.to_thread(func, *args, **kwargs)
+        if self._pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
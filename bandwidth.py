@@ -0,0 +1,140 @@
+"""
+Общий бюджет пропускной способности для скачиваний.
+
+BANDWIDTH_LIMIT_MBPS делится поровну между выполняющимися скачиваниями и
+перераспределяется, когда задачи начинаются и заканчиваются. Поэтому
+параллельная загрузка фрагментов внутри одной задачи не отнимает канал у
+остальных.
+
+Ограничение работает в хуке прогресса yt-dlp: RateLimiter считает байты
+всех соединений задачи и притормаживает поток, который сообщил о них.
+Параметр ratelimit yt-dlp для этого не подходит - загрузчик фрагментов
+копирует его при старте и применяет к каждому соединению отдельно.
+"""
+import os
+import threading
+import time
+
+# Общий лимит скорости скачиваний (Мбит/с); 0 - без ограничения
+BANDWIDTH_LIMIT_MBPS = float(os.getenv("BANDWIDTH_LIMIT_MBPS", "0"))
+# Максимальный всплеск сверх лимита (секунды трафика)
+BURST_SECONDS = 1.0
+# Как часто RateLimiter перечитывает свою долю (секунды) - в режиме process это запрос к менеджеру
+SHARE_REFRESH = 1.0
+
+
+class LocalValue:
+    """Значение с атрибутом value - замена multiprocessing Value в режиме thread."""
+
+    def __init__(self, value: float = 0.0):
+        self.value = value
+
+
+class BandwidthBudget:
+    """Делит лимит скорости между выполняющимися скачиваниями."""
+
+    def __init__(self, limit_mbps: float = BANDWIDTH_LIMIT_MBPS, make_value=LocalValue):
+        """
+        Args:
+            limit_mbps: Общий лимит (Мбит/с), 0 - без ограничения
+            make_value: Создает общее значение доли (ExtractionBackend.shared_value
+                в режиме process), чтобы процессы пула видели перераспределение
+        """
+        self.limit = limit_mbps * 1_000_000 / 8  # байт/с
+        self.make_value = make_value
+        self.active = 0
+        self._share = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def share(self) -> float:
+        """Текущая доля одной задачи (байт/с)."""
+        return self.limit / max(self.active, 1)
+
+    def _update(self):
+        if self._share is None:
+            self._share = self.make_value(self.share())
+        self._share.value = self.share()
+
+    def acquire(self) -> "RateLimiter | None":
+        """
+        Регистрирует скачивание и возвращает его ограничитель (None без лимита).
+
+        После скачивания обязательно вызвать release().
+        """
+        if not self.enabled:
+            return None
+        self.active += 1
+        self._update()
+        return RateLimiter(self._share)
+
+    def release(self, limiter: "RateLimiter | None"):
+        """Снимает скачивание с учета - доли остальных растут."""
+        if limiter is None:
+            return
+        self.active = max(self.active - 1, 0)
+        self._update()
+
+    def stats(self) -> dict:
+        return {'limit': self.limit, 'active': self.active, 'share': self.share() if self.enabled else 0}
+
+
+class RateLimiter:
+    """
+    Ограничитель скорости одной задачи (корзина токенов).
+
+    Вызывается из хука прогресса с накопленным числом скачанных байт, в том
+    числе из нескольких потоков загрузки фрагментов. Передается в процесс
+    пула через pickle (вместе с прокси общей доли).
+    """
+
+    def __init__(self, share):
+        self.share = share
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._rate = 0.0
+        self._rate_checked = 0.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._seen: dict[str, int] = {}
+
+    def __getstate__(self):
+        return {'share': self.share}
+
+    def __setstate__(self, state):
+        self.share = state['share']
+        self._init_state()
+
+    def _current_rate(self, now: float) -> float:
+        if now - self._rate_checked >= SHARE_REFRESH or not self._rate:
+            try:
+                self._rate = float(self.share.value)
+            except Exception:
+                pass  # Менеджер недоступен - остаемся на прежней доле
+            self._rate_checked = now
+        return self._rate
+
+    def __call__(self, stream: str, downloaded: int):
+        """
+        Учитывает байты потока stream (downloaded - всего скачано в нем) и
+        при превышении доли задерживает вызывающий поток.
+        """
+        with self._lock:
+            delta = downloaded - self._seen.get(stream, 0)
+            self._seen[stream] = downloaded
+            if delta <= 0:
+                return
+            now = time.monotonic()
+            rate = self._current_rate(now)
+            if rate <= 0:
+                return
+            self._tokens = min(self._tokens + (now - self._last) * rate, rate * BURST_SECONDS)
+            self._last = now
+            self._tokens -= delta
+            delay = -self._tokens / rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
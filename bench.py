@@ -0,0 +1,520 @@
+"""
+Нагрузочный тест бота без YouTube и Telegram.
+
+Запускает заглушку Bot API (stub_bot_api.py), подменяет извлечение и
+скачивание поддельными функциями, которые создают файлы нужного размера с
+заданной скоростью, и прогоняет через настоящие обработчики url_handler и
+button_handler поток синтетических обновлений:
+
+    python bench.py --jobs 50 --concurrency 10 --size-mb 20 --speed-mbps 200
+    python bench.py --jobs 50 --baseline bench-result.json --output bench-new.json
+
+С --engine progressive|hls скачивание настоящее: download_video (yt-dlp)
+качает с медиасервера-заглушки (stub_media.py), который ограничивает
+скорость каждого соединения. Так сравниваются FRAGMENT_CONCURRENCY,
+HTTP_CHUNK_SIZE_MB и BANDWIDTH_LIMIT_MBPS:
+
+    FRAGMENT_CONCURRENCY=1 python bench.py --engine hls --jobs 4 --concurrency 2
+    FRAGMENT_CONCURRENCY=8 python bench.py --engine hls --jobs 4 --concurrency 2
+
+Результат (задержки p50/p99, задач в секунду, пиковые RSS и занятый диск,
+длительность этапов и счетчики заглушки) печатается и сохраняется в JSON.
+Настройки бота (DOWNLOAD_WORKERS, EXTRACT_BACKEND и т.д.) берутся из
+окружения, как при обычном запуске. RSS замеряется только для основного
+процесса (без процессов пула EXTRACT_BACKEND=process).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_update import build_callback_update, build_message_update
+from stub_bot_api import MB, StubBotApi
+from stub_media import StubMediaServer
+
+BENCH_TOKEN = "123456:bench"
+# Высота кадра, для которой задан --size-mb; размер других качеств пропорционален ей
+BASE_HEIGHT = 720
+# Аудиодорожка во столько раз меньше видео
+AUDIO_RATIO = 10
+# Шаг записи поддельного файла
+CHUNK = 256 * 1024
+
+VIDEO_ID_RE = re.compile(r'v=([\w-]{11})')
+
+
+# --- Поддельный экстрактор ---
+# Функции уровня модуля с настройками из окружения - работают и в пуле процессов
+
+def _setting(name: str) -> float:
+    return float(os.environ[f"BENCH_{name}"])
+
+
+def _choice_size(quality: str, audio: bool = False) -> int:
+    size = int(_setting("SIZE_MB") * MB)
+    if audio:
+        return size // AUDIO_RATIO
+    if quality.isdigit():
+        return size * int(quality) // BASE_HEIGHT
+    return size
+
+
+def fake_get_video_info(url: str) -> dict:
+    """Как get_video_info, но без сети: задержка BENCH_INFO_MS и готовый результат."""
+    time.sleep(_setting("INFO_MS") / 1000)
+    video_id = VIDEO_ID_RE.search(url).group(1)
+    duration = int(_setting("DURATION"))
+    heights = [1080, 720, 480, 360]
+    choice_sizes = {str(h): _choice_size(str(h)) for h in heights}
+    choice_sizes.update({
+        'best': _choice_size("1080"),
+        'worst': _choice_size("360"),
+        'audio': _choice_size("", audio=True),
+        'audio_mp3': _choice_size("", audio=True),
+    })
+    return {
+        'title': f"Bench {video_id}",
+        'duration': duration,
+        'thumbnail': '',
+        'uploader': 'bench',
+        'view_count': 0,
+        'available_qualities': heights,
+        'raw_info': {'id': video_id, 'title': f"Bench {video_id}", 'duration': duration, 'epoch': time.time()},
+        'choice_sizes': choice_sizes,
+        'estimated_size': choice_sizes['best'],
+    }
+
+
+def fake_download_video(url: str, quality: str = "best", audio_only: bool = False,
+                        info: dict | None = None, workdir=None, audio_format: str = "native",
+                        progress_hook=None, rate_limiter=None, clip=None, cancel=None) -> tuple[str, dict]:
+    """Как download_video: пишет файл нужного размера со скоростью BENCH_SPEED_MBPS."""
+    from workspace import new_job_dir
+
+    video_id = VIDEO_ID_RE.search(url).group(1)
+    workdir = Path(workdir or new_job_dir())
+    size = _choice_size(quality, audio=audio_only)
+    duration = int(_setting("DURATION"))
+    if clip is not None:
+        # Фрагмент - доля размера по длине отрезка
+        duration = min(clip[1], duration) - clip[0]
+        size = size * duration // int(_setting("DURATION"))
+    speed = _setting("SPEED_MBPS") * MB / 8
+    path = workdir / f"Bench {video_id}.{'m4a' if audio_only else 'mp4'}"
+
+    started = time.monotonic()
+    written = 0
+    chunk = b"\0" * CHUNK
+    with open(path, "wb") as f:
+        while written < size:
+            if cancel is not None and cancel.value:
+                raise Exception("Скачивание отменено")
+            step = min(CHUNK, size - written)
+            f.write(chunk[:step])
+            written += step
+            # Темп записи - как у скачивания с заданной скоростью
+            delay = started + written / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if rate_limiter is not None:
+                rate_limiter(path.name, written)
+            if progress_hook is not None:
+                elapsed = time.monotonic() - started
+                progress_hook({
+                    'status': 'downloading' if written < size else 'finished',
+                    'downloaded': written,
+                    'total': size,
+                    'speed': written / elapsed if elapsed else 0,
+                    'eta': int((size - written) / speed),
+                    'audio': audio_only,
+                })
+    elapsed = time.monotonic() - started
+    return str(path), {
+        'title': f"Bench {video_id}",
+        'duration': duration,
+        'filesize': size,
+        'filename': path.name,
+        'elapsed': elapsed,
+        'timings': {'extract': 0.0, 'download': elapsed, 'postprocess': 0.0, 'fit': 0.0},
+        'downloaded_bytes': size,
+    }
+
+
+# --- Замеры ---
+
+def current_rss() -> int:
+    """
+    Текущий RSS процесса в байтах (без /proc - пиковый из getrusage).
+
+    Там, где нет ни /proc, ни модуля resource (Windows), замер пропускается - 0.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Процентиль методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50), 4),
+        'p99': round(percentile(values, 99), 4),
+        'mean': round(sum(values) / len(values), 4) if values else 0.0,
+        'max': round(max(values), 4) if values else 0.0,
+    }
+
+
+class Sampler:
+    """Периодически замеряет RSS и занятое место в TEMP_DIR, запоминая пики."""
+
+    def __init__(self, disk_usage, interval: float = 0.1):
+        self.disk_usage = disk_usage
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._task: asyncio.Task | None = None
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, current_rss())
+        self.peak_disk = max(self.peak_disk, self.disk_usage())
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.sample)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+
+
+def video_id_for(run: str, index: int) -> str:
+    """ID видео из 11 символов: префикс прогона + номер."""
+    return f"{run}{index:05d}"[-11:]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+# --- Прогон ---
+
+async def run_job(bot, app, stub, index: int, video_id: str, choice: str, timings: dict) -> bool:
+    """Одна задача: ссылка -> нажатие кнопки -> отправка. Возвращает True при успехе."""
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+    user_id = chat_id = 1000 + index
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    context = CallbackContext(app, chat_id=chat_id, user_id=user_id)
+
+    started = time.monotonic()
+    update = Update.de_json(build_message_update(url, user_id, chat_id), app.bot)
+    await bot.url_handler(update, context)
+    info_done = time.monotonic()
+    if not stub.last_text.get(chat_id, "").startswith("✅"):
+        return False
+
+    data = bot.button_data(choice, bot.session_key(url))
+    update = Update.de_json(build_callback_update(data, user_id, chat_id), app.bot)
+    await bot.button_handler(update, context)
+    finished = time.monotonic()
+
+    timings['info'].append(info_done - started)
+    timings['download_and_send'].append(finished - info_done)
+    timings['total'].append(finished - started)
+    return stub.last_text.get(chat_id, "").startswith("✅")
+
+
+async def benchmark(args) -> dict:
+    stub = StubBotApi(args.max_upload_mb, args.api_latency_ms / 1000, local=not args.no_local,
+                      flood_every=args.flood_every)
+    await stub.start("127.0.0.1", 0)
+
+    workdir = Path(tempfile.mkdtemp(prefix="ytbot-bench-"))
+    os.environ.update({
+        'BOT_TOKEN': BENCH_TOKEN,
+        'BOT_API_URL': f"http://127.0.0.1:{stub.port}",
+        'BOT_API_LOCAL': "0" if args.no_local else "1",
+        'MAX_FILE_SIZE_MB': str(args.max_upload_mb),
+        'TEMP_DIR': str(workdir / "temp"),
+        'FILE_CACHE_PATH': str(workdir / "file_cache.db"),
+        'STORE_URL': "memory://",
+        'STREAM_UPLOAD': "0",
+        'BENCH_SIZE_MB': str(args.size_mb),
+        'BENCH_SPEED_MBPS': str(args.speed_mbps),
+        'BENCH_INFO_MS': str(args.info_ms),
+        'BENCH_DURATION': str(args.duration),
+    })
+
+    # Бот импортируется после настройки окружения - его настройки читаются при импорте
+    import bot
+    from metrics import JOBS_TOTAL, STAGE_SECONDS
+    from telegram.ext import Application
+    from workspace import temp_dir_usage
+
+    bot.get_video_info = fake_get_video_info
+    bot.download_video = fake_download_video
+
+    app = bot.configure_builder(Application.builder().token(BENCH_TOKEN)).build()
+    await app.initialize()
+    bot.extraction_backend.start()
+
+    run = ''.join(random.choices(string.ascii_letters, k=6))
+    distinct = args.distinct or args.jobs
+    choice = "format_audio" if args.mode == "audio" else f"quality_{args.quality}"
+    timings = {'info': [], 'download_and_send': [], 'total': []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sampler = Sampler(temp_dir_usage)
+    results = []
+
+    async def limited(index: int):
+        async with semaphore:
+            try:
+                return await run_job(bot, app, stub, index, video_id_for(run, index % distinct), choice, timings)
+            except Exception as e:
+                print(f"⚠️ Задача {index}: {e}")
+                return False
+
+    sampler.start()
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(*(limited(i) for i in range(args.jobs)))
+    finally:
+        elapsed = time.monotonic() - started
+        await sampler.stop()
+        await app.shutdown()
+        bot.extraction_backend.shutdown()
+        await stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    succeeded = sum(1 for ok in results if ok)
+    stages = {
+        key[0]: {'count': value['count'], 'mean': round(value['sum'] / value['count'], 4)}
+        for key, value in STAGE_SECONDS.totals().items() if value['count']
+    }
+    return {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'jobs': args.jobs,
+            'concurrency': args.concurrency,
+            'distinct_videos': distinct,
+            'mode': args.mode,
+            'quality': args.quality,
+            'size_mb': args.size_mb,
+            'speed_mbps': args.speed_mbps,
+            'info_ms': args.info_ms,
+            'api_latency_ms': args.api_latency_ms,
+            'local_mode': not args.no_local,
+            'flood_every': args.flood_every,
+            'download_workers': bot.download_scheduler.workers,
+            'extract_backend': bot.extraction_backend.kind,
+        },
+        'succeeded': succeeded,
+        'failed': args.jobs - succeeded,
+        'elapsed': round(elapsed, 3),
+        'jobs_per_sec': round(succeeded / elapsed, 3) if elapsed else 0.0,
+        'latency': {name: summarize(values) for name, values in timings.items()},
+        'stages': stages,
+        'jobs_by_result': {key[0]: value for key, value in JOBS_TOTAL.values().items()},
+        'peak_rss_mb': round(sampler.peak_rss / MB, 1),
+        'peak_disk_mb': round(sampler.peak_disk / MB, 1),
+        'stub': stub.stats(),
+    }
+
+
+async def benchmark_engine(args) -> dict:
+    """Настоящие скачивания download_video с медиасервера-заглушки."""
+    media = StubMediaServer(args.size_mb, args.per_connection_mbps, args.segments)
+    await media.start("127.0.0.1", 0)
+
+    workdir = Path(tempfile.mkdtemp(prefix="ytbot-bench-"))
+    os.environ['TEMP_DIR'] = str(workdir / "temp")
+    os.environ.setdefault('BANDWIDTH_LIMIT_MBPS', "0")
+
+    from bandwidth import BANDWIDTH_LIMIT_MBPS, BandwidthBudget
+    from downloader import FRAGMENT_CONCURRENCY, HTTP_CHUNK_SIZE_MB, download_video, http_engine
+    from workspace import new_job_dir, temp_dir_usage
+
+    path = "/video.mp4" if args.engine == "progressive" else "/stream.m3u8"
+    url = f"http://127.0.0.1:{media.port}{path}"
+    budget = BandwidthBudget(BANDWIDTH_LIMIT_MBPS)
+    timings = {'total': []}
+    throughput = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sampler = Sampler(temp_dir_usage)
+
+    async def limited(index: int) -> bool:
+        async with semaphore:
+            limiter = budget.acquire()
+            job_dir = new_job_dir()
+            started = time.monotonic()
+            try:
+                file_path, info = await asyncio.to_thread(
+                    download_video, url, "best", workdir=job_dir, rate_limiter=limiter
+                )
+            except Exception as e:
+                print(f"⚠️ Задача {index}: {e}")
+                return False
+            finally:
+                budget.release(limiter)
+            elapsed = time.monotonic() - started
+            size = Path(file_path).stat().st_size
+            shutil.rmtree(job_dir, ignore_errors=True)
+            timings['total'].append(elapsed)
+            throughput.append(size * 8 / 1_000_000 / elapsed)
+            return True
+
+    print(f"Скачивание: {http_engine()}")
+    sampler.start()
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(*(limited(i) for i in range(args.jobs)))
+    finally:
+        elapsed = time.monotonic() - started
+        await sampler.stop()
+        await media.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    succeeded = sum(1 for ok in results if ok)
+    downloaded = succeeded * media.size
+    return {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'engine': args.engine,
+            'jobs': args.jobs,
+            'concurrency': args.concurrency,
+            'size_mb': args.size_mb,
+            'per_connection_mbps': args.per_connection_mbps,
+            'segments': args.segments,
+            'fragment_concurrency': FRAGMENT_CONCURRENCY,
+            'http_chunk_size_mb': HTTP_CHUNK_SIZE_MB,
+            'bandwidth_limit_mbps': BANDWIDTH_LIMIT_MBPS,
+            'http_engine': http_engine(),
+        },
+        'succeeded': succeeded,
+        'failed': args.jobs - succeeded,
+        'elapsed': round(elapsed, 3),
+        'jobs_per_sec': round(succeeded / elapsed, 3) if elapsed else 0.0,
+        'aggregate_mbps': round(downloaded * 8 / 1_000_000 / elapsed, 2) if elapsed else 0.0,
+        'latency': {name: summarize(values) for name, values in timings.items()},
+        'job_mbps': summarize(throughput),
+        'peak_rss_mb': round(sampler.peak_rss / MB, 1),
+        'peak_disk_mb': round(sampler.peak_disk / MB, 1),
+        'media': media.stats(),
+    }
+
+
+def print_report(result: dict, baseline: dict | None = None):
+    def delta(value: float, path: tuple) -> str:
+        if baseline is None:
+            return ""
+        old = baseline
+        for key in path:
+            old = (old or {}).get(key)
+        if not old:
+            return ""
+        return f" ({(value - old) / old:+.0%})"
+
+    latency = result['latency']['total']
+    print(f"Задач: {result['succeeded']} успешно, {result['failed']} с ошибкой за {result['elapsed']}с")
+    print(f"Задач в секунду: {result['jobs_per_sec']}{delta(result['jobs_per_sec'], ('jobs_per_sec',))}")
+    if 'aggregate_mbps' in result:
+        print(f"Общая скорость: {result['aggregate_mbps']} Мбит/с{delta(result['aggregate_mbps'], ('aggregate_mbps',))}")
+        print(f"Скорость задачи: p50 {result['job_mbps']['p50']} Мбит/с, "
+              f"в среднем {result['job_mbps']['mean']} Мбит/с")
+        print(f"Соединений: {result['media']['connections']}, запросов: {result['media']['requests']}")
+    for name in result['latency']:
+        stats = result['latency'][name]
+        print(f"  {name}: p50 {stats['p50']}с{delta(stats['p50'], ('latency', name, 'p50'))}, "
+              f"p99 {stats['p99']}с{delta(stats['p99'], ('latency', name, 'p99'))}")
+    for stage, stats in sorted(result.get('stages', {}).items()):
+        print(f"  этап {stage}: {stats['count']} раз, в среднем {stats['mean']}с")
+    print(f"Пиковый RSS: {result['peak_rss_mb']}MB{delta(result['peak_rss_mb'], ('peak_rss_mb',))}")
+    print(f"Пиковый диск: {result['peak_disk_mb']}MB{delta(result['peak_disk_mb'], ('peak_disk_mb',))}")
+    if not latency['count']:
+        print("⚠️ Ни одна задача не завершилась")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на заглушках Bot API и yt-dlp")
+    parser.add_argument('--jobs', type=int, default=20, help='Сколько задач выполнить')
+    parser.add_argument('--concurrency', type=int, default=5, help='Сколько пользователей одновременно')
+    parser.add_argument('--distinct', type=int, default=0,
+                        help='Сколько разных видео (меньше --jobs - часть задач попадет в кэш)')
+    parser.add_argument('--mode', choices=('video', 'audio'), default='video')
+    parser.add_argument('--quality', default='720', help='Качество видео для кнопки')
+    parser.add_argument('--size-mb', type=float, default=10, help='Размер видео 720p')
+    parser.add_argument('--duration', type=int, default=300, help='Длительность видео (секунды)')
+    parser.add_argument('--speed-mbps', type=float, default=200, help='Скорость "скачивания" (Мбит/с)')
+    parser.add_argument('--info-ms', type=float, default=300, help='Время получения информации о видео')
+    parser.add_argument('--api-latency-ms', type=float, default=20, help='Задержка ответа Bot API')
+    parser.add_argument('--max-upload-mb', type=int, default=2000, help='Лимит файла заглушки Bot API')
+    parser.add_argument('--no-local', action='store_true', help='Загружать файлы по HTTP, а не по пути')
+    parser.add_argument('--flood-every', type=int, default=0,
+                        help='Заглушка Bot API отвечает 429 на каждую N-ю отправку файла')
+    parser.add_argument('--engine', choices=('progressive', 'hls'),
+                        help='Настоящее скачивание yt-dlp с медиасервера-заглушки вместо поддельного')
+    parser.add_argument('--per-connection-mbps', type=float, default=16,
+                        help='Лимит скорости соединения медиасервера (с --engine)')
+    parser.add_argument('--segments', type=int, default=50, help='Число фрагментов HLS (с --engine)')
+    parser.add_argument('--output', default='bench-result.json', help='Куда сохранить результат')
+    parser.add_argument('--baseline', help='Прошлый результат для сравнения')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+
+    result = asyncio.run(benchmark_engine(args) if args.engine else benchmark(args))
+    Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+    print_report(result, baseline)
+    print(f"Результат сохранен: {args.output}")
+    if result['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
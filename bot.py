@@ -0,0 +1,1746 @@
+import time
+
+# Начало запуска - отсюда считается время импорта и готовности бота
+BOOT_STARTED = time.monotonic()
+
+import os
+import asyncio
+import hashlib
+import html
+import re
+import signal
+import socket
+import tempfile
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaVideo,
+    Update,
+)
+from telegram.error import BadRequest
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
+
+from backend import ExtractionBackend
+from bandwidth import BANDWIDTH_LIMIT_MBPS, BandwidthBudget
+from bot_api import BOT_API_LOCAL, BOT_API_URL, MAX_FILE_SIZE_MB, configure_builder, upload_source
+from cache import FileIdCache, MetadataCache
+from downloader import (
+    MAX_FILE_SIZE,
+    QUALITY_HEIGHTS,
+    StageError,
+    download_video,
+    format_clip,
+    get_video_info,
+    http_engine,
+    resolve_playlist,
+    resolve_stream,
+)
+from estimator import throughput_meter
+from metrics import (
+    BOOT_SECONDS,
+    BYTES_TOTAL,
+    CACHE_REQUESTS,
+    JOBS_TOTAL,
+    STAGE_SECONDS,
+    Counter,
+    Gauge,
+    current_trace,
+    log,
+    new_trace,
+    record_error,
+    render as render_metrics,
+)
+from prefetch import Prefetch, Prefetcher
+from progress import ProgressReporter, render_batch
+from retry import BREAKERS, retry_call
+from scheduler import DownloadScheduler, QueueFullError
+from storage import STORE_URL, create_store
+from streaming import STREAM_UPLOAD, stream_upload
+from web_server import HttpServer, Response
+from workspace import (
+    FinishedDownloads,
+    JobSpace,
+    QuotaExceededError,
+    StorageManager,
+    sweep_orphans,
+)
+
+# Время импорта модулей бота и библиотек (без yt_dlp - он загружается при прогреве)
+IMPORT_SECONDS = time.monotonic() - BOOT_STARTED
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "8239304307:AAGxvv1cI82eYE-mHIAFtts-QkO8-tQj2-M")
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес бота для вебхука без пути, например https://bot.example.com.
+# Если не задан, вебхук не регистрируется в Telegram (локальная проверка через fake_update.py)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет вебхука (заголовок X-Telegram-Bot-Api-Secret-Token) - обязателен в режиме webhook:
+# без него кто угодно, знающий адрес, может отправлять боту поддельные обновления
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# HTTP-сервер для вебхука и проверок здоровья (/health, /ready).
+# В режиме polling его можно отключить: HEALTH_SERVER=0
+HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
+HTTP_PORT = int(os.getenv("HTTP_PORT") or os.getenv("PORT") or "8080")
+HEALTH_SERVER = os.getenv("HEALTH_SERVER", "1") == "1"
+
+# Администраторы (ID через запятую) - могут сбрасывать кэш командой /uncache
+# и смотреть /stats. Если список пуст, эти команды недоступны никому.
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()}
+
+# Разрешить перекодирование в MP3 (кнопка "MP3"); по умолчанию аудио отправляется без перекодирования
+ALLOW_MP3 = os.getenv("ALLOW_MP3", "1") == "1"
+
+# Пакетные загрузки (несколько ссылок в сообщении или плейлист)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "25"))
+BATCH_PARALLEL = int(os.getenv("BATCH_PARALLEL", "3"))
+BATCH_QUALITY = os.getenv("BATCH_QUALITY", "720")
+# Файлов в одной медиагруппе (Telegram допускает от 2 до 10)
+MEDIA_GROUP_SIZE = 10
+
+# Имя экземпляра бота в общем хранилище
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Сколько хранится сессия сообщения с кнопками (секунды). Для ссылок с ID видео
+# кнопки работают и после ее истечения - ссылка восстанавливается по ID
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+# TTL блокировки скачивания видео в одном режиме (секунды): задача продлевает ее,
+# а после падения экземпляра блокировка освобождается не позже чем через это время
+FETCH_LOCK_TTL = int(os.getenv("FETCH_LOCK_TTL", "120"))
+# Как часто проверять, не освободилось ли скачивание, занятое другой задачей
+FETCH_LOCK_POLL = 2
+# Как часто экземпляр публикует состояние своей очереди
+HEARTBEAT_INTERVAL = 15
+# Как часто удалять просроченные записи хранилища и лишние записи кэша file_id (секунды)
+STORE_PURGE_INTERVAL = float(os.getenv("STORE_PURGE_INTERVAL", "300"))
+# Сколько ждать отрезка для фрагмента после нажатия кнопки "Фрагмент" (секунды)
+CLIP_WAIT_TTL = 600
+# Сколько ждать прогрева yt-dlp перед приемом обновлений (дальше он идет в фоне)
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+
+# Общее хранилище состояния (STORE_URL): сессии, кэши, блокировки, состояние очередей
+shared_store = create_store()
+# memory:// - один экземпляр; кэш file_id тогда остается в собственном файле SQLite
+store_is_shared = not STORE_URL.startswith("memory:")
+
+# Кэш file_id уже загруженных в Telegram файлов
+file_id_cache = FileIdCache(store=shared_store if store_is_shared else None)
+
+# Кэш информации о видео (ключ - ID видео)
+metadata_cache = MetadataCache(store=shared_store if store_is_shared else None)
+
+# Очередь загрузок с ограничением параллельности
+download_scheduler = DownloadScheduler()
+
+# Квота на временные файлы (TEMP_QUOTA_MB) и фоновая очистка TEMP_DIR
+storage_manager = StorageManager()
+
+# Скачанные, но не отправленные файлы - повтор задачи начинается с отправки
+finished_downloads = FinishedDownloads()
+
+# Где выполняется yt-dlp: в потоках или в пуле процессов (EXTRACT_BACKEND)
+extraction_backend = ExtractionBackend()
+
+# Общий лимит скорости скачиваний (BANDWIDTH_LIMIT_MBPS), поровну между задачами
+bandwidth_budget = BandwidthBudget(make_value=extraction_backend.shared_value)
+
+# Предзагрузка вероятного выбора, пока пользователь смотрит на кнопки (PREFETCH=1)
+prefetcher = Prefetcher(download_scheduler, storage_manager, shared_store, extraction_backend.shared_value)
+
+# Метрики, которые читаются из состояния бота в момент запроса /metrics
+Gauge("ytbot_jobs_active", "Выполняющиеся задачи загрузки", func=lambda: download_scheduler.active)
+Gauge("ytbot_jobs_queued", "Задачи в очереди загрузок", func=lambda: download_scheduler.queued)
+# Размер по последнему проходу StorageManager.scan - обход папки не блокирует event loop на каждый запрос
+Gauge("ytbot_temp_dir_bytes", "Занято временными файлами в TEMP_DIR", func=lambda: storage_manager.usage)
+Gauge(
+    "ytbot_bandwidth_share_bytes", "Доля лимита скорости одной задачи (байт/с), 0 - без лимита",
+    func=lambda: bandwidth_budget.stats()['share'],
+)
+Gauge(
+    "ytbot_finished_kept", "Скачанные файлы, сохраненные для повтора отправки", func=lambda: len(finished_downloads)
+)
+Gauge(
+    "ytbot_circuit_open", "Цель отключена автоматом после череды ошибок (1 - да)", ("target",),
+    func=lambda: {(target,): int(b.state != "closed") for target, b in BREAKERS.items()},
+)
+Gauge("ytbot_prefetch_active", "Предзагрузки, ждущие нажатия", func=lambda: len(prefetcher))
+Gauge("ytbot_disk_quota_bytes", "Квота на TEMP_DIR", func=lambda: storage_manager.quota)
+Gauge("ytbot_disk_committed_bytes", "Занято в квоте резервами задач", func=lambda: storage_manager.committed)
+Gauge("ytbot_disk_waiting_jobs", "Задачи, ждущие места на диске", func=lambda: storage_manager.stats()['waiting'])
+Counter(
+    "ytbot_disk_rejected_total", "Задачи, не дождавшиеся места на диске", func=lambda: storage_manager.rejected
+)
+Counter(
+    "ytbot_metadata_cache_requests_total",
+    "Обращения к кэшу информации о видео по результату",
+    ("result",),
+    func=lambda: {(result,): metadata_cache.stats()[result] for result in ("hits", "misses", "coalesced")},
+)
+
+
+def is_youtube_url(url: str) -> bool:
+    """Проверяет, является ли ссылка ссылкой на YouTube."""
+    youtube_patterns = [
+        r'(?:https?://)?(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/|youtube\.com/v/)',
+        r'(?:https?://)?(?:www\.)?youtube\.com/shorts/',
+        r'(?:https?://)?(?:www\.)?youtube\.com/playlist\?',
+    ]
+    return any(re.search(pattern, url) for pattern in youtube_patterns)
+
+
+def is_playlist_url(url: str) -> bool:
+    """Ссылка на плейлист (youtube.com/playlist?list=...)."""
+    return bool(re.search(r'youtube\.com/playlist\?(?:.*&)?list=', url))
+
+
+def find_youtube_urls(text: str) -> list[str]:
+    """Все ссылки на YouTube в тексте, без повторов, в порядке появления."""
+    urls = []
+    for word in text.split():
+        if is_youtube_url(word) and word not in urls:
+            urls.append(word)
+    return urls
+
+
+def extract_video_id(url: str) -> str:
+    """Извлекает ID видео из URL."""
+    patterns = [
+        r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/|youtube\.com/v/)([a-zA-Z0-9_-]{11})',
+        r'youtube\.com/shorts/([a-zA-Z0-9_-]{11})',
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return ""
+
+
+# Отрезок времени: "1:20-2:10", "80-130", "1:02:03-1:05:00"
+CLIP_RE = re.compile(r'^(\d+(?::\d{1,2}){0,2})-(\d+(?::\d{1,2}){0,2})$')
+
+
+def parse_timestamp(text: str) -> int:
+    """
+    Время "ч:мм:сс", "м:сс" или секунды - в секундах.
+
+    Raises:
+        ValueError: Если минуты или секунды после двоеточия не меньше 60
+    """
+    head, *rest = (int(part) for part in text.split(":"))
+    seconds = head
+    for part in rest:
+        if part >= 60:
+            raise ValueError(f"Неверное время: {text}")
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def parse_clip(text: str) -> tuple[int, int] | None:
+    """Отрезок (начало, конец) в секундах из "1:20-2:10" или None."""
+    match = CLIP_RE.match(text.strip())
+    if not match:
+        return None
+    try:
+        start, end = parse_timestamp(match.group(1)), parse_timestamp(match.group(2))
+    except ValueError:
+        return None
+    return (start, end) if start < end else None
+
+
+def split_clip(url: str) -> tuple[str, tuple[int, int] | None]:
+    """
+    Отделяет отрезок из параметра t ссылки (url&t=1:20-2:10).
+
+    Returns:
+        tuple: (ссылка без отрезка, отрезок или None). Обычный t=80 остается в ссылке
+    """
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    clip = next((parse_clip(value) for name, value in params if name == "t" and parse_clip(value)), None)
+    if clip is None:
+        return url, None
+    query = urlencode([(name, value) for name, value in params if name != "t"])
+    return urlunsplit(parts._replace(query=query)), clip
+
+
+def estimate_download_time(filesize_bytes: int, speed_mbps: float | None = None) -> int:
+    """
+    Оценивает время скачивания в секундах.
+    
+    Args:
+        filesize_bytes: Размер файла в байтах
+        speed_mbps: Скорость скачивания в Мбит/с (по умолчанию - средняя
+            скорость последних скачиваний)
+    
+    Returns:
+        int: Примерное время в секундах
+    """
+    # Конвертируем скорость в байты/сек
+    if speed_mbps is None:
+        speed_bytes_per_sec = throughput_meter.speed()
+    else:
+        speed_bytes_per_sec = (speed_mbps * 1024 * 1024) / 8  # Мбит/с -> байт/с
+    
+    # Добавляем 20% накладных расходов
+    estimated_seconds = int((filesize_bytes / speed_bytes_per_sec) * 1.2)
+    
+    return max(estimated_seconds, 5)  # Минимум 5 секунд
+
+
+def format_time(seconds: int) -> str:
+    """Форматирует время в читаемый вид."""
+    if seconds < 60:
+        return f"{seconds} сек"
+    elif seconds < 3600:
+        minutes = seconds // 60
+        secs = seconds % 60
+        return f"{minutes} мин {secs} сек"
+    else:
+        hours = seconds // 3600
+        minutes = (seconds % 3600) // 60
+        return f"{hours} ч {minutes} мин"
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /start – приветствие и инструкция."""
+    welcome_text = (
+        "👋 <b>Привет! Я бот для скачивания YouTube видео</b> 📥\n\n"
+        "📌 <b>Как использовать:</b>\n"
+        "1. Отправьте мне ссылку на YouTube видео\n"
+        "2. Выберите формат (видео или аудио)\n"
+        "3. Получите скачанное видео/аудио\n\n"
+        "✨ <b>Поддерживаемые форматы:</b>\n"
+        "• Обычные видео (youtube.com/watch?v=...)\n"
+        "• Короткие видео (youtube.com/shorts/...)\n"
+        "• Ссылки youtu.be\n\n"
+        "🚀 Просто отправьте ссылку на видео!"
+    )
+    
+    await update.message.reply_text(
+        welcome_text,
+        parse_mode="HTML"
+    )
+
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /help – справка."""
+    help_text = (
+        "📖 <b>Справка по использованию бота</b>\n\n"
+        "🔗 <b>Отправка ссылки:</b>\n"
+        "Просто отправьте ссылку на YouTube видео в чат.\n"
+        f"Можно отправить несколько ссылок одним сообщением или ссылку на плейлист (до {BATCH_MAX_ITEMS} видео).\n"
+        "Фрагмент видео: добавьте к ссылке отрезок (ссылка 1:20-2:10 или &t=1:20-2:10) "
+        "или нажмите кнопку «✂️ Фрагмент».\n\n"
+        "📥 <b>Форматы скачивания:</b>\n"
+        f"• <b>Видео</b> - скачивает видео с лучшим качеством (до {MAX_FILE_SIZE_MB}MB)\n"
+        "• <b>Аудио</b> - скачивает звук в исходном качестве (M4A/Opus)\n"
+        "• <b>MP3</b> - скачивает звук, перекодированный в MP3 (дольше)\n\n"
+        "⚙️ <b>Команды:</b>\n"
+        "/start - Начать работу с ботом\n"
+        "/help - Показать эту справку\n\n"
+        "⚠️ <b>Ограничения:</b>\n"
+        f"• Максимальный размер файла: {MAX_FILE_SIZE_MB}MB\n"
+        "• Для больших видео будет предложено более низкое качество\n"
+        "• Некоторые видео могут быть недоступны для скачивания"
+    )
+    
+    await update.message.reply_text(
+        help_text,
+        parse_mode="HTML"
+    )
+
+
+async def url_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает ссылки на YouTube видео."""
+    new_trace()
+    started = time.monotonic()
+    text = update.message.text.strip()
+    urls = find_youtube_urls(text)
+    
+    # Несколько ссылок или плейлист - пакетная загрузка
+    if len(urls) > 1 or (urls and is_playlist_url(urls[0])):
+        await batch_handler(update, urls)
+        return
+    
+    # Отрезок после нажатия кнопки "Фрагмент"
+    if not urls and parse_clip(text):
+        pending = await asyncio.to_thread(shared_store.get, f"clip_wait:{update.effective_user.id}")
+        session = await load_session(pending) if pending else {}
+        if session.get('url'):
+            await asyncio.to_thread(shared_store.delete, f"clip_wait:{update.effective_user.id}")
+            await show_choices(update.message, session['url'], parse_clip(text), started)
+            return
+    
+    url = urls[0] if urls else text
+    
+    if not is_youtube_url(url):
+        await update.message.reply_text(
+            "❌ Это не похоже на ссылку YouTube.\n\n"
+            "Пожалуйста, отправьте корректную ссылку на YouTube видео.\n"
+            "Например: https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+        )
+        return
+    
+    # Отрезок: в ссылке (&t=1:20-2:10) или отдельным словом после нее
+    url, clip = split_clip(url)
+    if clip is None:
+        clip = next((parse_clip(word) for word in text.split() if parse_clip(word)), None)
+    await show_choices(update.message, url, clip, started)
+
+
+async def show_choices(message, url: str, clip: tuple[int, int] | None = None, started: float | None = None):
+    """
+    Получает информацию о видео и отвечает на message кнопками выбора качества.
+
+    Args:
+        clip: Отрезок (начало, конец) в секундах - размеры и время считаются для него
+        started: Начало обработки запроса (для замера первого запроса)
+    """
+    # Получаем информацию о видео
+    try:
+        await message.reply_text("⏳ Получаю информацию о видео...")
+        cache_key = extract_video_id(url) or url
+        # Кнопки несут ключ сессии - каждое сообщение работает независимо от других ссылок
+        key = session_key(url)
+        video_info = await metadata_cache.get_or_fetch(cache_key, lambda: fetch_video_info(url))
+        if started is not None:
+            note_first_request(time.monotonic() - started)
+        
+        duration = video_info['duration']
+        choice_sizes = video_info.get('choice_sizes', {})
+        estimated_size = video_info['estimated_size']
+        if clip is not None:
+            if duration and clip[0] >= duration:
+                await message.reply_text(
+                    f"❌ Начало фрагмента дальше конца видео ({format_time(duration)})."
+                )
+                return
+            clip = (clip[0], min(clip[1], duration) if duration else clip[1])
+            key = f"{key}~{clip[0]}-{clip[1]}"
+            # Скачивается только отрезок - размеры пропорциональны его длине
+            fraction = (clip[1] - clip[0]) / duration if duration else 1.0
+            choice_sizes = {choice: int(size * fraction) for choice, size in choice_sizes.items()}
+            estimated_size = int(estimated_size * fraction)
+            duration = clip[1] - clip[0]
+        
+        # Форматируем информацию
+        duration_min = duration // 60
+        duration_sec = duration % 60
+        estimated_size_mb = estimated_size / (1024 * 1024)
+        download_time = estimate_download_time(estimated_size)
+        
+        # Создаем клавиатуру с выбором качества
+        keyboard = []
+        
+        # Кнопки качества видео
+        quality_buttons = []
+        available = video_info.get('available_qualities', [])
+        hidden = 0
+        
+        def fits(choice: str) -> bool:
+            # Неизвестный размер (0) не скрываем - проверка будет при скачивании
+            return choice_sizes.get(choice, 0) <= MAX_FILE_SIZE
+        
+        # Добавляем кнопки качества, которые поместятся в лимит Telegram
+        for height in QUALITY_HEIGHTS:
+            if height not in available:
+                continue
+            if fits(str(height)):
+                quality_buttons.append(InlineKeyboardButton(f"{height}p", callback_data=button_data(f"quality_{height}", key)))
+            else:
+                hidden += 1
+        
+        # Добавляем кнопки best/worst
+        if fits("best"):
+            quality_buttons.append(InlineKeyboardButton("⭐ Лучшее", callback_data=button_data("quality_best", key)))
+        else:
+            hidden += 1
+        if fits("worst"):
+            quality_buttons.append(InlineKeyboardButton("📉 Худшее", callback_data=button_data("quality_worst", key)))
+        else:
+            hidden += 1
+        
+        # Размещаем кнопки по 2 в ряд
+        for i in range(0, len(quality_buttons), 2):
+            if i + 1 < len(quality_buttons):
+                keyboard.append([quality_buttons[i], quality_buttons[i + 1]])
+            else:
+                keyboard.append([quality_buttons[i]])
+        
+        # Кнопка аудио
+        audio_buttons = [InlineKeyboardButton("🎵 Аудио (M4A)", callback_data=button_data("format_audio", key))]
+        if ALLOW_MP3:
+            audio_buttons.append(InlineKeyboardButton("🎵 MP3", callback_data=button_data("format_audio_mp3", key)))
+        keyboard.append(audio_buttons)
+        if clip is None:
+            keyboard.append([InlineKeyboardButton("✂️ Фрагмент", callback_data=button_data("clip", key))])
+        
+        info_text = (
+            f"✅ <b>Видео найдено!</b>\n\n"
+            f"📹 <b>{video_info['title']}</b>\n"
+            f"👤 Автор: {video_info['uploader']}\n"
+            f"⏱ Длительность: {duration_min}:{duration_sec:02d}\n"
+        )
+        if clip:
+            info_text += f"✂️ Фрагмент: {format_clip(clip)}\n"
+        info_text += (
+            f"📊 Примерный размер: {estimated_size_mb:.1f} MB\n"
+            f"⏳ Примерное время скачивания: ~{format_time(download_time)}\n\n"
+        )
+        if hidden:
+            info_text += f"⚠️ Скрыто качеств больше {MAX_FILE_SIZE // (1024 * 1024)}MB: {hidden}\n\n"
+        info_text += "📥 <b>Выберите качество:</b>"
+        
+        await save_session(key, url, choice_sizes, clip)
+        
+        await message.reply_text(
+            info_text,
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+        if clip is None:
+            choices = [button.callback_data.partition(":")[0] for row in keyboard for button in row]
+            await start_prefetch(message.from_user.id, url, video_info, choices)
+        
+    except Exception as e:
+        record_error("info", e)
+        log(f"❌ Информация о видео {url}: {e}")
+        await message.reply_text(
+            f"❌ Ошибка при получении информации о видео:\n{str(e)}\n\n"
+            "Попробуйте отправить ссылку еще раз."
+        )
+
+
+def session_key(url: str) -> str:
+    """Ключ сессии: ID видео или короткий хэш ссылки, если ID не найден."""
+    return extract_video_id(url) or hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def button_data(choice: str, key: str) -> str:
+    """callback_data кнопки: выбор и ключ сессии (не длиннее 64 байт)."""
+    return f"{choice}:{key}"
+
+
+async def batch_handler(update: Update, urls: list[str]):
+    """Собирает список видео из нескольких ссылок или плейлиста и предлагает формат."""
+    status = await update.message.reply_text("⏳ Получаю список видео...")
+    
+    items = []
+    seen = set()
+    try:
+        for url in urls:
+            if len(items) >= BATCH_MAX_ITEMS:
+                break
+            if is_playlist_url(url):
+                # Плоское извлечение: только ID и названия, без форматов каждого видео
+                entries = await extraction_backend.run(resolve_playlist, url, BATCH_MAX_ITEMS - len(items))
+            else:
+                video_id = extract_video_id(url)
+                entries = [{'id': video_id, 'url': url, 'title': video_id or url, 'duration': 0}]
+            for entry in entries:
+                if entry['id'] in seen:
+                    continue
+                seen.add(entry['id'])
+                items.append({'id': entry['id'], 'url': entry['url'], 'title': entry['title']})
+    except Exception as e:
+        await status.edit_text(f"❌ Ошибка при получении списка видео:\n{str(e)}")
+        return
+    
+    items = items[:BATCH_MAX_ITEMS]
+    if not items:
+        await status.edit_text("❌ В ссылках не найдено доступных видео.")
+        return
+    
+    key = "b" + hashlib.sha1("\n".join(urls).encode()).hexdigest()[:15]
+    await asyncio.to_thread(shared_store.set, f"session:{key}", {'items': items}, SESSION_TTL)
+    
+    titles = "\n".join(f"{i}. {html.escape(item['title'])}" for i, item in enumerate(items[:10], start=1))
+    if len(items) > 10:
+        titles += f"\n... и еще {len(items) - 10}"
+    text = f"📦 <b>Найдено видео: {len(items)}</b>\n\n{titles}\n\n"
+    if len(items) == BATCH_MAX_ITEMS:
+        text += f"⚠️ За один раз можно скачать не больше {BATCH_MAX_ITEMS} видео\n\n"
+    text += "📥 <b>Выберите формат:</b>"
+    
+    keyboard = [
+        [InlineKeyboardButton(f"📹 Видео ({BATCH_QUALITY}p)", callback_data=button_data("batch_video", key))],
+        [InlineKeyboardButton("🎵 Аудио (M4A)", callback_data=button_data("batch_audio", key))],
+    ]
+    await status.edit_text(text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def save_session(key: str, url: str, choice_sizes: dict, clip: tuple[int, int] | None = None):
+    """
+    Сохраняет сессию сообщения с кнопками.
+
+    Запись компактная: ссылка, оценки размеров и отрезок для фрагмента.
+    Полная информация о видео остается в metadata_cache.
+    """
+    session = {'url': url, 'choice_sizes': choice_sizes}
+    if clip is not None:
+        session['clip'] = list(clip)
+    await asyncio.to_thread(shared_store.set, f"session:{key}", session, SESSION_TTL)
+
+
+async def load_session(key: str) -> dict:
+    """
+    Сессия по ключу из callback_data.
+
+    Returns:
+        dict: {'url': ..., 'choice_sizes': ..., 'clip': ...} или пустой словарь
+    """
+    session = await asyncio.to_thread(shared_store.get, f"session:{key}")
+    if session:
+        return session
+    # Сессия истекла или потеряна при перезапуске - ссылка восстанавливается по ID видео
+    if re.fullmatch(r'[a-zA-Z0-9_-]{11}', key):
+        return {'url': f"https://www.youtube.com/watch?v={key}"}
+    return {}
+
+
+async def claim_fetch(query, video_id: str, mode: str, quality_display: str = ""):
+    """
+    Захватывает скачивание видео в режиме mode.
+
+    Если это видео в этом режиме уже скачивает другая задача (в этом или в
+    другом экземпляре бота), ждет ее и отправляет готовый файл из кэша.
+
+    Пока задача держит блокировку, она продлевается каждую треть
+    FETCH_LOCK_TTL; после падения экземпляра истекает за FETCH_LOCK_TTL.
+
+    Returns:
+        DistributedLock: Захваченная блокировка (снять через release_fetch())
+        или None, если файл уже отправлен из кэша
+    """
+    lock = shared_store.lock(f"fetch:{video_id}:{mode}", ttl=FETCH_LOCK_TTL)
+    if not video_id:
+        return lock  # Без ID объединять нечего, release() ничего не сделает
+    waiting = False
+    while not await asyncio.to_thread(lock.try_acquire):
+        if not waiting:
+            waiting = True
+            try:
+                await query.edit_message_text("⏳ Это видео уже скачивается по другому запросу, жду...")
+            except BadRequest:
+                pass
+        await asyncio.sleep(FETCH_LOCK_POLL)
+        if await send_from_cache(query, video_id, mode, quality_display, count=False):
+            return None
+    # Файл мог появиться в кэше, пока мы ждали
+    if waiting and await send_from_cache(query, video_id, mode, quality_display, count=False):
+        await asyncio.to_thread(lock.release)
+        return None
+    lock.keeper = asyncio.create_task(lock.keep())
+    return lock
+
+
+async def release_fetch(lock):
+    """Снимает блокировку скачивания, захваченную claim_fetch()."""
+    if lock.keeper is not None:
+        lock.keeper.cancel()
+    await asyncio.to_thread(lock.release)
+
+
+async def send_from_cache(query, video_id: str, mode: str, quality_display: str = "",
+                          count: bool = True) -> bool:
+    """
+    Отправляет файл по сохраненному file_id, если он есть в кэше.
+
+    count=False - не учитывать обращение в метриках кэша (повторные проверки
+    во время ожидания чужого скачивания).
+
+    Returns:
+        bool: True, если файл отправлен из кэша
+    """
+    cached = await asyncio.to_thread(file_id_cache.get, video_id, mode)
+    if count:
+        CACHE_REQUESTS.inc(cache="file_id", result="hit" if cached else "miss")
+    if not cached:
+        return False
+
+    file_size_mb = cached['filesize'] / (1024 * 1024)
+    duration_min = cached['duration'] // 60
+    duration_sec = cached['duration'] % 60
+    icon = "🎵" if mode.startswith("audio") else "📹"
+    caption = (
+        f"{icon} <b>{cached['title']}</b>\n\n"
+        f"📊 Размер: {file_size_mb:.2f} MB\n"
+        f"⏱ Длительность: {duration_min}:{duration_sec:02d}"
+    )
+    if quality_display:
+        caption += f"\n🎬 Качество: {quality_display}"
+
+    try:
+        if cached['kind'] == "audio":
+            await query.message.reply_audio(
+                audio=cached['file_id'],
+                caption=caption,
+                parse_mode="HTML",
+                title=cached['title']
+            )
+        elif cached['kind'] == "document":
+            await query.message.reply_document(
+                document=cached['file_id'],
+                caption=caption,
+                parse_mode="HTML"
+            )
+        else:
+            await query.message.reply_video(
+                video=cached['file_id'],
+                caption=caption,
+                parse_mode="HTML"
+            )
+    except BadRequest as e:
+        # file_id стал недействительным - удаляем запись и скачиваем заново
+        log(f"⚠️ file_id для {video_id}/{mode} недействителен: {e}")
+        await asyncio.to_thread(file_id_cache.invalidate, video_id, mode)
+        return False
+
+    JOBS_TOTAL.inc(result="cached")
+    log(f"✅ {video_id}/{mode} отправлено из кэша")
+    return True
+
+
+async def remember_file_id(message, video_id: str, mode: str, download_info: dict):
+    """Сохраняет file_id отправленного файла в кэш."""
+    media = message.audio or message.video or message.document
+    if not media:
+        return
+    # Telegram может сохранить файл как документ (например, opus) - запоминаем реальный тип
+    kind = "audio" if message.audio else "video" if message.video else "document"
+    await asyncio.to_thread(
+        file_id_cache.put,
+        video_id,
+        mode,
+        media.file_id,
+        kind,
+        title=download_info.get('title', ''),
+        duration=int(download_info.get('duration') or 0),
+        filesize=int(media.file_size or download_info.get('filesize') or 0),
+    )
+
+
+async def send_parts(query, parts: list[str], caption: str, title: str, audio: bool = False):
+    """Отправляет файл, разрезанный на части, по одной части в сообщении."""
+    for number, part in enumerate(parts, start=1):
+        part_caption = f"{caption}\n🧩 Часть {number} из {len(parts)}"
+        if audio:
+            await query.message.reply_audio(
+                audio=upload_source(part),
+                caption=part_caption,
+                parse_mode="HTML",
+                title=f"{title} ({number}/{len(parts)})"
+            )
+        else:
+            await query.message.reply_video(
+                video=upload_source(part),
+                caption=part_caption,
+                parse_mode="HTML",
+                supports_streaming=True
+            )
+
+
+async def fetch_video_info(url: str) -> dict:
+    """get_video_info в бэкенде извлечения с замером длительности."""
+    with STAGE_SECONDS.time(stage="info"):
+        return await retry_call("extraction", lambda: extraction_backend.run(get_video_info, url))
+
+
+# Первый запрос после запуска уже обработан
+first_request_done = False
+
+
+def note_first_request(seconds: float):
+    """Сообщает длительность получения информации для первого запроса после запуска."""
+    global first_request_done
+    if first_request_done:
+        return
+    first_request_done = True
+    BOOT_SECONDS.set(seconds, phase="first_request")
+    log(f"⏱ Первый запрос: информация о видео получена за {seconds:.2f}с")
+
+
+def record_download(download_info: dict):
+    """Учитывает завершенное скачивание: скорость, длительность этапов и байты."""
+    # Замер скорости для следующих оценок времени
+    throughput_meter.record(download_info['filesize'], download_info.get('elapsed', 0))
+    timings = download_info.get('timings') or {}
+    for stage, seconds in timings.items():
+        if seconds:
+            STAGE_SECONDS.observe(seconds, stage=stage)
+    BYTES_TOTAL.inc(download_info.get('downloaded_bytes') or download_info['filesize'], direction="in")
+    stages = ", ".join(f"{stage} {seconds:.1f}с" for stage, seconds in timings.items() if seconds)
+    log(f"⬇️ Скачано {download_info.get('filename', '')} ({download_info['filesize']} байт): {stages}")
+
+
+def record_sent(download_info: dict):
+    """Учитывает успешно отправленный файл."""
+    BYTES_TOTAL.inc(download_info.get('filesize') or 0, direction="out")
+    JOBS_TOTAL.inc(result="sent")
+    log(f"✅ Отправлено: {download_info.get('title', '')}")
+
+
+def retry_markup(data: str) -> InlineKeyboardMarkup:
+    """Кнопка, повторяющая нажатие с теми же callback_data."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Повторить отправку", callback_data=data)]])
+
+
+def record_failure(e: Exception, stage: str | None = None):
+    """Учитывает ошибку задачи; этап по умолчанию - скачивание (StageError) или отправка."""
+    stage = stage or ("download" if isinstance(e, StageError) else "upload")
+    record_error(stage, e)
+    JOBS_TOTAL.inc(result="failed")
+    log(f"❌ Ошибка ({stage}): {e}")
+
+
+async def run_scheduled(query, status_text: str, func):
+    """
+    Выполняет func() через очередь загрузок.
+
+    Пока задача ждет в очереди, в сообщении показывается ее позиция.
+
+    Raises:
+        QueueFullError: Если очередь переполнена
+    """
+    queued = False
+
+    async def on_position(position: int):
+        nonlocal queued
+        try:
+            if position:
+                queued = True
+                await query.edit_message_text(f"{status_text}\n\n🕒 Позиция в очереди: {position}")
+            elif queued:
+                await query.edit_message_text(status_text)
+        except BadRequest:
+            pass  # Сообщение не изменилось или уже удалено
+
+    job = download_scheduler.submit(query.from_user.id, func, on_position=on_position)
+    return await job.wait()
+
+
+async def run_download_job(query, status_text: str, space: JobSpace, *args, **kwargs) -> tuple[str, dict]:
+    """
+    Выполняет download_video через очередь загрузок в папке space, показывая
+    прогресс в сообщении.
+
+    Место на диске резервируется, когда задача дошла до начала очереди;
+    освободить его (space.release()) - забота вызывающего.
+
+    Raises:
+        QueueFullError: Если очередь переполнена
+        QuotaExceededError: Если место на диске не освободилось
+    """
+    async def on_wait():
+        try:
+            await query.edit_message_text(f"{status_text}\n\n💾 Жду свободного места на диске...")
+        except BadRequest:
+            pass
+
+    async def on_retry(attempt: int, delay: float, e: Exception):
+        try:
+            await query.edit_message_text(
+                f"{status_text}\n\n🔁 YouTube ограничивает скачивание, повтор через {delay:.0f}с..."
+            )
+        except BadRequest:
+            pass
+
+    async def job():
+        workdir = await space.acquire(on_wait)
+        reporter = ProgressReporter(query.edit_message_text, status_text)
+        hook = extraction_backend.progress_hook(reporter)
+        limiter = bandwidth_budget.acquire()
+        reporter.start()
+        try:
+            # Повтор скачивает в ту же папку - yt-dlp продолжает с уже скачанного
+            return await retry_call("extraction", lambda: extraction_backend.run(
+                download_video, *args, workdir=workdir, progress_hook=hook, rate_limiter=limiter, **kwargs
+            ), on_retry=on_retry)
+        finally:
+            bandwidth_budget.release(limiter)
+            await reporter.stop()
+    
+    file_path, download_info = await run_scheduled(query, status_text, job)
+    record_download(download_info)
+    return file_path, download_info
+
+
+def choice_mode(choice: str) -> str | None:
+    """Режим (ключ кэша file_id и оценки размера) нажатия на кнопку одного видео; None - не скачивание."""
+    if choice.startswith("quality_"):
+        return choice.removeprefix("quality_")
+    if choice == "format_audio":
+        return "audio"
+    if choice == "format_audio_mp3" and ALLOW_MP3:
+        return "audio_mp3"
+    return None
+
+
+async def start_prefetch(user_id: int, url: str, video_info: dict, choices: list[str]):
+    """
+    Начинает скачивать самый вероятный из choices выбор, пока пользователь
+    смотрит на кнопки (если предзагрузка включена и есть свободный исполнитель).
+    """
+    if not prefetcher.enabled or not download_scheduler.idle:
+        return
+    try:
+        choices = [choice for choice in choices if choice_mode(choice)]
+        choice, confidence = await asyncio.to_thread(prefetcher.choices.predict, user_id, choices)
+        if choice is None or confidence < prefetcher.min_confidence:
+            return
+        mode = choice_mode(choice)
+        video_id = extract_video_id(url)
+        if video_id and await asyncio.to_thread(file_id_cache.get, video_id, mode):
+            return  # Файл отправится из кэша
+        
+        if mode.startswith("audio"):
+            kwargs = {'audio_only': True, 'audio_format': "mp3" if mode == "audio_mp3" else "native"}
+        else:
+            kwargs = {'quality': mode, 'audio_only': False}
+        raw_info = video_info.get('raw_info')
+        if raw_info and raw_info.get('id') != video_id:
+            raw_info = None
+        # Прогресс показывается, только если нажатие придет до конца скачивания;
+        # до нажатия процесс пула его не передает (gate)
+        reporter = ProgressReporter(None, "")
+        gate = extraction_backend.shared_value(0)
+        hook = extraction_backend.progress_hook(reporter, gate)
+        
+        async def download(workdir, cancel):
+            limiter = bandwidth_budget.acquire()
+            try:
+                result = await extraction_backend.run(
+                    download_video, url, info=raw_info, workdir=workdir, progress_hook=hook,
+                    rate_limiter=limiter, cancel=cancel, **kwargs
+                )
+            finally:
+                bandwidth_budget.release(limiter)
+            record_download(result[1])
+            return result
+        
+        prefetcher.start(
+            video_id or url, user_id, choice, video_info.get('choice_sizes', {}).get(mode, 0), download,
+            reporter, gate
+        )
+    except Exception as e:
+        log(f"⚠️ Предзагрузка {url} не запущена: {e}")
+
+
+async def adopt_prefetch(query, status_text: str, prefetch: Prefetch) -> dict | None:
+    """
+    Дожидается предзагрузки нажатого выбора (показывая прогресс).
+
+    Returns:
+        dict: {'space', 'file_path', 'info'}, как у finished_downloads.take(),
+        или None, если предзагрузка не удалась (ее место уже освобождено)
+    """
+    reporter = prefetch.reporter
+    if reporter is not None and not prefetch.job.future.done():
+        reporter.edit = query.edit_message_text
+        reporter.header = f"{status_text}\n\n⚡ Скачивание началось заранее"
+        if prefetch.progress_gate is not None:
+            prefetch.progress_gate.value = 1
+        reporter.start()
+    try:
+        file_path, download_info = await prefetch.result()
+    except Exception as e:
+        log(f"⚡ Предзагрузка не удалась, скачиваю заново: {e}")
+        prefetch.space.release()
+        return None
+    finally:
+        if reporter is not None:
+            await reporter.stop()
+    return {'space': prefetch.space, 'file_path': file_path, 'info': download_info}
+
+
+async def try_stream_upload(query, status_text: str, url: str, video_id: str, mode: str,
+                            quality: str = "best", audio_only: bool = False,
+                            info: dict | None = None, quality_display: str = "",
+                            audio_format: str = "native", estimated_size: int = 0) -> tuple | None:
+    """
+    Отправляет файл потоково, без сохранения на диск (если STREAM_UPLOAD=1).
+
+    Файл больше MAX_FILE_SIZE (по оценке или по выбранным форматам) потоком
+    не отправляется: его нужно скачать и уменьшить (fitter.py).
+
+    Returns:
+        tuple | None: (сообщение, информация о файле), если файл отправлен;
+                      None - нужно скачать файл обычным способом
+
+    Raises:
+        QueueFullError: Если очередь переполнена
+    """
+    if not STREAM_UPLOAD or estimated_size > MAX_FILE_SIZE:
+        return None
+
+    async def job():
+        plan = await retry_call("extraction", lambda: extraction_backend.run(
+            resolve_stream, url, quality=quality, audio_only=audio_only, info=info,
+            audio_format=audio_format
+        ))
+        if plan['filesize'] > MAX_FILE_SIZE:
+            return plan, None
+        duration = int(plan['duration'])
+        icon = "🎵" if audio_only else "📹"
+        caption = (
+            f"{icon} <b>{plan['title']}</b>\n\n"
+            f"⏱ Длительность: {duration // 60}:{duration % 60:02d}"
+        )
+        if quality_display:
+            caption += f"\n🎬 Качество: {quality_display}"
+        with STAGE_SECONDS.time(stage="stream"):
+            message = await stream_upload(
+                query.get_bot(), query.message.chat_id, plan, caption, MAX_FILE_SIZE, audio=audio_only
+            )
+        return plan, message
+
+    try:
+        plan, message = await run_scheduled(query, status_text, job)
+    except QueueFullError:
+        raise
+    except Exception as e:
+        record_error("stream", e)
+        log(f"⚠️ Потоковая отправка не удалась, скачиваю файл: {e}")
+        return None
+    if message is None:
+        log(f"⚠️ Потоковые форматы больше {MAX_FILE_SIZE_MB}MB, скачиваю файл с подбором размера")
+        return None
+
+    # Поток одновременно скачан и отправлен - размер берем из ответа Telegram
+    media = message.audio or message.video or message.document
+    size = (media.file_size if media else 0) or plan['filesize']
+    BYTES_TOTAL.inc(size, direction="in")
+    return message, dict(plan, filesize=size)
+
+
+async def finish_delivery(query, what: str, message, video_id: str, mode: str, download_info: dict):
+    """
+    Завершает отправку: кэш file_id (message - None для частей), метрики и
+    сообщение об успехе.
+
+    Файл уже у пользователя - ошибки здесь только логируются: повтор
+    отправки из-за них прислал бы файл второй раз.
+    """
+    record_sent(download_info)
+    try:
+        if message is not None:
+            await remember_file_id(message, video_id, mode, download_info)
+    except Exception as e:
+        log(f"⚠️ file_id для {video_id}/{mode} не сохранен: {e}")
+    try:
+        await query.edit_message_text(f"✅ {what.capitalize()} успешно скачано и отправлено!")
+    except Exception as e:
+        log(f"⚠️ {video_id}/{mode} отправлено, статус не обновлен: {e}")
+
+
+async def deliver_download(query, status_text: str, url: str, video_id: str, mode: str, kept: dict | None,
+                           estimated_size: int, info: dict | None = None, clip: tuple[int, int] | None = None,
+                           quality: str = "best", audio_only: bool = False, audio_format: str = "native",
+                           quality_display: str = ""):
+    """
+    Доставляет выбранный файл: потоком, из сохраненного скачивания (kept) или
+    скачав его заново, и сообщает результат в сообщении со статусом.
+
+    Если файл скачан, но не отправлен, он остается в finished_downloads для повтора.
+    """
+    what = "аудио" if audio_only else "видео"
+    try:
+        # Потоковая отправка без сохранения файла на диск
+        # (фрагмент режется yt-dlp и ffmpeg - только через файл)
+        streamed = None if kept or clip else await try_stream_upload(
+            query, status_text, url, video_id, mode, quality=quality, audio_only=audio_only,
+            info=info, quality_display=quality_display, audio_format=audio_format,
+            estimated_size=estimated_size
+        )
+    except QueueFullError as e:
+        await query.edit_message_text(f"❌ {e}")
+        return
+    if streamed:
+        message, sent_info = streamed
+        await finish_delivery(query, what, message, video_id, mode, sent_info)
+        return
+
+    # Место на диске и рабочая папка задачи - освобождаются при любом исходе
+    space = kept['space'] if kept else storage_manager.job_space(estimated_size)
+    download_info = None
+    message = None
+    try:
+        if kept:
+            file_path, download_info = kept['file_path'], kept['info']
+        else:
+            file_path, download_info = await run_download_job(
+                query, status_text, space, url, quality=quality, audio_only=audio_only, info=info,
+                audio_format=audio_format, clip=clip
+            )
+
+        # Форматируем размер файла
+        file_size_mb = download_info['filesize'] / (1024 * 1024)
+        duration_min = download_info['duration'] // 60
+        duration_sec = download_info['duration'] % 60
+
+        icon = "🎵" if audio_only else "📹"
+        caption = (
+            f"{icon} <b>{download_info['title']}</b>\n\n"
+            f"📊 Размер: {file_size_mb:.2f} MB\n"
+            f"⏱ Длительность: {duration_min}:{duration_sec:02d}"
+        )
+        if quality_display:
+            caption += f"\n🎬 Качество: {quality_display}"
+
+        with STAGE_SECONDS.time(stage="upload"):
+            if download_info.get('parts'):
+                # Файл больше лимита разрезан - части в кэш file_id не попадают
+                await send_parts(query, download_info['parts'], caption, download_info['title'], audio=audio_only)
+            elif audio_only:
+                message = await query.message.reply_audio(
+                    audio=upload_source(file_path),
+                    caption=caption,
+                    parse_mode="HTML",
+                    title=download_info['title']
+                )
+            else:
+                message = await query.message.reply_video(
+                    video=upload_source(file_path),
+                    caption=caption,
+                    parse_mode="HTML"
+                )
+
+    except (QueueFullError, QuotaExceededError) as e:
+        await query.edit_message_text(f"❌ {e}")
+        return
+
+    except Exception as e:
+        record_failure(e, "upload" if download_info is not None else "download")
+        error_msg = str(e)
+        if download_info is not None:
+            # Скачивание удалось - файл остается для повтора только отправки
+            finished_downloads.keep((video_id or url, mode), space, file_path, download_info)
+            space = None
+            await query.edit_message_text(
+                f"❌ Не удалось отправить {what}:\n{error_msg}\n\n"
+                "Файл сохранен - повтор отправит его без нового скачивания.",
+                reply_markup=retry_markup(query.data)
+            )
+        elif not audio_only and ("filesize" in error_msg.lower() or str(MAX_FILE_SIZE_MB) in error_msg):
+            await query.edit_message_text(
+                f"❌ Видео слишком большое (больше {MAX_FILE_SIZE_MB}MB) для качества {quality}.\n\n"
+                "Попробуйте выбрать более низкое качество или скачайте только аудио."
+            )
+        else:
+            hint = "Попробуйте еще раз." if audio_only else "Попробуйте еще раз или выберите другое качество."
+            await query.edit_message_text(f"❌ Ошибка при скачивании {what}:\n{error_msg}\n\n{hint}")
+        return
+    finally:
+        if space is not None:
+            space.release()
+
+    # Только ошибка самой отправки оставляет файл для повтора (выше)
+    await finish_delivery(query, what, message, video_id, mode, download_info)
+
+
+async def batch_download(query, items: list[dict], audio: bool):
+    """
+    Скачивает видео пакета параллельно и отправляет их медиагруппами.
+
+    Одновременно скачивается не больше BATCH_PARALLEL видео и не больше,
+    чем разрешено одному пользователю (PER_USER_JOBS), через общую очередь
+    загрузок. Группы отправляются по порядку; пока отправляется
+    одна группа, уже скачивается следующая.
+    """
+    mode = "audio" if audio else BATCH_QUALITY
+    total = len(items)
+    header = f"📦 Скачиваю {'аудио' if audio else 'видео'}: {total}"
+    await query.edit_message_text(header)
+    
+    state = {'total': total, 'done': 0, 'active': 0, 'failed': 0}
+    reporter = ProgressReporter(query.edit_message_text, header, render=render_batch)
+    reporter.update(dict(state))
+    reporter.start()
+    semaphore = asyncio.Semaphore(BATCH_PARALLEL)
+    
+    batch_trace = current_trace()
+    
+    async def fetch(item: dict) -> dict | None:
+        # Каждое видео пакета - отдельная задача со своим ID трассировки
+        new_trace()
+        log(f"📦 Пакет {batch_trace}: {item['url']}")
+        cached = await asyncio.to_thread(file_id_cache.get, item['id'], mode)
+        CACHE_REQUESTS.inc(cache="file_id", result="hit" if cached else "miss")
+        if cached:
+            JOBS_TOTAL.inc(result="cached")
+            state['done'] += 1
+            reporter.update(dict(state))
+            return {'item': item, 'media': cached['file_id'], 'kind': cached['kind'], 'info': cached}
+        async with semaphore:
+            state['active'] += 1
+            reporter.update(dict(state))
+            # Размер видео пакета заранее неизвестен - резерв по умолчанию
+            space = storage_manager.job_space()
+            # Флаг отмены: прерывает уже идущее скачивание, если пакет отменен
+            cancel = extraction_backend.shared_value(0)
+            
+            async def download():
+                workdir = await space.acquire()
+                limiter = bandwidth_budget.acquire()
+                try:
+                    return await retry_call("extraction", lambda: extraction_backend.run(
+                        download_video, item['url'], quality=BATCH_QUALITY, audio_only=audio, workdir=workdir,
+                        rate_limiter=limiter, cancel=cancel
+                    ))
+                finally:
+                    bandwidth_budget.release(limiter)
+            
+            job = None
+            try:
+                job = download_scheduler.submit(
+                    query.from_user.id, download, limit=min(BATCH_PARALLEL, download_scheduler.per_user)
+                )
+                file_path, download_info = await job.wait()
+            except asyncio.CancelledError:
+                if job is None or download_scheduler.cancel(job):
+                    space.release()
+                else:
+                    # Уже выполняется: папку и резерв освобождаем, только когда
+                    # скачивание прервется, - иначе yt-dlp пишет в удаленную папку
+                    cancel.value = 1
+                    job.future.add_done_callback(lambda future: release_finished(space, future))
+                raise
+            except Exception as e:
+                record_failure(e, "download")
+                space.release()
+                state['failed'] += 1
+                return None
+            finally:
+                state['active'] -= 1
+                reporter.update(dict(state))
+        record_download(download_info)
+        state['done'] += 1
+        reporter.update(dict(state))
+        return {'item': item, 'media': upload_source(file_path), 'kind': "audio" if audio else "video",
+                'info': download_info, 'space': space}
+    
+    groups = [items[i:i + MEDIA_GROUP_SIZE] for i in range(0, total, MEDIA_GROUP_SIZE)]
+    sent = 0
+    started: list[list[asyncio.Task]] = []
+    try:
+        started.append([asyncio.create_task(fetch(item)) for item in groups[0]])
+        for index in range(len(groups)):
+            # Следующая группа скачивается, пока отправляется текущая
+            if index + 1 < len(groups):
+                started.append([asyncio.create_task(fetch(item)) for item in groups[index + 1]])
+            results = [r for r in await asyncio.gather(*started[index]) if r is not None]
+            try:
+                with STAGE_SECONDS.time(stage="upload"):
+                    sent += await send_batch_group(query, results, mode)
+            except Exception as e:
+                record_failure(e, "upload")
+                state['failed'] += len(results)
+            finally:
+                for result in results:
+                    if result.get('space'):
+                        result['space'].release()
+    finally:
+        await reporter.stop()
+        for tasks in started:
+            for task in tasks:
+                task.cancel()
+        # Отмененные задачи удаляют свои папки сами; здесь - готовые, но не отправленные результаты
+        for tasks in started:
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is None and task.result():
+                    if task.result().get('space'):
+                        task.result()['space'].release()
+    
+    text = f"✅ Отправлено {sent} из {total}"
+    if state['failed']:
+        text += f"\n❌ Не удалось скачать или отправить: {state['failed']}"
+    await query.edit_message_text(text)
+
+
+def release_finished(space: JobSpace, future: asyncio.Future):
+    """Освобождает место отмененной задачи, когда ее скачивание завершилось."""
+    if not future.cancelled():
+        future.exception()  # Ошибка отмены ожидаема
+    space.release()
+
+
+async def send_batch_group(query, results: list[dict], mode: str) -> int:
+    """
+    Отправляет результаты пакета медиагруппой.
+
+    Аудио, видео и документы нельзя смешивать в одной группе, поэтому
+    каждый тип отправляется своей группой (один файл - обычным сообщением).
+    Части разрезанного файла отправляются как отдельные элементы группы.
+
+    Returns:
+        int: Количество отправленных видео
+    """
+    expanded = []
+    for r in results:
+        parts = r['info'].get('parts')
+        if not parts:
+            expanded.append(r)
+            continue
+        for number, part in enumerate(parts, start=1):
+            info = dict(r['info'], title=f"{r['info']['title']} ({number}/{len(parts)})")
+            expanded.append(dict(r, media=upload_source(part), info=info, part=True))
+    
+    for kind, media_class in (("video", InputMediaVideo), ("audio", InputMediaAudio),
+                              ("document", InputMediaDocument)):
+        of_kind = [r for r in expanded if r['kind'] == kind]
+        for start in range(0, len(of_kind), MEDIA_GROUP_SIZE):
+            batch = of_kind[start:start + MEDIA_GROUP_SIZE]
+            media = []
+            for r in batch:
+                options = {'caption': f"<b>{html.escape(r['info']['title'])}</b>", 'parse_mode': "HTML"}
+                if kind == "audio":
+                    options['title'] = r['info']['title']
+                elif kind == "video":
+                    options['supports_streaming'] = True
+                media.append((r['media'], options))
+            if len(batch) == 1:
+                # Медиагруппа - минимум из двух файлов
+                send = {"video": query.message.reply_video, "audio": query.message.reply_audio,
+                        "document": query.message.reply_document}[kind]
+                messages = [await send(media[0][0], **media[0][1])]
+            else:
+                messages = await query.message.reply_media_group(
+                    media=[media_class(file, **options) for file, options in media]
+                )
+            for r, message in zip(batch, messages):
+                # Запоминаем file_id только скачанных целиком файлов (не из кэша и не частей)
+                if r.get('space') and not r.get('part'):
+                    await remember_file_id(message, r['item']['id'], mode, r['info'])
+    for r in results:
+        if r.get('space'):
+            record_sent(r['info'])
+    return len(results)
+
+
+def publish_instance_stats():
+    """Публикует состояние очереди этого экземпляра в общем хранилище."""
+    shared_store.set(f"instance:{INSTANCE_ID}", download_scheduler.stats(), ttl=HEARTBEAT_INTERVAL * 3)
+
+
+def cluster_stats() -> list[dict]:
+    """Состояние очередей всех живых экземпляров бота."""
+    instances = []
+    for key in shared_store.keys("instance:"):
+        stats = shared_store.get(key)
+        if stats is not None:
+            instances.append(stats)
+    return instances
+
+
+async def heartbeat():
+    """Периодически обновляет запись экземпляра; после падения она истекает по TTL."""
+    while True:
+        try:
+            await asyncio.to_thread(publish_instance_stats)
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить состояние в общем хранилище: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+def purge_store() -> tuple[int, int]:
+    """Удаляет просроченные записи хранилища и записи кэша file_id сверх лимита."""
+    return shared_store.purge_expired(), file_id_cache.evict()
+
+
+async def store_maintenance():
+    """Периодическая очистка хранилища: просроченные записи иначе удаляются только при чтении."""
+    while True:
+        await asyncio.sleep(STORE_PURGE_INTERVAL)
+        try:
+            expired, evicted = await asyncio.to_thread(purge_store)
+            if expired or evicted:
+                print(f"🧹 Хранилище: удалено просроченных записей {expired}, лишних file_id {evicted}")
+        except Exception as e:
+            print(f"⚠️ Ошибка очистки хранилища: {e}")
+
+
+async def uncache_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /uncache <ссылка> [режим] – сбрасывает кэш file_id для видео."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Команда доступна только администраторам.")
+        return
+
+    if not context.args:
+        await update.message.reply_text("Использование: /uncache <ссылка> [качество|audio|audio_mp3]")
+        return
+
+    video_id = extract_video_id(context.args[0])
+    if not video_id:
+        await update.message.reply_text("❌ Не удалось определить ID видео.")
+        return
+
+    mode = context.args[1] if len(context.args) > 1 else None
+    removed = await asyncio.to_thread(file_id_cache.invalidate, video_id, mode)
+    await asyncio.to_thread(metadata_cache.invalidate, video_id)
+    await update.message.reply_text(f"🗑 Удалено записей из кэша: {removed}")
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /stats – статистика кэшей."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Команда доступна только администраторам.")
+        return
+
+    meta = metadata_cache.stats()
+    disk = storage_manager.stats()
+    file_ids = await asyncio.to_thread(len, file_id_cache)
+    text = (
+        "📊 <b>Статистика кэшей</b>\n\n"
+        f"<b>Информация о видео:</b>\n"
+        f"• Записей: {meta['size']}\n"
+        f"• Попаданий: {meta['hits']}\n"
+        f"• Промахов: {meta['misses']}\n"
+        f"• Объединено запросов: {meta['coalesced']}\n"
+        f"• Доля попаданий: {meta['hit_rate']:.0%}\n\n"
+        f"<b>file_id:</b>\n"
+        f"• Записей: {file_ids}\n\n"
+        f"<b>Очередь загрузок:</b>\n"
+        f"• Выполняется: {download_scheduler.active} из {download_scheduler.workers}\n"
+        f"• В очереди: {download_scheduler.queued}\n\n"
+        f"<b>Диск:</b>\n"
+        f"• Занято в квоте: {disk['committed'] / (1024 * 1024):.0f} из {disk['quota'] / (1024 * 1024):.0f} MB\n"
+        f"• Ждут места: {disk['waiting']}\n"
+        f"• Файлов ждут повтора отправки: {len(finished_downloads)}"
+    )
+    prefetch = prefetcher.stats()
+    if prefetch['enabled']:
+        text += (
+            f"\n\n<b>Предзагрузка:</b>\n"
+            f"• Запущено: {prefetch['started']}, ждут нажатия: {prefetch['active']}\n"
+            f"• Попаданий: {prefetch['hit']}, промахов: {prefetch['miss']}, истекло: {prefetch['expired']}\n"
+            f"• Уступили место: {prefetch['preempted']}\n"
+            f"• Доля попаданий: {prefetch['hit_rate']:.0%}"
+        )
+    opened = {target: b.stats() for target, b in BREAKERS.items() if b.state != "closed"}
+    if opened:
+        text += "\n\n<b>Отключены после ошибок:</b>\n" + "\n".join(
+            f"• {target}: еще {stats['retry_in']:.0f}с" for target, stats in opened.items()
+        )
+    if store_is_shared:
+        instances = await asyncio.to_thread(cluster_stats)
+        text += (
+            f"\n\n<b>Все экземпляры ({len(instances)}):</b>\n"
+            f"• Выполняется: {sum(i['active'] for i in instances)}"
+            f" из {sum(i['workers'] for i in instances)}\n"
+            f"• В очереди: {sum(i['queued'] for i in instances)}"
+        )
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик нажатий на inline-кнопки."""
+    new_trace()
+    query = update.callback_query
+    await query.answer()
+    
+    # callback_data: "<выбор>:<ключ сессии>"
+    choice, _, key = query.data.partition(":")
+    session = await load_session(key) if key else {}
+    
+    if choice == "clip":
+        if session.get('url'):
+            prefetcher.cancel(extract_video_id(session['url']) or session['url'])
+        # Отрезок придет следующим сообщением (см. url_handler)
+        await asyncio.to_thread(shared_store.set, f"clip_wait:{query.from_user.id}", key, CLIP_WAIT_TTL)
+        await query.message.reply_text(
+            "✂️ Отправьте начало и конец фрагмента, например: 1:20-2:10\n"
+            "Скачается только этот отрезок."
+        )
+        return
+    
+    if choice in ("batch_video", "batch_audio"):
+        if not session.get("items"):
+            await query.edit_message_text("❌ Список видео не найден. Отправьте ссылки еще раз.")
+            return
+        try:
+            await batch_download(query, session["items"], audio=choice == "batch_audio")
+        except QueueFullError as e:
+            await query.edit_message_text(f"❌ {e}")
+        return
+    
+    url = session.get("url")
+    
+    if not url:
+        await query.edit_message_text(
+            "❌ Ссылка не найдена. Пожалуйста, отправьте ссылку на YouTube видео."
+        )
+        return
+    
+    video_id = extract_video_id(url)
+    
+    # Результат извлечения из url_handler - чтобы не извлекать видео повторно
+    video_info = await metadata_cache.lookup(video_id or url) or {}
+    raw_info = video_info.get('raw_info')
+    choice_sizes = video_info.get('choice_sizes') or session.get('choice_sizes', {})
+    if raw_info and raw_info.get('id') != video_id:
+        raw_info = None
+    
+    # Фрагмент: скачивается только отрезок, в кэше он хранится отдельно от целого видео
+    clip = tuple(session['clip']) if session.get('clip') else None
+    clip_tag = ""
+    if clip:
+        clip_tag = f"@{clip[0]}-{clip[1]}"
+        choice_sizes = session.get('choice_sizes', {})
+        prefetcher.cancel(video_id or url)
+        prefetch = None
+    else:
+        # Статистика выборов для предзагрузки; совпавшая предзагрузка достается этому нажатию
+        if choice_mode(choice):
+            await asyncio.to_thread(prefetcher.record_pick, query.from_user.id, choice)
+        prefetch = prefetcher.claim(video_id or url, choice)
+    
+    # Пока задача держит блокировку, это видео в этом режиме больше никто не скачивает
+    lock = None
+    try:
+        if choice.startswith("quality_"):
+            quality = choice.replace("quality_", "")
+            audio_format = "native"
+            audio_only = False
+            mode = quality + clip_tag
+            # Размер выбранного качества - по форматам, которые выберет yt-dlp
+            estimated_size = choice_sizes.get(quality, 0)
+            quality_display = quality.upper() if quality in ["best", "worst"] else f"{quality}p"
+            what = "видео"
+            status_text = f"⏳ Начинаю скачивание видео в качестве {quality_display}..."
+        elif choice in ("format_audio", "format_audio_mp3"):
+            quality = "best"
+            # MP3 - только по явному выбору, иначе исходная дорожка без перекодирования
+            audio_format = "mp3" if choice == "format_audio_mp3" and ALLOW_MP3 else "native"
+            audio_only = True
+            audio_mode = "audio_mp3" if audio_format == "mp3" else "audio"
+            mode = audio_mode + clip_tag
+            # Размер аудиодорожки, которую выберет yt-dlp
+            estimated_size = choice_sizes.get(audio_mode, 0) or 5 * 1024 * 1024
+            quality_display = ""
+            what = "аудио"
+            status_text = "⏳ Начинаю скачивание аудио..."
+        else:
+            return
+
+        # Если файл уже отправлялся в этом режиме - отправляем по file_id
+        if await send_from_cache(query, video_id, mode, quality_display):
+            await query.edit_message_text(f"✅ {what.capitalize()} отправлено!")
+            return
+        lock = await claim_fetch(query, video_id, mode, quality_display)
+        if lock is None:
+            await query.edit_message_text(f"✅ {what.capitalize()} отправлено!")
+            return
+
+        download_time = estimate_download_time(int(estimated_size)) if estimated_size > 0 else 30
+        status_text += f"\n⏱ Примерное время: ~{format_time(download_time)}"
+        await query.edit_message_text(status_text)
+
+        # Файл, скачанный прошлой попыткой, которую не удалось отправить, или предзагрузкой
+        kept = finished_downloads.take((video_id or url, mode))
+        if not kept and prefetch is not None:
+            kept, prefetch = await adopt_prefetch(query, status_text, prefetch), None
+        await deliver_download(
+            query, status_text, url, video_id, mode, kept, estimated_size, info=raw_info, clip=clip,
+            quality=quality, audio_only=audio_only, audio_format=audio_format,
+            quality_display=quality_display
+        )
+
+    finally:
+        if prefetch is not None:
+            prefetcher.drop(prefetch)
+        if lock is not None:
+            await release_fetch(lock)
+
+
+def build_http_server(application: Application) -> HttpServer:
+    """HTTP-сервер бота: вебхук Telegram и проверки здоровья."""
+    server = HttpServer()
+
+    async def home(request):
+        return Response(200, "Bot is alive!")
+
+    async def health(request):
+        # Процесс жив и event loop отвечает
+        return Response.json({'status': 'ok'})
+
+    async def ready(request):
+        # Бот запущен и получает обновления
+        if BOT_MODE == "webhook":
+            is_ready = application.running
+        else:
+            is_ready = application.running and application.updater.running
+        return Response.json({'ready': is_ready, 'mode': BOT_MODE}, 200 if is_ready else 503)
+
+    async def metrics(request):
+        return Response(200, render_metrics(), "text/plain; version=0.0.4; charset=utf-8")
+
+    async def webhook(request):
+        if not WEBHOOK_SECRET or request.headers.get('x-telegram-bot-api-secret-token') != WEBHOOK_SECRET:
+            return Response(403, "forbidden")
+        try:
+            update = Update.de_json(request.json(), application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"⚠️ Некорректное обновление: {e}")
+            return Response(400, "bad update")
+        if update is None:
+            return Response(400, "bad update")
+        await application.update_queue.put(update)
+        return Response(200, "ok")
+
+    server.add_route("GET", "/", home)
+    server.add_route("GET", "/health", health)
+    server.add_route("GET", "/ready", ready)
+    server.add_route("GET", "/metrics", metrics)
+    if BOT_MODE == "webhook":
+        server.add_route("POST", WEBHOOK_PATH, webhook)
+    return server
+
+
+async def finish_warm_up(warmup: asyncio.Task):
+    """Ждет прогрева yt-dlp не дольше WARMUP_TIMEOUT; ошибка прогрева не мешает запуску."""
+    try:
+        seconds = await asyncio.wait_for(asyncio.shield(warmup), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Прогрев yt-dlp дольше {WARMUP_TIMEOUT:.0f}с - продолжается в фоне")
+    except Exception as e:
+        print(f"⚠️ Прогрев yt-dlp не удался: {e}")
+    else:
+        BOOT_SECONDS.set(seconds, phase="warmup")
+        print(f"🔥 yt-dlp прогрет за {seconds:.2f}с ({extraction_backend.kind})")
+
+
+async def run_bot(application: Application):
+    """Запускает бота в режиме polling или webhook и ждет сигнала остановки."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка через KeyboardInterrupt
+
+    # Прогрев yt-dlp идет в фоне, пока запускаются HTTP-сервер и Application
+    warmup = asyncio.create_task(extraction_backend.warm_up())
+
+    server = None
+    if BOT_MODE == "webhook" or HEALTH_SERVER:
+        server = build_http_server(application)
+        await server.start(HTTP_HOST, HTTP_PORT)
+
+    try:
+        async with application:
+            await application.start()
+            await finish_warm_up(warmup)
+            if BOT_MODE == "webhook":
+                if WEBHOOK_URL:
+                    await application.bot.set_webhook(
+                        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                        secret_token=WEBHOOK_SECRET,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                    print(f"✅ Вебхук установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+                else:
+                    print("⚠️ WEBHOOK_URL не задан - вебхук не зарегистрирован в Telegram")
+            else:
+                await application.updater.start_polling()
+
+            heartbeat_task = asyncio.create_task(heartbeat()) if store_is_shared else None
+            eviction_task = asyncio.create_task(storage_manager.run())
+            purge_task = asyncio.create_task(store_maintenance())
+            
+            ready = time.monotonic() - BOOT_STARTED
+            BOOT_SECONDS.set(ready, phase="ready")
+            print(f"⏱ Бот готов через {ready:.2f}с после запуска (импорт {IMPORT_SECONDS:.2f}с)")
+            print("✅ Бот запущен! Напишите /start в Telegram.")
+            print(f"Ожидание сообщений ({BOT_MODE})...")
+            await stop_event.wait()
+            
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+            eviction_task.cancel()
+            purge_task.cancel()
+
+            if application.updater is not None and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+    finally:
+        warmup.cancel()
+        if server is not None:
+            await server.stop()
+
+
+def main():
+    # Исправление для Python 3.14: устанавливаем политику event loop для Windows
+    if os.name == 'nt':  # Windows
+        try:
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        except AttributeError:
+            try:
+                asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+            except AttributeError:
+                pass
+    
+    try:
+        print("Запуск YouTube Downloader Bot...")
+        print(f"Токен бота: {BOT_TOKEN[:10]}...")
+        BOOT_SECONDS.set(IMPORT_SECONDS, phase="imports")
+        print(f"⏱ Импорт модулей: {IMPORT_SECONDS:.2f}с")
+        
+        # Удаляем временные файлы, оставшиеся после аварийного завершения
+        removed = sweep_orphans()
+        if removed:
+            print(f"🧹 Удалено оставшихся временных файлов: {removed}")
+        
+        if BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE} (polling или webhook)")
+        if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+            raise ValueError("Для BOT_MODE=webhook задайте WEBHOOK_SECRET")
+        
+        print(f"Общее хранилище: {STORE_URL.split('@')[-1]} (экземпляр {INSTANCE_ID})")
+        print(f"Квота временных файлов: {storage_manager.quota // (1024 * 1024)}MB")
+        print(f"Скачивание: {http_engine()}")
+        if bandwidth_budget.enabled:
+            print(f"Общий лимит скорости скачиваний: {BANDWIDTH_LIMIT_MBPS:g} Мбит/с")
+        extraction_backend.start()
+        
+        # Обновления обрабатываются параллельно: долгие загрузки не блокируют
+        # других пользователей, а их число ограничивает download_scheduler
+        builder = configure_builder(Application.builder().token(BOT_TOKEN).concurrent_updates(True))
+        if BOT_API_URL:
+            print(f"Сервер Bot API: {BOT_API_URL}{' (local)' if BOT_API_LOCAL else ''}, лимит файла {MAX_FILE_SIZE_MB}MB")
+        if BOT_MODE == "webhook":
+            # Обновления приходят через HTTP-сервер, Updater не нужен
+            builder = builder.updater(None)
+        application = builder.build()
+        
+        # Регистрируем обработчики
+        application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("help", help_command))
+        application.add_handler(CommandHandler("uncache", uncache_command))
+        application.add_handler(CommandHandler("stats", stats_command))
+        application.add_handler(CallbackQueryHandler(button_handler))
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, url_handler))
+        
+        asyncio.run(run_bot(application))
+        
+    except Exception as exc:
+        import traceback
+        print(f"❌ Ошибка при запуске: {exc}")
+        print("\nПолный traceback:")
+        traceback.print_exc()
+        raise
+    finally:
+        extraction_backend.shutdown()
+        shared_store.close()
@@ -0,0 +1,71 @@
+"""
+Настройки сервера Bot API.
+
+По умолчанию бот работает с публичным api.telegram.org, который принимает
+файлы до 50MB. Свой сервер telegram-bot-api (BOT_API_URL) принимает файлы
+до 2000MB, а в режиме --local (BOT_API_LOCAL=1) берет их прямо с диска по
+пути, без загрузки по HTTP. Для этого сервер должен видеть TEMP_DIR бота:
+по тому же пути или по пути BOT_API_FILES_DIR (например, общий том Docker).
+
+    telegram-bot-api --local --api-id=... --api-hash=... --http-port=8081
+    BOT_API_URL=http://localhost:8081 BOT_API_LOCAL=1 MAX_FILE_SIZE_MB=2000 python main.py
+"""
+import os
+from pathlib import Path, PurePosixPath
+
+from workspace import TEMP_DIR
+
+# Лимиты Bot API на отправку файла
+PUBLIC_LIMIT_MB = 50
+LOCAL_SERVER_LIMIT_MB = 2000
+
+# Адрес своего сервера Bot API без пути, например http://localhost:8081
+BOT_API_URL = os.getenv("BOT_API_URL", "").rstrip("/")
+# Сервер запущен с --local и видит файлы бота
+BOT_API_LOCAL = os.getenv("BOT_API_LOCAL", "0") == "1" and bool(BOT_API_URL)
+# Путь к TEMP_DIR бота на стороне сервера (если отличается)
+BOT_API_FILES_DIR = os.getenv("BOT_API_FILES_DIR", "")
+# Сколько ждать загрузки большого файла (секунды)
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "600"))
+
+# Лимит размера файла: MAX_FILE_SIZE_MB, но не больше, чем примет сервер
+_max_allowed_mb = LOCAL_SERVER_LIMIT_MB if BOT_API_URL else PUBLIC_LIMIT_MB
+MAX_FILE_SIZE_MB = min(int(os.getenv("MAX_FILE_SIZE_MB") or _max_allowed_mb), _max_allowed_mb)
+MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
+
+
+def configure_builder(builder):
+    """
+    Настраивает Application.builder(): повтор запросов при флуд-контроле
+    (retry.RetryingRateLimiter) и свой сервер Bot API, если он задан.
+    """
+    # downloader и процессы пула импортируют bot_api ради MAX_FILE_SIZE -
+    # не загружаем им python-telegram-bot
+    from retry import RetryingRateLimiter
+
+    builder = builder.rate_limiter(RetryingRateLimiter())
+    if not BOT_API_URL:
+        return builder
+    builder = (
+        builder
+        .base_url(f"{BOT_API_URL}/bot")
+        .base_file_url(f"{BOT_API_URL}/file/bot")
+        .media_write_timeout(UPLOAD_TIMEOUT)
+    )
+    if BOT_API_LOCAL:
+        builder = builder.local_mode(True)
+    return builder
+
+
+def upload_source(path: str | Path) -> Path | str:
+    """
+    Что передать в send_video/send_audio для файла на диске.
+
+    В режиме --local PTB передает серверу путь (file://), иначе - содержимое файла.
+    Если сервер видит TEMP_DIR по другому пути, путь пересчитывается.
+    """
+    path = Path(path)
+    if BOT_API_LOCAL and BOT_API_FILES_DIR:
+        relative = path.resolve().relative_to(TEMP_DIR.resolve())
+        return (PurePosixPath(BOT_API_FILES_DIR) / relative.as_posix()).as_uri()
+    return path
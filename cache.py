@@ -0,0 +1,320 @@
+"""
+Кэши бота.
+
+FileIdCache - постоянный кэш Telegram file_id: повторные запросы того же
+видео в том же качестве отправляются по file_id без скачивания и загрузки.
+MetadataCache - LRU+TTL кэш информации о видео с объединением одновременных
+запросов одного и того же видео.
+
+Оба кэша могут работать поверх общего хранилища (storage.Store) - тогда их
+записи видят все экземпляры бота.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Путь к базе кэша и параметры вытеснения
+FILE_CACHE_PATH = os.getenv("FILE_CACHE_PATH", "file_cache.db")
+FILE_CACHE_MAX_ENTRIES = int(os.getenv("FILE_CACHE_MAX_ENTRIES", "10000"))
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", str(30 * 24 * 3600)))  # 30 дней
+# Как часто обновлять время использования записи в общем хранилище (секунды):
+# запись при каждом чтении удвоила бы число обращений к хранилищу
+FILE_CACHE_TOUCH_INTERVAL = 3600
+
+# Параметры кэша информации о видео
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "512"))
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", "1800"))  # 30 минут
+
+
+class FileIdCache:
+    """
+    Постоянный кэш file_id, ключ - (ID видео, режим).
+
+    Режим - это качество ("1080", "best", "worst") или "audio".
+    Записи старше max_age удаляются, при превышении max_entries
+    вытесняются самые давно использованные.
+
+    Если передано общее хранилище store, записи хранятся в нем с TTL = max_age,
+    а лишние записи сверх max_entries удаляет evict() (время использования
+    обновляется не чаще раза в FILE_CACHE_TOUCH_INTERVAL).
+    """
+
+    def __init__(self, path: str = FILE_CACHE_PATH, max_entries: int = FILE_CACHE_MAX_ENTRIES,
+                 max_age: int = FILE_CACHE_MAX_AGE, store=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.store = store
+        self._lock = threading.Lock()
+        if store is not None:
+            self._conn = None
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            " video_id TEXT NOT NULL,"
+            " mode TEXT NOT NULL,"
+            " file_id TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " title TEXT,"
+            " duration INTEGER,"
+            " filesize INTEGER,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (video_id, mode))"
+        )
+        self._conn.commit()
+
+    def get(self, video_id: str, mode: str) -> dict | None:
+        """
+        Возвращает запись кэша или None.
+
+        Returns:
+            dict: file_id, kind (video/audio), title, duration, filesize
+        """
+        if not video_id:
+            return None
+        if self.store is not None:
+            entry = self.store.get(self._key(video_id, mode))
+            now = time.time()
+            if entry is not None and now - entry.get('used', 0) > FILE_CACHE_TOUCH_INTERVAL:
+                entry['used'] = now
+                ttl = self.max_age - (now - entry.get('created', now))
+                if ttl > 0:
+                    self.store.set(self._key(video_id, mode), entry, ttl=ttl)
+            if entry is None:
+                return None
+            return {key: value for key, value in entry.items() if key not in ('created', 'used')}
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, kind, title, duration, filesize, created FROM file_ids"
+                " WHERE video_id = ? AND mode = ?",
+                (video_id, mode),
+            ).fetchone()
+            if not row:
+                return None
+            if now - row[5] > self.max_age:
+                self._conn.execute("DELETE FROM file_ids WHERE video_id = ? AND mode = ?", (video_id, mode))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE file_ids SET last_used = ? WHERE video_id = ? AND mode = ?",
+                (now, video_id, mode),
+            )
+            self._conn.commit()
+        return {
+            'file_id': row[0],
+            'kind': row[1],
+            'title': row[2],
+            'duration': row[3] or 0,
+            'filesize': row[4] or 0,
+        }
+
+    def put(self, video_id: str, mode: str, file_id: str, kind: str,
+            title: str = "", duration: int = 0, filesize: int = 0):
+        """Сохраняет file_id после первой успешной загрузки."""
+        if not video_id or not file_id:
+            return
+        if self.store is not None:
+            now = time.time()
+            entry = {'file_id': file_id, 'kind': kind, 'title': title,
+                     'duration': duration or 0, 'filesize': filesize or 0, 'created': now, 'used': now}
+            self.store.set(self._key(video_id, mode), entry, ttl=self.max_age)
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_ids"
+                " (video_id, mode, file_id, kind, title, duration, filesize, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, mode, file_id, kind, title, duration, filesize, now, now),
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def invalidate(self, video_id: str, mode: str | None = None) -> int:
+        """
+        Удаляет записи для видео (все режимы, если mode не указан).
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        if self.store is not None:
+            if mode is not None:
+                return int(self.store.delete(self._key(video_id, mode)))
+            return sum(self.store.delete(key) for key in self.store.keys(self._key(video_id, "")))
+        with self._lock:
+            if mode is None:
+                cur = self._conn.execute("DELETE FROM file_ids WHERE video_id = ?", (video_id,))
+            else:
+                cur = self._conn.execute(
+                    "DELETE FROM file_ids WHERE video_id = ? AND mode = ?", (video_id, mode)
+                )
+            self._conn.commit()
+            return cur.rowcount
+
+    def evict(self) -> int:
+        """
+        Удаляет устаревшие записи и самые давно использованные сверх лимита.
+
+        Returns:
+            int: Сколько записей удалено
+        """
+        if self.store is not None:
+            # Устаревшие записи удаляет TTL хранилища, здесь - только лишние
+            keys = self.store.keys("fileid:")
+            if len(keys) <= self.max_entries:
+                return 0
+            used = {key: (self.store.get(key) or {}).get('used', 0) for key in keys}
+            oldest = sorted(keys, key=used.get)[:len(keys) - self.max_entries]
+            return sum(self.store.delete(key) for key in oldest)
+        with self._lock:
+            before = self._conn.total_changes
+            self._evict_locked(time.time())
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def _evict_locked(self, now: float):
+        self._conn.execute("DELETE FROM file_ids WHERE created < ?", (now - self.max_age,))
+        count = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM file_ids WHERE rowid IN ("
+                " SELECT rowid FROM file_ids ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    @staticmethod
+    def _key(video_id: str, mode: str) -> str:
+        return f"fileid:{video_id}:{mode}"
+
+    def __len__(self) -> int:
+        if self.store is not None:
+            return len(self.store.keys("fileid:"))
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+
+
+class MetadataCache:
+    """
+    LRU+TTL кэш информации о видео, ключ - канонический ID видео.
+
+    Одновременные запросы одного ID ждут одну общую задачу извлечения,
+    а не запускают каждый свою. С общим хранилищем store локальный кэш
+    становится первым уровнем, а хранилище - вторым, общим для экземпляров.
+    """
+
+    def __init__(self, max_size: int = METADATA_CACHE_SIZE, ttl: int = METADATA_CACHE_TTL, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> dict | None:
+        """Возвращает значение из кэша или None, если его нет или оно устарело."""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if time.monotonic() - stored_at > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: dict):
+        """Сохраняет значение и вытесняет самые старые записи сверх лимита."""
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: str):
+        """Удаляет запись из кэша."""
+        self._items.pop(key, None)
+        if self.store is not None:
+            self.store.delete(f"meta:{key}")
+
+    async def lookup(self, key: str) -> dict | None:
+        """Значение из локального кэша или общего хранилища, без извлечения."""
+        value = self.get(key)
+        if value is None and self.store is not None:
+            value = await asyncio.to_thread(self.store.get, f"meta:{key}")
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    async def get_or_fetch(self, key: str, fetch) -> dict:
+        """
+        Возвращает значение из кэша или получает его через fetch().
+
+        Args:
+            key: Канонический ID видео
+            fetch: Функция без аргументов, возвращающая корутину с результатом
+
+        Returns:
+            dict: Информация о видео
+        """
+        value = await self.lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise  # Отменили самого ожидающего
+            # Отменили задачу, которая извлекала информацию, - этот запрос
+            # не отменялся: извлекаем заново (или ждем нового извлечения)
+            return await self.get_or_fetch(key, fetch)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим; помечаем его как полученное
+            future.exception()
+            raise
+        else:
+            self.put(key, value)
+            future.set_result(value)
+            if self.store is not None:
+                await self._share(key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _share(self, key: str, value: dict):
+        # Ошибка общего хранилища не должна ломать ответ пользователю
+        try:
+            await asyncio.to_thread(self.store.set, f"meta:{key}", value, self.ttl)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить информацию о видео в общее хранилище: {e}")
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов."""
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / total if total else 0.0,
+        }
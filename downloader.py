@@ -0,0 +1,589 @@
+"""
+Извлечение информации и скачивание видео через yt-dlp.
+
+Модуль не зависит от Telegram, поэтому его функции можно выполнять
+как в потоках, так и в отдельных процессах (см. backend.py).
+"""
+import copy
+import importlib.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from bot_api import MAX_FILE_SIZE
+from estimator import MP3_BITRATE_KBPS, selection_size
+from fitter import fit_formats, shrink_to_limit
+from workspace import new_job_dir
+
+# Сколько секунд результат извлечения пригоден для скачивания (ссылки на форматы истекают)
+RAW_INFO_MAX_AGE = 3 * 3600
+
+# Качество, которое скачивается для перекодирования или нарезки, если ни одна
+# комбинация форматов не помещается в лимит
+FALLBACK_QUALITY = "480"
+
+# Поля результата извлечения, которые не нужны для скачивания, но занимают много памяти
+UNUSED_INFO_KEYS = ('automatic_captions', 'subtitles', 'thumbnails', 'heatmap', 'description', 'chapters')
+
+# Сколько фрагментов DASH/HLS скачивать одновременно (отдельными соединениями)
+FRAGMENT_CONCURRENCY = int(os.getenv("FRAGMENT_CONCURRENCY", "4"))
+# Размер Range-запроса для обычных (не фрагментированных) форматов, MB; 0 - одним запросом.
+# YouTube ограничивает скорость длинных соединений, короткие запросы идут быстрее
+HTTP_CHUNK_SIZE_MB = int(os.getenv("HTTP_CHUNK_SIZE_MB", "10"))
+
+# Настройки YoutubeDL для получения информации о видео
+INFO_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+}
+# Экстракторы, которые создаются заранее при прогреве
+WARM_EXTRACTORS = ('Youtube', 'YoutubeTab')
+
+# Готовые экземпляры YoutubeDL для get_video_info: создание экземпляра и
+# экстракторов дороже самого выбора формата, поэтому они переиспользуются.
+# Экземпляр не потокобезопасен - каждый поток берет свой.
+_info_ydls: list = []
+_info_ydls_lock = threading.Lock()
+
+
+class StageError(Exception):
+    """
+    Ошибка этапа с именем класса исходной ошибки.
+
+    Текст - как у обычной ошибки этапа; cause нужен для учета ошибок по
+    классам (metrics.record_error). Ошибка передается из процесса пула,
+    поэтому поддерживает pickle.
+    """
+
+    def __init__(self, message: str, cause: str = ""):
+        super().__init__(message)
+        self.cause = cause
+
+    def __reduce__(self):
+        return (StageError, (str(self), self.cause))
+
+
+class DownloadCancelled(Exception):
+    """Скачивание отменено флагом cancel (например, ненужная предзагрузка)."""
+
+
+def _stage_error(prefix: str, e: Exception) -> StageError:
+    cause = e.cause if isinstance(e, StageError) else type(e).__name__
+    return StageError(f"{prefix}: {str(e)}", cause)
+
+
+def compact_progress(d: dict) -> dict:
+    """Оставляет из данных progress_hooks yt-dlp только нужное (и сериализуемое)."""
+    info = d.get('info_dict') or {}
+    return {
+        'status': d.get('status'),
+        'downloaded': d.get('downloaded_bytes') or 0,
+        'total': d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+        'speed': d.get('speed') or 0,
+        'eta': d.get('eta'),
+        'audio': info.get('vcodec') == 'none',
+    }
+
+
+class QueueProgressHook:
+    """
+    Хук прогресса для процесса пула: передает состояние родителю через очередь.
+
+    Если задан gate (общее значение), состояние передается, только пока gate.value не 0.
+    """
+
+    def __init__(self, channel, gate=None):
+        self.channel = channel
+        self.gate = gate
+
+    def __call__(self, snapshot: dict):
+        try:
+            if self.gate is not None and not self.gate.value:
+                return  # Прогресс пока никто не читает - не копим его в очереди
+            self.channel.put_nowait(snapshot)
+        except Exception:
+            pass  # Прогресс не важнее скачивания
+
+
+def slim_info(info: dict) -> dict:
+    """Убирает из результата извлечения крупные поля, не нужные для скачивания."""
+    return {k: v for k, v in info.items() if k not in UNUSED_INFO_KEYS}
+
+
+# Качества, для которых показываются кнопки
+QUALITY_HEIGHTS = (1080, 720, 480, 360)
+
+
+def video_format_spec(quality: str) -> str:
+    """Формат yt-dlp для кнопки качества: лучшая пара видео+аудио (mp4/m4a в приоритете)."""
+    if quality == "worst":
+        return 'wv*+wa/w'
+    height = '' if quality == "best" else f'[height<={quality}]'
+    return f'bv*{height}[ext=mp4]+ba[ext=m4a]/bv*{height}+ba/b{height}'
+
+
+def audio_format_spec(audio_format: str = "native") -> str:
+    """Формат yt-dlp для аудио."""
+    if audio_format == "mp3":
+        return 'bestaudio/best'
+    return 'bestaudio[ext=m4a]/bestaudio/best'
+
+
+def estimate_choice_sizes(ydl, info: dict, choices: list[str]) -> dict:
+    """
+    Оценивает размер файла для каждой кнопки.
+    
+    Для каждого варианта выполняется выбор формата yt-dlp (без сетевых
+    запросов) и суммируются размеры выбранных видео и аудио.
+    
+    Args:
+        ydl: Экземпляр YoutubeDL
+        info: Результат извлечения (raw_info)
+        choices: Варианты: качество ("1080", "best", "worst"), "audio" или "audio_mp3"
+    
+    Returns:
+        dict: Вариант -> размер в байтах (0, если оценить нельзя)
+    """
+    sizes = {}
+    original_selector = ydl.format_selector
+    try:
+        for choice in choices:
+            if choice == "audio_mp3":
+                duration = info.get('duration') or 0
+                sizes[choice] = int(MP3_BITRATE_KBPS * 1000 / 8 * duration)
+                continue
+            spec = audio_format_spec() if choice == "audio" else video_format_spec(choice)
+            ydl.format_selector = ydl.build_format_selector(spec)
+            try:
+                selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            except Exception:
+                continue  # Подходящего формата нет
+            sizes[choice] = selection_size(selected)
+    finally:
+        ydl.format_selector = original_selector
+    return sizes
+
+
+@contextmanager
+def borrowed_info_ydl():
+    """YoutubeDL для получения информации из пула готовых экземпляров."""
+    import yt_dlp
+
+    with _info_ydls_lock:
+        ydl = _info_ydls.pop() if _info_ydls else None
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(dict(INFO_YDL_OPTS))
+    try:
+        yield ydl
+    finally:
+        with _info_ydls_lock:
+            _info_ydls.append(ydl)
+
+
+def warm_up() -> float:
+    """
+    Прогрев перед первым запросом: импорт yt_dlp, загрузка классов
+    экстракторов и готовый экземпляр YoutubeDL с экстракторами YouTube.
+
+    Returns:
+        float: Длительность прогрева (секунды)
+    """
+    started = time.monotonic()
+    from yt_dlp.extractor import gen_extractor_classes
+    gen_extractor_classes()
+    with borrowed_info_ydl() as ydl:
+        for key in WARM_EXTRACTORS:
+            ydl.get_info_extractor(key)
+    return time.monotonic() - started
+
+
+def format_clip(clip: tuple[int, int]) -> str:
+    """Отрезок (начало, конец) в секундах как "1:20-2:10"."""
+    def timestamp(seconds: int) -> str:
+        hours, rest = divmod(int(seconds), 3600)
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+    return f"{timestamp(clip[0])}-{timestamp(clip[1])}"
+
+
+def http_engine() -> str:
+    """
+    Описание настроек скачивания для журнала запуска.
+
+    Пул соединений (keep-alive) у yt-dlp есть только с пакетом requests
+    (yt-dlp[default]); без него каждый запрос открывает новое соединение.
+    """
+    if importlib.util.find_spec("requests") is not None:
+        pool = "requests (пул соединений)"
+    else:
+        pool = "urllib (без пула соединений)"
+    chunk = f"{HTTP_CHUNK_SIZE_MB}MB" if HTTP_CHUNK_SIZE_MB else "без деления"
+    return f"фрагментов параллельно {FRAGMENT_CONCURRENCY}, запрос {chunk}, {pool}"
+
+
+def get_video_info(url: str) -> dict:
+    """
+    Получает информацию о видео без скачивания.
+    
+    Returns:
+        dict: Информация о видео (title, duration, available_qualities,
+            choice_sizes - оценка размера для каждой кнопки, estimated_size, raw_info)
+    """
+    try:
+        with borrowed_info_ydl() as ydl:
+            info = ydl.extract_info(url, download=False)
+            
+            video_info = {
+                'title': info.get('title', 'Без названия'),
+                'duration': info.get('duration', 0),
+                'thumbnail': info.get('thumbnail', ''),
+                'uploader': info.get('uploader', 'Неизвестно'),
+                'view_count': info.get('view_count', 0),
+            }
+            
+            # Доступные высоты видео
+            formats = info.get('formats', [])
+            video_info['available_qualities'] = sorted(
+                {fmt['height'] for fmt in formats if fmt.get('height')}, reverse=True
+            )
+            
+            # Сохраняем результат извлечения, чтобы не повторять его при скачивании
+            raw_info = slim_info(ydl.sanitize_info(info, remove_private_keys=True))
+            video_info['raw_info'] = raw_info
+            
+            # Размер для каждой кнопки - по той паре форматов, которую выберет yt-dlp
+            choices = [str(h) for h in QUALITY_HEIGHTS if h in video_info['available_qualities']]
+            choices += ["best", "worst", "audio", "audio_mp3"]
+            video_info['choice_sizes'] = estimate_choice_sizes(ydl, raw_info, choices)
+            # "Лучшее" - лучшее из того, что помещается в лимит (см. download_video)
+            if video_info['choice_sizes'].get('best', 0) > MAX_FILE_SIZE:
+                fit = fit_formats(raw_info, MAX_FILE_SIZE)
+                if fit is not None:
+                    video_info['choice_sizes']['best'] = fit['size']
+            video_info['estimated_size'] = video_info['choice_sizes'].get('best', 0)
+            
+            return video_info
+            
+    except Exception as e:
+        raise _stage_error("Ошибка при получении информации", e)
+
+
+def resolve_playlist(url: str, limit: int) -> list[dict]:
+    """
+    Список видео плейлиста без извлечения каждого видео (extract_flat).
+
+    Args:
+        url: Ссылка на плейлист
+        limit: Максимальное число элементов
+
+    Returns:
+        list: [{'id', 'url', 'title', 'duration'}, ...] не длиннее limit
+    """
+    import yt_dlp
+
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'playlistend': limit,
+    }
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        raise _stage_error("Ошибка при получении плейлиста", e)
+
+    items = []
+    for entry in info.get('entries') or []:
+        # Пропускаем удаленные и приватные видео
+        if not entry or not entry.get('id') or entry.get('availability') in ('private', 'needs_auth'):
+            continue
+        items.append({
+            'id': entry['id'],
+            'url': entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}",
+            'title': entry.get('title') or entry['id'],
+            'duration': int(entry.get('duration') or 0),
+        })
+        if len(items) >= limit:
+            break
+    return items
+
+
+def download_video(url: str, quality: str = "best", audio_only: bool = False,
+                   info: dict | None = None, workdir: Path | str | None = None,
+                   audio_format: str = "native", progress_hook=None,
+                   rate_limiter=None, clip: tuple[int, int] | None = None,
+                   cancel=None) -> tuple[str, dict]:
+    """
+    Скачивает видео с YouTube используя yt-dlp.
+    
+    Args:
+        url: Ссылка на YouTube видео
+        quality: Качество видео (best, worst, или формат типа 720p)
+        audio_only: Если True, скачивает только аудио
+        info: Уже полученный результат извлечения (raw_info из get_video_info).
+            Если передан, повторное извлечение не выполняется.
+        workdir: Рабочая папка задачи (new_job_dir). Удалять ее - забота
+            вызывающего; если не передана, создается новая.
+        audio_format: native (исходная дорожка) или mp3 (перекодирование)
+        progress_hook: Функция, получающая состояние скачивания (compact_progress).
+            Вызывается в рабочем потоке и не должна блокироваться.
+        rate_limiter: Ограничитель скорости задачи из общего бюджета (bandwidth.py)
+        clip: Отрезок (начало, конец) в секундах - скачивается только он
+        cancel: Флаг отмены (backend.shared_value): если value не 0, скачивание
+            прерывается на ближайшем обновлении прогресса
+    
+    Если выбранные форматы больше MAX_FILE_SIZE, по списку форматов
+    подбирается лучшая комбинация, которая помещается в лимит. Если файл
+    все равно получился больше лимита, он перекодируется или режется на
+    части (см. fitter.py).
+    
+    Returns:
+        tuple: (путь к файлу, информация о видео). Если файл разрезан,
+            в информации есть parts - пути ко всем частям по порядку
+            (путь к файлу - первая часть). timings - длительность этапов
+            extract, download, postprocess и fit; downloaded_bytes - сколько
+            байт скачано из сети
+    """
+    import yt_dlp
+    
+    if workdir is None:
+        workdir = new_job_dir()
+    
+    # Настройки для yt-dlp
+    ydl_opts = {
+        'outtmpl': str(Path(workdir) / '%(title)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'concurrent_fragment_downloads': FRAGMENT_CONCURRENCY,
+    }
+    if HTTP_CHUNK_SIZE_MB:
+        ydl_opts['http_chunk_size'] = HTTP_CHUNK_SIZE_MB * 1024 * 1024
+    
+    # Длительность этапов (секунды) и скачанные байты - для метрик
+    timings = {'extract': 0.0, 'download': 0.0, 'postprocess': 0.0, 'fit': 0.0}
+    downloaded = {'bytes': 0}
+    pp_started = {}
+
+    def check_cancel():
+        if cancel is not None and cancel.value:
+            raise DownloadCancelled("Скачивание отменено")
+
+    def track_progress(d):
+        check_cancel()
+        if d.get('status') == 'finished':
+            downloaded['bytes'] += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+        elif rate_limiter is not None and d.get('status') == 'downloading':
+            rate_limiter(d.get('tmpfilename') or d.get('filename') or '', d.get('downloaded_bytes') or 0)
+        if progress_hook is not None:
+            progress_hook(compact_progress(d))
+
+    def track_postprocessor(d):
+        check_cancel()
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            pp_started[name] = time.monotonic()
+        elif d.get('status') == 'finished' and name in pp_started:
+            timings['postprocess'] += time.monotonic() - pp_started.pop(name)
+
+    if clip is not None:
+        from yt_dlp.utils import download_range_func
+        # Скачиваются только фрагменты (или диапазоны байт), попадающие в
+        # отрезок; резка по ключевым кадрам, без перекодирования
+        ydl_opts['download_ranges'] = download_range_func(None, [clip])
+        ydl_opts['force_keyframes_at_cuts'] = False
+    
+    ydl_opts['progress_hooks'] = [track_progress]
+    ydl_opts['postprocessor_hooks'] = [track_postprocessor]
+    
+    if audio_only and audio_format == "mp3":
+        ydl_opts.update({
+            'format': audio_format_spec("mp3"),
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192',
+            }],
+        })
+    elif audio_only:
+        # Исходная дорожка как есть; для не-m4a контейнер меняется ниже
+        ydl_opts['format'] = audio_format_spec()
+    else:
+        # Пара видео+аудио, склеивается в mp4 для воспроизведения в Telegram
+        ydl_opts['format'] = video_format_spec(quality)
+        ydl_opts['merge_output_format'] = 'mp4'
+    
+    if info is not None and time.time() - info.get('epoch', 0) > RAW_INFO_MAX_AGE:
+        info = None
+    
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            if info is None:
+                # Извлекаем информацию один раз; выбор формата и скачивание работают с ней
+                extract_started = time.monotonic()
+                info = ydl.extract_info(url, download=False, process=False)
+                timings['extract'] = time.monotonic() - extract_started
+            
+            # Выбор формата без сетевых запросов - только для проверки размера
+            selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            video_title = selected.get('title', 'video')
+            duration = selected.get('duration', 0)
+            filesize = selection_size(selected)
+            # Доля видео, которая будет скачана (для отрезка - его длина к длительности)
+            fraction = 1.0
+            if clip is not None:
+                if duration and clip[0] >= duration:
+                    raise Exception("Начало фрагмента дальше конца видео")
+                end = min(clip[1], duration) if duration else clip[1]
+                fraction = (end - clip[0]) / duration if duration else 1.0
+                duration = end - clip[0]
+                filesize = int(filesize * fraction)
+                video_title = f"{video_title} [{format_clip((clip[0], end))}]"
+            
+            if audio_only and audio_format != "mp3" and selected.get('ext') != 'm4a':
+                # m4a отправляется как есть, остальные кодеки (opus) - только
+                # смена контейнера без перекодирования
+                from yt_dlp.postprocessor import FFmpegExtractAudioPP
+                ydl.add_post_processor(FFmpegExtractAudioPP(ydl, preferredcodec='best'), when='post_process')
+            
+            # Проверяем размер файла
+            if filesize > MAX_FILE_SIZE and not audio_only:
+                # Лучшая пара форматов, которая помещается в лимит; если такой нет -
+                # умеренное качество, которое будет уменьшено после скачивания
+                fit = fit_formats(info, int(MAX_FILE_SIZE / fraction), int(quality) if quality.isdigit() else None)
+                ydl_opts['format'] = fit['format'] if fit else video_format_spec(FALLBACK_QUALITY)
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl2:
+                    started = time.monotonic()
+                    result = ydl2.process_ie_result(copy.deepcopy(info), download=True)
+            else:
+                started = time.monotonic()
+                result = ydl.process_ie_result(copy.deepcopy(info), download=True)
+            elapsed = time.monotonic() - started
+            timings['download'] = max(elapsed - timings['postprocess'], 0.0)
+            
+            # Путь к файлу берем из отчета yt-dlp (уже после постобработки)
+            downloaded_file = None
+            for download in result.get('requested_downloads') or []:
+                if download.get('filepath'):
+                    downloaded_file = Path(download['filepath'])
+            if downloaded_file is None and result.get('filepath'):
+                downloaded_file = Path(result['filepath'])
+            
+            if not downloaded_file or not downloaded_file.is_file():
+                raise Exception("Файл не был скачан")
+            
+            video_info = {
+                'title': video_title,
+                'duration': duration,
+                'filesize': downloaded_file.stat().st_size,
+                'filename': downloaded_file.name,
+                # Время скачивания с постобработкой - для оценки скорости
+                'elapsed': elapsed,
+                'timings': timings,
+                'downloaded_bytes': downloaded['bytes'],
+            }
+            
+            if video_info['filesize'] > MAX_FILE_SIZE:
+                fit_started = time.monotonic()
+                files, video_info['fitted'] = shrink_to_limit(
+                    downloaded_file, duration, MAX_FILE_SIZE, audio=audio_only
+                )
+                timings['fit'] = time.monotonic() - fit_started
+                downloaded_file = files[0]
+                video_info['filename'] = downloaded_file.name
+                video_info['filesize'] = sum(f.stat().st_size for f in files)
+                if len(files) > 1:
+                    video_info['parts'] = [str(f) for f in files]
+            
+            return str(downloaded_file), video_info
+            
+    except Exception as e:
+        raise _stage_error("Ошибка при скачивании", e)
+
+
+def resolve_stream(url: str, quality: str = "best", audio_only: bool = False,
+                   info: dict | None = None, audio_format: str = "native") -> dict:
+    """
+    Выбирает форматы для потоковой загрузки (без скачивания).
+    
+    Подходят только форматы, доступные по прямой http(s)-ссылке:
+    их можно читать потоком и сразу отправлять в Telegram. Если выбранная
+    пара больше MAX_FILE_SIZE, берется лучшая потоковая пара, которая
+    помещается в лимит (fit_formats); filesize больше лимита означает, что
+    такой нет и файл нужно скачивать с подбором размера.
+    
+    Returns:
+        dict: title, duration, filesize, mode (direct - отправка как есть,
+            remux - склейка видео и аудио через ffmpeg, mp3 - перекодирование
+            через ffmpeg), ext и sources - список {url, headers}
+    """
+    import yt_dlp
+    
+    # Сначала форматы не больше лимита (размер пары проверяется ниже); если
+    # таких нет - любые, и filesize покажет, что потоком файл не отправить
+    size = f'[filesize<?{MAX_FILE_SIZE}]'
+    if audio_only and audio_format == "mp3":
+        format_spec = f'bestaudio[protocol^=http]{size}/bestaudio[protocol^=http]'
+    elif audio_only:
+        # Только m4a: его можно отправить как есть, без ffmpeg
+        format_spec = f'bestaudio[ext=m4a][protocol^=http]{size}/bestaudio[ext=m4a][protocol^=http]'
+    elif quality == "worst":
+        format_spec = f'worst[protocol^=http]{size}/worst[protocol^=http]'
+    else:
+        height = '' if quality == "best" else f'[height<={quality}]'
+        format_spec = (
+            f'bestvideo{height}[ext=mp4][protocol^=http]{size}+bestaudio[ext=m4a][protocol^=http]{size}'
+            f'/best{height}[protocol^=http]{size}'
+            f'/bestvideo{height}[ext=mp4][protocol^=http]+bestaudio[ext=m4a][protocol^=http]'
+        )
+    
+    if info is not None and time.time() - info.get('epoch', 0) > RAW_INFO_MAX_AGE:
+        info = None
+    
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'format': format_spec,
+    }
+    
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            if info is None:
+                info = ydl.extract_info(url, download=False, process=False)
+            selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            if not audio_only and selection_size(selected) > MAX_FILE_SIZE:
+                streamable = [
+                    f for f in info.get('formats') or []
+                    if str(f.get('protocol', '')).startswith('http') and f.get('ext') in ('mp4', 'm4a')
+                ]
+                fit = fit_formats(dict(info, formats=streamable), MAX_FILE_SIZE,
+                                  int(quality) if quality.isdigit() else None)
+                if fit:
+                    ydl.format_selector = ydl.build_format_selector(fit['format'])
+                    selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    except Exception as e:
+        raise _stage_error("Ошибка при выборе формата", e)
+    
+    formats = selected.get('requested_formats') or [selected]
+    sources = [{'url': f['url'], 'headers': f.get('http_headers') or {}} for f in formats]
+    
+    if audio_only and audio_format == "mp3":
+        mode, ext = 'mp3', 'mp3'
+    elif audio_only:
+        mode, ext = 'direct', selected.get('ext') or 'm4a'
+    elif len(sources) > 1:
+        mode, ext = 'remux', 'mp4'
+    else:
+        mode, ext = 'direct', selected.get('ext') or 'mp4'
+    
+    return {
+        'title': selected.get('title', 'video'),
+        'duration': selected.get('duration') or 0,
+        'filesize': selection_size(selected),
+        'mode': mode,
+        'ext': ext,
+        'sources': sources,
+    }
@@ -0,0 +1,71 @@
+"""
+Оценка размера и времени скачивания.
+
+Размер считается по реальным форматам, которые выберет yt-dlp (видео +
+аудио), а скорость - по скользящему среднему последних скачиваний.
+"""
+import os
+import threading
+from collections import deque
+
+# Скорость по умолчанию, пока нет замеров (Мбит/с)
+DEFAULT_SPEED_MBPS = float(os.getenv("DEFAULT_SPEED_MBPS", "10"))
+# Сколько последних скачиваний учитывать
+THROUGHPUT_WINDOW = int(os.getenv("THROUGHPUT_WINDOW", "20"))
+# Скачивания меньше этого размера не учитываются - на них больше накладных расходов
+MIN_SAMPLE_BYTES = 512 * 1024
+
+# Битрейт MP3 при перекодировании (кбит/с)
+MP3_BITRATE_KBPS = 192
+
+
+def format_size(fmt: dict, duration: float | None) -> int:
+    """
+    Размер формата в байтах: filesize, filesize_approx или tbr * duration.
+
+    Returns:
+        int: Размер в байтах, 0 если оценить нельзя
+    """
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return 0
+
+
+def selection_size(selected: dict) -> int:
+    """Суммарный размер выбора yt-dlp (пара видео + аудио или один формат)."""
+    duration = selected.get('duration')
+    formats = selected.get('requested_formats') or [selected]
+    return sum(format_size(fmt, duration) for fmt in formats)
+
+
+class ThroughputMeter:
+    """Скользящее среднее скорости по последним реальным скачиваниям."""
+
+    def __init__(self, window: int = THROUGHPUT_WINDOW, default_mbps: float = DEFAULT_SPEED_MBPS):
+        self.default_bytes_per_sec = default_mbps * 1024 * 1024 / 8
+        self._samples: deque[tuple[int, float]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, size_bytes: int, seconds: float):
+        """Добавляет замер одного скачивания."""
+        if size_bytes < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        with self._lock:
+            self._samples.append((size_bytes, seconds))
+
+    def speed(self) -> float:
+        """Средняя скорость в байтах в секунду."""
+        with self._lock:
+            total_bytes = sum(size for size, _ in self._samples)
+            total_seconds = sum(seconds for _, seconds in self._samples)
+        if not total_seconds:
+            return self.default_bytes_per_sec
+        return total_bytes / total_seconds
+
+
+# Общий измеритель скорости для всего бота
+throughput_meter = ThroughputMeter()
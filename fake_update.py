@@ -0,0 +1,99 @@
+"""
+Отправка поддельного обновления Telegram на вебхук бота.
+
+Для локальной проверки режима webhook без Telegram:
+
+    BOT_MODE=webhook WEBHOOK_SECRET=secret python main.py
+    python fake_update.py --secret secret --text "https://youtu.be/dQw4w9WgXcQ"
+    python fake_update.py --secret secret --callback quality_360
+
+Ответы бота уйдут в Bot API (с тестовым токеном - с ошибкой), но сама
+обработка обновления видна в логах бота.
+"""
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+
+
+def build_message_update(text: str, user_id: int, chat_id: int) -> dict:
+    """Обновление с текстовым сообщением от пользователя."""
+    now = int(time.time())
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Test'}
+    message = {
+        'message_id': random.randint(1, 10**6),
+        'date': now,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': user,
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': random.randint(1, 10**9), 'message': message}
+
+
+def build_callback_update(data: str, user_id: int, chat_id: int) -> dict:
+    """Обновление с нажатием inline-кнопки под сообщением бота."""
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Test'}
+    return {
+        'update_id': random.randint(1, 10**9),
+        'callback_query': {
+            'id': str(random.randint(1, 10**9)),
+            'from': user,
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': random.randint(1, 10**6),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'Bot'},
+                'text': 'Выберите качество:',
+            },
+        },
+    }
+
+
+def post_update(url: str, update: dict, secret: str = "") -> tuple[int, str]:
+    """
+    Отправляет обновление POST-запросом.
+
+    Returns:
+        tuple: (HTTP-статус, тело ответа)
+    """
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправить поддельное обновление на вебхук бота")
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook', help='Адрес вебхука')
+    parser.add_argument('--secret', default='', help='WEBHOOK_SECRET бота')
+    parser.add_argument('--user-id', type=int, default=100000001)
+    parser.add_argument('--chat-id', type=int, default=None)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--text', help='Текст сообщения (ссылка или команда)')
+    group.add_argument('--callback', help='callback_data нажатой кнопки')
+    args = parser.parse_args()
+
+    chat_id = args.chat_id or args.user_id
+    if args.text is not None:
+        update = build_message_update(args.text, args.user_id, chat_id)
+    else:
+        update = build_callback_update(args.callback, args.user_id, chat_id)
+
+    status, body = post_update(args.url, update, args.secret)
+    print(f"HTTP {status}: {body}")
+
+
+if __name__ == "__main__":
+    main()
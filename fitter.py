@@ -0,0 +1,170 @@
+"""
+Подбор файла под лимит размера Telegram.
+
+fit_formats выбирает по реальному списку форматов лучшую пару видео + аудио,
+которая помещается в лимит. Если даже после этого файл больше лимита
+(размер форматов неизвестен или все варианты слишком большие),
+shrink_to_limit перекодирует его под нужный битрейт или режет на части.
+"""
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from estimator import format_size
+
+# Что делать с файлом больше лимита: auto (перекодировать, а если битрейт
+# получится слишком низким - резать на части), reencode, split или off
+SIZE_FIT_FALLBACK = os.getenv("SIZE_FIT_FALLBACK", "auto")
+# Запас на контейнер и неточность оценок размера
+SIZE_MARGIN = 0.95
+# Ниже этого битрейта видео (кбит/с) перекодирование бессмысленно - режем на части
+MIN_VIDEO_KBPS = 200
+# Битрейт аудио при перекодировании видео (кбит/с)
+REENCODE_AUDIO_KBPS = 96
+# Высота кадра при перекодировании в зависимости от битрейта видео (кбит/с)
+REENCODE_HEIGHTS = ((500, 360), (1000, 480), (2000, 720))
+# Сколько раз пробовать разрезать файл, уменьшая длину части
+SPLIT_ATTEMPTS = 3
+
+
+def _is_compatible(video: dict, audio: dict | None) -> bool:
+    # mp4 + m4a воспроизводится во встроенном плеере Telegram без перекодирования
+    return video.get('ext') == 'mp4' and (audio is None or audio.get('ext') == 'm4a')
+
+
+def fit_formats(info: dict, max_size: int, max_height: int | None = None) -> dict | None:
+    """
+    Лучшая комбинация форматов, которая помещается в max_size.
+
+    Учитываются только форматы с известным размером (filesize,
+    filesize_approx или битрейт и длительность).
+
+    Args:
+        info: Результат извлечения (со списком formats)
+        max_size: Лимит размера в байтах
+        max_height: Максимальная высота кадра (None - без ограничения)
+
+    Returns:
+        dict: format (строка формата yt-dlp), size, height или None, если ничего не помещается
+    """
+    duration = info.get('duration')
+    limit = max_size * SIZE_MARGIN
+    videos, audios, muxed = [], [], []
+    for fmt in info.get('formats') or []:
+        size = format_size(fmt, duration)
+        has_video = fmt.get('vcodec') != 'none'
+        has_audio = fmt.get('acodec') != 'none'
+        if not size or not (has_video or has_audio) or fmt.get('protocol') == 'mhtml':
+            continue
+        if has_video and max_height and (fmt.get('height') or 0) > max_height:
+            continue
+        if has_video and has_audio:
+            muxed.append((fmt, size))
+        elif has_video:
+            videos.append((fmt, size))
+        else:
+            audios.append((fmt, size))
+
+    candidates = []
+    for fmt, size in muxed:
+        if size <= limit:
+            candidates.append((fmt, None, size))
+    for video, video_size in videos:
+        for audio, audio_size in audios:
+            if video_size + audio_size <= limit:
+                candidates.append((video, audio, video_size + audio_size))
+    if not candidates:
+        return None
+
+    # Выше кадр, затем совместимые кодеки, затем частота кадров и битрейт (размер)
+    video, audio, size = max(
+        candidates,
+        key=lambda c: (c[0].get('height') or 0, _is_compatible(c[0], c[1]), c[0].get('fps') or 0, c[2]),
+    )
+    spec = video['format_id'] if audio is None else f"{video['format_id']}+{audio['format_id']}"
+    return {'format': spec, 'size': int(size), 'height': video.get('height') or 0}
+
+
+def _run_ffmpeg(args: list[str]):
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-y', *args], capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg: {result.stderr.decode(errors='replace').strip()[-300:]}")
+
+
+def reencode(path: Path, video_kbps: int) -> Path:
+    """Перекодирует видео в H.264/AAC с заданным битрейтом видео."""
+    height = next((h for kbps, h in REENCODE_HEIGHTS if video_kbps < kbps), None)
+    output = path.with_name(f"{path.stem}.fit.mp4")
+    args = ['-i', str(path), '-c:v', 'libx264', '-preset', 'veryfast',
+            '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k']
+    if height:
+        args += ['-vf', f"scale=-2:'min(ih,{height})'"]
+    args += ['-c:a', 'aac', '-b:a', f'{REENCODE_AUDIO_KBPS}k', '-movflags', '+faststart', str(output)]
+    _run_ffmpeg(args)
+    return output
+
+
+def split_file(path: Path, duration: float, max_size: int) -> list[Path]:
+    """
+    Режет файл на части не больше max_size без перекодирования.
+
+    Части режутся по ключевым кадрам, поэтому их размер неточен: если
+    какая-то часть получилась больше лимита, длина частей уменьшается.
+
+    Returns:
+        list: Пути к частям по порядку
+    """
+    if not duration:
+        raise Exception("Неизвестна длительность - нельзя разрезать файл на части")
+    parts_dir = path.parent / "parts"
+    segment = duration * max_size * SIZE_MARGIN / path.stat().st_size
+    for _ in range(SPLIT_ATTEMPTS):
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        parts_dir.mkdir()
+        _run_ffmpeg(['-i', str(path), '-map', '0', '-c', 'copy', '-f', 'segment',
+                     '-segment_time', f'{segment:.1f}', '-reset_timestamps', '1',
+                     str(parts_dir / f"%03d{path.suffix}")])
+        parts = sorted(parts_dir.iterdir())
+        if parts and all(part.stat().st_size <= max_size for part in parts):
+            named = []
+            for number, part in enumerate(parts, start=1):
+                target = path.with_name(f"{path.stem} ({number} из {len(parts)}){path.suffix}")
+                part.rename(target)
+                named.append(target)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            path.unlink()
+            return named
+        segment *= 0.7
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    raise Exception("Не удалось разрезать файл на части нужного размера")
+
+
+def shrink_to_limit(path: Path, duration: float, max_size: int, audio: bool = False) -> tuple[list[Path], str]:
+    """
+    Уменьшает файл больше лимита: перекодирует под битрейт или режет на части.
+
+    Аудио только режется - перекодирование заметно испортило бы звук.
+
+    Returns:
+        tuple: (список файлов, способ: reencode или split)
+
+    Raises:
+        Exception: Если уменьшение выключено, нет ffmpeg или ничего не помогло
+    """
+    limit_mb = max_size // (1024 * 1024)
+    if SIZE_FIT_FALLBACK == "off" or not shutil.which('ffmpeg'):
+        raise Exception(f"Файл больше {limit_mb}MB (filesize)")
+
+    if not audio and duration and SIZE_FIT_FALLBACK in ("auto", "reencode"):
+        video_kbps = int(max_size * SIZE_MARGIN * 8 / 1000 / duration) - REENCODE_AUDIO_KBPS
+        if video_kbps >= MIN_VIDEO_KBPS or (SIZE_FIT_FALLBACK == "reencode" and video_kbps > 0):
+            output = reencode(path, video_kbps)
+            if output.stat().st_size <= max_size:
+                path.unlink()
+                return [output], "reencode"
+            output.unlink()  # Не уложились - режем исходный файл
+    if SIZE_FIT_FALLBACK == "reencode":
+        raise Exception(f"Не удалось перекодировать файл в {limit_mb}MB (filesize)")
+
+    return split_file(path, duration, max_size), "split"
@@ -0,0 +1,227 @@
+"""
+Метрики в формате Prometheus и ID трассировки задач.
+
+Метрики собираются в памяти процесса и отдаются HTTP-сервером бота на
+/metrics. Значения, которые и так хранятся в других объектах (размер
+очереди, счетчики кэша), читаются в момент запроса через func.
+
+ID трассировки хранится в contextvars: задается в начале обработки
+обновления и попадает во все строки log() этой обработки, в том числе из
+рабочих потоков (asyncio.to_thread копирует контекст) и из задач очереди.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Границы корзин гистограмм длительности (секунды)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="")
+
+
+def new_trace() -> str:
+    """Задает новый ID трассировки для текущей обработки и возвращает его."""
+    trace = uuid.uuid4().hex[:8]
+    _trace_id.set(trace)
+    return trace
+
+
+def current_trace() -> str:
+    return _trace_id.get()
+
+
+def log(message: str):
+    """print с ID трассировки текущей задачи."""
+    trace = _trace_id.get()
+    print(f"[{trace}] {message}" if trace else message)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), func=None):
+        """
+        Args:
+            name: Имя метрики
+            help_text: Описание для # HELP
+            labelnames: Имена меток
+            func: Функция без аргументов, возвращающая значение (или словарь
+                кортеж значений меток -> значение) в момент запроса метрик
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def values(self) -> dict[tuple, float]:
+        """Текущие значения по меткам."""
+        if self.func is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.func()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Текущее значение."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (обычно длительностей)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: dict[tuple, list] = {}  # метки -> [счетчики корзин, сумма, количество]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with (подходит и для кода с await)."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def totals(self) -> dict[tuple, dict]:
+        """Количество и сумма наблюдений по меткам."""
+        with self._lock:
+            return {key: {'count': count, 'sum': total} for key, (_, total, count) in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels({**labels, 'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            lines.append(f"# {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Метрики бота ---
+
+STAGE_SECONDS = Histogram(
+    "ytbot_stage_seconds",
+    "Длительность этапов обработки: info, queue, extract, download, postprocess, fit, upload, stream",
+    ("stage",),
+)
+BYTES_TOTAL = Counter(
+    "ytbot_bytes_total", "Скачано (in) и отправлено в Telegram (out) байт", ("direction",)
+)
+CACHE_REQUESTS = Counter(
+    "ytbot_cache_requests_total", "Обращения к кэшам по результату", ("cache", "result")
+)
+ERRORS_TOTAL = Counter(
+    "ytbot_errors_total", "Ошибки по этапам и классу исходной ошибки", ("stage", "error")
+)
+JOBS_TOTAL = Counter("ytbot_jobs_total", "Завершенные задачи по результату", ("result",))
+DISK_EVICTED_BYTES = Counter(
+    "ytbot_disk_evicted_bytes_total", "Удалено забытых файлов из TEMP_DIR фоновой очисткой (байт)"
+)
+RETRIES_TOTAL = Counter(
+    "ytbot_retries_total", "Повторы вызовов по целям: upload, edit, extraction, api", ("target", "reason")
+)
+CIRCUIT_OPENED_TOTAL = Counter(
+    "ytbot_circuit_opened_total", "Сколько раз цель отключалась автоматом после череды ошибок", ("target",)
+)
+PREFETCH_TOTAL = Counter(
+    "ytbot_prefetch_total",
+    "Предзагрузки по результату: started, skipped, hit, miss, expired, preempted, failed",
+    ("result",),
+)
+PREFETCH_SAVED_SECONDS = Counter(
+    "ytbot_prefetch_saved_seconds_total", "Время скачивания, выполненного предзагрузкой до нажатия (секунды)"
+)
+BOOT_SECONDS = Gauge(
+    "ytbot_boot_seconds", "Длительность запуска: imports, warmup, ready, first_request", ("phase",)
+)
+
+
+def record_error(stage: str, exc: BaseException):
+    """Учитывает ошибку: класс исходной ошибки, если этап его сохранил (StageError)."""
+    ERRORS_TOTAL.inc(stage=stage, error=getattr(exc, 'cause', "") or type(exc).__name__)
@@ -0,0 +1,259 @@
+"""
+Предзагрузка, пока пользователь выбирает качество.
+
+Между сообщением с кнопками и нажатием проходит несколько секунд, а
+исполнитель в это время простаивает. При PREFETCH=1 сразу после получения
+информации о видео начинает скачиваться самый вероятный выбор - по
+истории выборов пользователя и общей статистике. Совпавшее нажатие
+забирает предзагрузку (готовый файл или уже идущее скачивание), другое
+нажатие отменяет ее и удаляет скачанное.
+
+Предзагрузка занимает только свободное: она запускается, если есть
+свободный исполнитель и место в квоте без ожидания, и уступает их обычным
+задачам (preempt в scheduler.py и workspace.py). Доля попаданий видна в
+/stats и в метрике ytbot_prefetch_total: включать предзагрузку стоит там,
+где она высока.
+"""
+import asyncio
+import os
+import time
+
+from metrics import PREFETCH_SAVED_SECONDS, PREFETCH_TOTAL, log
+
+# Включить предзагрузку
+PREFETCH = os.getenv("PREFETCH", "0") == "1"
+# Предзагружается выбор, вероятность которого не ниже этой
+PREFETCH_MIN_CONFIDENCE = float(os.getenv("PREFETCH_MIN_CONFIDENCE", "0.5"))
+# Файлы больше этого размера не предзагружаются (MB)
+PREFETCH_MAX_SIZE_MB = int(os.getenv("PREFETCH_MAX_SIZE_MB", "300"))
+# Сколько предзагрузка ждет нажатия (секунды), потом отменяется
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "300"))
+# Сколько хранится статистика выборов (секунды)
+PICKS_TTL = 90 * 24 * 3600
+# Вес общей статистики в оценке для пользователя (в выборах): у нового
+# пользователя оценка общая, с ростом истории важнее его собственные выборы
+GLOBAL_PRIOR = 3
+
+
+class ChoiceStats:
+    """Сколько раз выбирался каждый вариант: каждым пользователем и всеми (в общем хранилище)."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, user_id: int, choice: str):
+        self.store.incr(f"picks:{user_id}:{choice}", ttl=PICKS_TTL)
+        self.store.incr(f"picks:all:{choice}", ttl=PICKS_TTL)
+
+    def predict(self, user_id: int, choices: list[str]) -> tuple[str | None, float]:
+        """
+        Самый вероятный выбор из choices.
+
+        Вероятность - доля выборов пользователя, сглаженная общей
+        статистикой: (свои + GLOBAL_PRIOR * общая доля) / (всего своих + GLOBAL_PRIOR).
+
+        Returns:
+            tuple: (выбор, вероятность) или (None, 0.0), если статистики нет
+        """
+        own = {choice: int(self.store.get(f"picks:{user_id}:{choice}") or 0) for choice in choices}
+        common = {choice: int(self.store.get(f"picks:all:{choice}") or 0) for choice in choices}
+        own_total, common_total = sum(own.values()), sum(common.values())
+        if not common_total:
+            return None, 0.0
+        scores = {
+            choice: (own[choice] + GLOBAL_PRIOR * common[choice] / common_total) / (own_total + GLOBAL_PRIOR)
+            for choice in choices
+        }
+        best = max(scores, key=scores.get)
+        return best, scores[best]
+
+
+class Prefetch:
+    """
+    Одна предзагрузка: выбор, место на диске и задача в очереди загрузок.
+
+    Результат задачи - то же, что у download_video: (путь к файлу, информация).
+    """
+
+    def __init__(self, key: str, choice: str, space, cancel):
+        self.key = key
+        self.choice = choice
+        self.space = space
+        self.cancel = cancel  # Флаг отмены для download_video (backend.shared_value)
+        self.job = None
+        self.reporter = None  # ProgressReporter: показывает прогресс после нажатия
+        self.progress_gate = None  # Включает передачу прогресса в reporter (backend.progress_hook)
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self.adopted = False
+        self.expiry: asyncio.TimerHandle | None = None
+
+    async def result(self) -> tuple[str, dict]:
+        return await self.job.wait()
+
+
+class Prefetcher:
+    """Запуск, передача нажатию и отмена предзагрузок (не больше одной на видео)."""
+
+    def __init__(self, scheduler, storage, store, make_value, enabled: bool = PREFETCH,
+                 min_confidence: float = PREFETCH_MIN_CONFIDENCE, ttl: float = PREFETCH_TTL):
+        """
+        Args:
+            scheduler: Очередь загрузок (DownloadScheduler)
+            storage: Квота на диск (StorageManager)
+            store: Общее хранилище - для статистики выборов
+            make_value: Фабрика флага отмены, видимого процессам пула (backend.shared_value)
+        """
+        self.scheduler = scheduler
+        self.storage = storage
+        self.choices = ChoiceStats(store)
+        self.make_value = make_value
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self.ttl = ttl
+        self._entries: dict[str, Prefetch] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record_pick(self, user_id: int, choice: str):
+        """Учитывает нажатие (выполняется в рабочем потоке - обращается к хранилищу)."""
+        self.choices.record(user_id, choice)
+
+    def start(self, key: str, user_id: int, choice: str, estimated_size: int, download,
+              reporter=None, progress_gate=None) -> Prefetch | None:
+        """
+        Запускает предзагрузку выбора choice для видео key, если для нее есть
+        свободный исполнитель и место на диске.
+
+        Args:
+            download: Корутина-функция download(workdir, cancel) -> (путь, информация)
+            reporter: ProgressReporter без запуска - показывает прогресс, если
+                нажатие придет до конца скачивания
+            progress_gate: Общее значение, которое включает передачу прогресса
+                в reporter при нажатии (до него прогресс не передается)
+
+        Returns:
+            Prefetch: Запущенная предзагрузка или None
+        """
+        if not self.enabled or key in self._entries:
+            return None
+        if estimated_size > PREFETCH_MAX_SIZE_MB * 1024 * 1024 or not self.scheduler.idle:
+            PREFETCH_TOTAL.inc(result="skipped")
+            return None
+        space = self.storage.job_space(estimated_size)
+        if not space.try_acquire():
+            PREFETCH_TOTAL.inc(result="skipped")
+            return None
+        prefetch = Prefetch(key, choice, space, self.make_value(0))
+        prefetch.reporter = reporter
+        prefetch.progress_gate = progress_gate
+
+        async def job():
+            return await download(space.path, prefetch.cancel)
+
+        prefetch.job = self.scheduler.submit(user_id, job, preempt=lambda: self._cancel(prefetch, "preempted"))
+        space.preempt = lambda: self._cancel(prefetch, "preempted")
+        prefetch.job.future.add_done_callback(lambda future: self._finished(prefetch, future))
+        self._entries[key] = prefetch
+        PREFETCH_TOTAL.inc(result="started")
+        log(f"⚡ Предзагрузка {key}: {choice}")
+        return prefetch
+
+    def claim(self, key: str, choice: str) -> Prefetch | None:
+        """
+        Отдает предзагрузку видео key нажатию choice.
+
+        Совпавшая предзагрузка больше не уступает место другим задачам;
+        освободить ее space (или вернуть через drop()) - забота вызывающего.
+        Несовпавшая отменяется.
+
+        Returns:
+            Prefetch: Предзагрузка выбора choice (возможно, еще скачивается) или None
+        """
+        prefetch = self._entries.get(key)
+        if prefetch is None:
+            return None
+        if prefetch.choice != choice:
+            self._cancel(prefetch, "miss")
+            return None
+        del self._entries[key]
+        if prefetch.expiry is not None:
+            prefetch.expiry.cancel()
+        prefetch.job.preempt = prefetch.space.preempt = None
+        prefetch.adopted = True
+        saved = (prefetch.finished or time.monotonic()) - prefetch.started
+        PREFETCH_TOTAL.inc(result="hit")
+        PREFETCH_SAVED_SECONDS.inc(saved)
+        log(f"⚡ Предзагрузка {key} пригодилась: {prefetch.choice}, выиграно {saved:.1f}с")
+        return prefetch
+
+    def cancel(self, key: str, result: str = "miss"):
+        """Отменяет предзагрузку видео key, если она есть."""
+        prefetch = self._entries.get(key)
+        if prefetch is not None:
+            self._cancel(prefetch, result)
+
+    def drop(self, prefetch: Prefetch):
+        """Отменяет полученную через claim() предзагрузку, которая не понадобилась."""
+        if prefetch.job.future.done():
+            prefetch.space.release()
+        elif not self.scheduler.cancel(prefetch.job):
+            prefetch.cancel.value = 1
+            prefetch.job.future.add_done_callback(lambda future: self._dropped(prefetch, future))
+
+    @staticmethod
+    def _dropped(prefetch: Prefetch, future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()  # Ошибка отмены ожидаема
+        prefetch.space.release()
+
+    def _cancel(self, prefetch: Prefetch, result: str):
+        """Отменяет предзагрузку; место освобождается, когда скачивание прервется."""
+        if self._entries.get(prefetch.key) is not prefetch:
+            return
+        del self._entries[prefetch.key]
+        if prefetch.expiry is not None:
+            prefetch.expiry.cancel()
+        prefetch.job.preempt = prefetch.space.preempt = None
+        PREFETCH_TOTAL.inc(result=result)
+        log(f"⚡ Предзагрузка {prefetch.key} отменена ({result})")
+        if prefetch.job.future.done():
+            prefetch.space.release()
+        elif not self.scheduler.cancel(prefetch.job):
+            # Уже скачивается - download_video прервется на ближайшем обновлении прогресса
+            prefetch.cancel.value = 1
+
+    def _finished(self, prefetch: Prefetch, future: asyncio.Future):
+        prefetch.finished = time.monotonic()
+        if prefetch.adopted:
+            return  # Результат ждет нажатие
+        error = future.exception() if not future.cancelled() else None
+        if self._entries.get(prefetch.key) is not prefetch:
+            # Отменена во время скачивания - скачанное больше не нужно
+            prefetch.space.release()
+            return
+        if future.cancelled() or error is not None:
+            del self._entries[prefetch.key]
+            prefetch.space.release()
+            PREFETCH_TOTAL.inc(result="failed")
+            log(f"⚡ Предзагрузка {prefetch.key} не удалась: {error}")
+            return
+        prefetch.expiry = asyncio.get_running_loop().call_later(
+            self.ttl, self._cancel, prefetch, "expired"
+        )
+
+    def stats(self) -> dict:
+        """Предзагрузки по результату и доля попаданий среди нажатий."""
+        counts = {key[0]: int(value) for key, value in PREFETCH_TOTAL.values().items()}
+        resolved = sum(counts.get(result, 0) for result in ("hit", "miss", "expired"))
+        return {
+            'enabled': self.enabled,
+            'active': len(self._entries),
+            'started': counts.get("started", 0),
+            'hit': counts.get("hit", 0),
+            'miss': counts.get("miss", 0),
+            'expired': counts.get("expired", 0),
+            'preempted': counts.get("preempted", 0),
+            'hit_rate': counts.get("hit", 0) / resolved if resolved else 0.0,
+        }
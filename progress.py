@@ -0,0 +1,163 @@
+"""
+Прогресс скачивания в сообщении пользователя.
+
+yt-dlp вызывает progress_hooks в рабочем потоке (или процессе). Хук только
+запоминает последнее состояние и ничего не ждет, а отдельная задача в
+event loop раз в PROGRESS_INTERVAL секунд редактирует сообщение, если текст
+изменился. Так промежуточные обновления объединяются, лимиты Telegram на
+редактирование соблюдаются, а медленный чат не тормозит скачивание.
+"""
+import asyncio
+import os
+import queue
+import time
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from retry import retry_after_seconds
+
+# Как часто обновлять сообщение с прогрессом (секунды)
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "3"))
+# Общий лимит редактирований в секунду для всех чатов
+PROGRESS_EDITS_PER_SEC = float(os.getenv("PROGRESS_EDITS_PER_SEC", "20"))
+# Сколько ждать ответа Telegram на редактирование
+EDIT_TIMEOUT = 10
+
+
+class _EditRateLimiter:
+    """Общий для всех сообщений лимит частоты редактирований."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1 / per_second if per_second > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+_rate_limiter: _EditRateLimiter | None = None
+
+
+def _get_rate_limiter() -> _EditRateLimiter:
+    # Создается лениво, внутри работающего event loop
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = _EditRateLimiter(PROGRESS_EDITS_PER_SEC)
+    return _rate_limiter
+
+
+def _format_size(size: float) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def _format_eta(seconds) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def render_progress(snapshot: dict) -> str:
+    """Строка прогресса: полоса, проценты, скорость и оставшееся время."""
+    kind = "🎵 Аудио" if snapshot.get('audio') else "📥 Скачано"
+    if snapshot.get('status') == 'finished':
+        return f"{kind}: 100% - обработка..."
+    total = snapshot.get('total') or 0
+    downloaded = snapshot.get('downloaded') or 0
+    speed = f"{_format_size(snapshot['speed'])}/с" if snapshot.get('speed') else "?"
+    if not total:
+        return f"{kind}: {_format_size(downloaded)} • {speed}"
+    percent = min(downloaded / total * 100, 100)
+    filled = int(percent // 10)
+    bar = "▓" * filled + "░" * (10 - filled)
+    return (
+        f"{kind}: [{bar}] {percent:.0f}%\n"
+        f"⚡ {speed} • ⏱ осталось ~{_format_eta(snapshot.get('eta'))}"
+    )
+
+
+def render_batch(snapshot: dict) -> str:
+    """Общий прогресс пакетной загрузки."""
+    total = snapshot.get('total') or 0
+    done = snapshot.get('done') or 0
+    filled = int(done / total * 10) if total else 0
+    bar = "▓" * filled + "░" * (10 - filled)
+    text = f"📦 [{bar}] {done} из {total}\n⏬ Скачивается: {snapshot.get('active') or 0}"
+    if snapshot.get('failed'):
+        text += f" • ❌ Ошибок: {snapshot['failed']}"
+    return text
+
+
+class ProgressReporter:
+    """
+    Показывает прогресс скачивания в сообщении.
+
+    update() можно вызывать из любого потока; сообщение редактируется
+    только из event loop и не чаще, чем раз в interval секунд.
+    """
+
+    def __init__(self, edit, header: str, interval: float = PROGRESS_INTERVAL, render=render_progress):
+        """
+        Args:
+            edit: Корутина-функция edit(text), например query.edit_message_text
+            header: Текст над строкой прогресса
+            interval: Минимальный интервал между редактированиями
+            render: Функция render(snapshot) -> str, строка прогресса
+        """
+        self.edit = edit
+        self.header = header
+        self.interval = interval
+        self.render = render
+        self.channel = None  # Очередь от процесса пула (если используется)
+        self._latest: dict | None = None
+        self._shown = ""
+        self._task: asyncio.Task | None = None
+
+    def update(self, snapshot: dict):
+        """Запоминает последнее состояние (вызывается из рабочего потока)."""
+        self._latest = snapshot
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _drain_channel(self):
+        # Забираем все накопившиеся состояния, оставляем последнее
+        try:
+            while True:
+                self._latest = self.channel.get_nowait()
+        except (queue.Empty, EOFError, OSError):
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.channel is not None:
+                await asyncio.to_thread(self._drain_channel)
+            if self._latest is None:
+                continue
+            text = f"{self.header}\n\n{self.render(self._latest)}"
+            if text == self._shown:
+                continue
+            await _get_rate_limiter().acquire()
+            try:
+                await asyncio.wait_for(self.edit(text), timeout=EDIT_TIMEOUT)
+                self._shown = text
+            except RetryAfter as e:
+                await asyncio.sleep(retry_after_seconds(e))
+            except (BadRequest, TelegramError, asyncio.TimeoutError):
+                pass  # Пропускаем это обновление, покажем следующее
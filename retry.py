@@ -0,0 +1,261 @@
+"""
+Повторы временно неудачных вызовов и автоматы отключения (circuit breaker).
+
+Повторяются только временные ошибки: флуд-контроль Telegram (RetryAfter -
+ждем столько, сколько просит сервер) и ограничения YouTube (HTTP 429,
+"Sign in to confirm you're not a bot", сетевые сбои) - с экспоненциальной
+задержкой со случайным разбросом, чтобы задачи не повторяли запросы разом.
+
+У каждой цели (upload, edit, extraction, api) свой автомат отключения:
+после BREAKER_THRESHOLD временных ошибок подряд цель отключается на
+BREAKER_COOLDOWN секунд. Вызовы extraction в это время сразу получают
+CircuitOpenError, а не добавляют запросов к уже ограничившему нас YouTube;
+вызовы Bot API ждут окончания паузы (если она не длиннее RETRY_MAX_DELAY).
+
+Вызовы Bot API повторяет RetryingRateLimiter (подключается в
+bot_api.configure_builder), остальные - retry_call().
+"""
+import asyncio
+import os
+import random
+import re
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import CIRCUIT_OPENED_TOTAL, RETRIES_TOTAL, log
+
+# Сколько всего попыток делается для одного вызова
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "4"))
+# Начальная задержка экспоненциального повтора (секунды), дальше - x2 на каждую попытку
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+# Дольше этого не ждем: ошибка возвращается пользователю (секунды)
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# Сколько временных ошибок подряд отключают цель
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+# На сколько отключается цель (секунды)
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "120"))
+
+# Методы Bot API по целям
+UPLOAD_ENDPOINTS = {'sendVideo', 'sendAudio', 'sendDocument', 'sendMediaGroup', 'sendPhoto'}
+EDIT_ENDPOINTS = {'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+# Временные ошибки yt-dlp и сети: повтор имеет смысл
+TRANSIENT_PATTERNS = re.compile(
+    r"HTTP Error 429|Too Many Requests|HTTP Error 5\d\d|Sign in to confirm|rate.?limit"
+    r"|timed out|Connection reset|Connection refused|Remote end closed|Temporary failure"
+    r"|IncompleteRead|Read timed out",
+    re.IGNORECASE,
+)
+
+
+class CircuitOpenError(Exception):
+    """Цель временно отключена после череды временных ошибок."""
+
+    def __init__(self, target: str, retry_in: float):
+        self.target = target
+        self.retry_in = retry_in
+        minutes = max(int(retry_in + 59) // 60, 1)
+        if target == "extraction":
+            message = f"YouTube временно ограничил запросы. Попробуйте через {minutes} мин."
+        else:
+            message = f"Сервис временно недоступен ({target}). Попробуйте через {minutes} мин."
+        super().__init__(message)
+
+    def __reduce__(self):
+        return self.__class__, (self.target, self.retry_in)
+
+
+class CircuitBreaker:
+    """
+    Автомат отключения одной цели.
+
+    closed - вызовы идут; open - после threshold ошибок подряд вызовы
+    отклоняются до конца паузы; после паузы пропускается один пробный
+    вызов (half_open): успех закрывает автомат, ошибка снова открывает.
+    """
+
+    def __init__(self, target: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.target = target
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_until = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.opened_until else "half_open"
+
+    def retry_in(self) -> float:
+        """Сколько секунд до конца паузы (0 - вызов можно делать)."""
+        if self.failures < self.threshold:
+            return 0.0
+        return max(self.opened_until - time.monotonic(), 0.0)
+
+    def check(self):
+        """
+        Разрешает вызов или отклоняет его.
+
+        Raises:
+            CircuitOpenError: Если цель отключена
+        """
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError(self.target, self.retry_in())
+        if state == "half_open":
+            # Пробный вызов: остальные отклоняются, пока не станет ясен его результат
+            self.opened_until = time.monotonic() + self.cooldown
+
+    def success(self):
+        if self.failures >= self.threshold:
+            log(f"🔌 {self.target}: снова работает")
+        self.failures = 0
+
+    def failure(self, pause: float = 0.0):
+        """
+        Учитывает временную ошибку.
+
+        Args:
+            pause: Сколько просил ждать сервер - пауза не короче этого
+        """
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.failures == self.threshold:
+                CIRCUIT_OPENED_TOTAL.inc(target=self.target)
+                log(f"🔌 {self.target}: отключено после {self.failures} ошибок подряд")
+            self.opened_until = time.monotonic() + max(self.cooldown, pause)
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'retry_in': round(self.retry_in(), 1)}
+
+
+BREAKERS: dict[str, CircuitBreaker] = {}
+
+
+def breaker(target: str) -> CircuitBreaker:
+    """Автомат отключения цели (создается при первом обращении)."""
+    if target not in BREAKERS:
+        BREAKERS[target] = CircuitBreaker(target)
+    return BREAKERS[target]
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    """retry_after в секундах (в PTB это int или timedelta в зависимости от версии)."""
+    delay = exc.retry_after
+    return delay.total_seconds() if hasattr(delay, 'total_seconds') else float(delay)
+
+
+def classify(exc: BaseException) -> tuple[bool, float]:
+    """
+    Временная ли ошибка и сколько просил ждать сервер.
+
+    Returns:
+        tuple: (повторять ли, задержка от сервера в секундах или 0)
+    """
+    if isinstance(exc, RetryAfter):
+        return True, retry_after_seconds(exc)
+    if isinstance(exc, CircuitOpenError):
+        return False, 0.0
+    return bool(TRANSIENT_PATTERNS.search(str(exc))), 0.0
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Экспоненциальная задержка попытки attempt (с 0) с разбросом от половины до полной."""
+    delay = min(cap, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+async def retry_call(target: str, make_call, attempts: int = RETRY_ATTEMPTS, on_retry=None):
+    """
+    Выполняет await make_call(), повторяя временные ошибки.
+
+    Args:
+        target: Цель (extraction, upload, ...) - для автомата отключения и метрик
+        make_call: Функция без аргументов, возвращающая корутину; вызывается
+            заново на каждую попытку
+        attempts: Сколько всего попыток
+        on_retry: Корутина-функция on_retry(attempt, delay, exc), вызывается
+            перед ожиданием повтора (например, чтобы показать статус)
+
+    Raises:
+        CircuitOpenError: Если цель отключена
+        Exception: Последняя ошибка, если она не временная или попытки кончились
+    """
+    circuit = breaker(target)
+    for attempt in range(attempts):
+        circuit.check()
+        try:
+            result = await make_call()
+        except Exception as e:
+            retryable, pause = classify(e)
+            if not retryable:
+                # Цель ответила (например, видео недоступно) - она работает
+                circuit.success()
+                raise
+            circuit.failure(pause)
+            if circuit.state == "open":
+                # Эта ошибка отключила цель - ждать повтора бессмысленно
+                raise CircuitOpenError(target, circuit.retry_in()) from e
+            delay = max(pause, backoff_delay(attempt))
+            if attempt + 1 >= attempts or delay > RETRY_MAX_DELAY:
+                raise
+            RETRIES_TOTAL.inc(target=target, reason=type(e).__name__ if pause else "backoff")
+            log(f"🔁 {target}: попытка {attempt + 2} из {attempts} через {delay:.1f}с ({e})")
+            if on_retry is not None:
+                await on_retry(attempt + 1, delay, e)
+            await asyncio.sleep(delay)
+        else:
+            circuit.success()
+            return result
+
+
+class RetryingRateLimiter(BaseRateLimiter):
+    """
+    Повтор запросов Bot API при флуд-контроле (RetryAfter).
+
+    Запрос повторяется через retry_after, если это не дольше RETRY_MAX_DELAY.
+    Пока цель отключена автоматом, новые запросы ждут конца паузы (пробного
+    вызова здесь нет - после паузы идут все). Другие ошибки PTB не
+    повторяются: например, после TimedOut файл мог уже дойти.
+    """
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @staticmethod
+    def target(endpoint: str) -> str:
+        if endpoint in UPLOAD_ENDPOINTS:
+            return "upload"
+        if endpoint in EDIT_ENDPOINTS:
+            return "edit"
+        return "api"
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        target = self.target(endpoint)
+        circuit = breaker(target)
+        attempts = (rate_limit_args or {}).get('attempts', RETRY_ATTEMPTS)
+        for attempt in range(attempts):
+            wait = circuit.retry_in()
+            if wait > RETRY_MAX_DELAY:
+                raise RetryAfter(int(wait) + 1)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                pause = retry_after_seconds(e)
+                circuit.failure(pause)
+                if attempt + 1 >= attempts or pause > RETRY_MAX_DELAY:
+                    raise
+                RETRIES_TOTAL.inc(target=target, reason="RetryAfter")
+                log(f"🔁 {endpoint}: флуд-контроль, повтор через {pause:.0f}с")
+                await asyncio.sleep(pause)
+            else:
+                circuit.success()
+                return result
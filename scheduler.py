@@ -0,0 +1,243 @@
+"""
+Планировщик загрузок.
+
+Ограничивает число одновременных загрузок (глобально и на пользователя),
+держит ограниченную очередь ожидания и выбирает следующую задачу
+по порядку поступления (fifo) или поровну между пользователями (fair).
+
+Спекулятивные задачи (с preempt, например предзагрузка) уступают место
+обычным: если обычной задаче не хватает исполнителя, у спекулятивной
+вызывается preempt(), и она должна быстро завершиться.
+"""
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+
+from metrics import STAGE_SECONDS
+
+# Настройки очереди
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+PER_USER_JOBS = int(os.getenv("PER_USER_JOBS", "1"))
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "50"))
+MAX_QUEUED_PER_USER = int(os.getenv("MAX_QUEUED_PER_USER", "5"))
+QUEUE_POLICY = os.getenv("QUEUE_POLICY", "fair")  # fifo или fair
+
+
+class QueueFullError(Exception):
+    """Очередь загрузок переполнена - задача не принята."""
+
+
+class Job:
+    """Задача в очереди загрузок."""
+
+    def __init__(self, job_id: int, user_id: int, func, on_position=None, limit: int = PER_USER_JOBS,
+                 preempt=None):
+        self.id = job_id
+        self.user_id = user_id
+        self.func = func
+        self.limit = limit  # Сколько задач пользователя может выполняться одновременно
+        self.on_position = on_position
+        # Для спекулятивной задачи - просит ее завершиться и уступить место (None - обычная задача)
+        self.preempt = preempt
+        self.position = 0
+        self.started = False
+        self.submitted = time.monotonic()
+        # Контекст отправителя (ID трассировки) - задача выполняется в нем же
+        self.context = contextvars.copy_context()
+        self.future = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        """Ждет завершения задачи и возвращает ее результат."""
+        return await self.future
+
+
+class DownloadScheduler:
+    """
+    Очередь загрузок с глобальным и пользовательским ограничением.
+
+    func задачи - функция без аргументов, возвращающая корутину.
+    on_position(position) вызывается, когда меняется позиция задачи
+    в очереди (0 - задача запущена).
+    """
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, per_user: int = PER_USER_JOBS,
+                 max_queue: int = MAX_QUEUE_SIZE, max_queued_per_user: int = MAX_QUEUED_PER_USER,
+                 policy: str = QUEUE_POLICY):
+        if policy not in ("fifo", "fair"):
+            raise ValueError(f"Неизвестная политика очереди: {policy}")
+        self.workers = workers
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.policy = policy
+        self._pending: list[Job] = []
+        self._running: dict[int, int] = {}  # user_id -> число запущенных задач
+        self._active = 0
+        self._ids = itertools.count(1)
+        self._served = itertools.count(1)
+        self._last_served: dict[int, int] = {}  # user_id -> номер последней выдачи
+        self._tasks: set[asyncio.Task] = set()
+        self._started: set[Job] = set()
+
+    @property
+    def active(self) -> int:
+        """Число выполняющихся задач."""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Число задач в очереди ожидания."""
+        return len(self._pending)
+
+    @property
+    def idle(self) -> bool:
+        """Есть свободный исполнитель и никто не ждет в очереди."""
+        return self._active < self.workers and not self._pending
+
+    def submit(self, user_id: int, func, on_position=None, limit: int | None = None, preempt=None) -> Job:
+        """
+        Ставит задачу в очередь.
+
+        limit - свой лимит одновременных задач пользователя для этой задачи
+        (например, для пакетных загрузок); по умолчанию per_user.
+        preempt - функция без аргументов для спекулятивной задачи: вызывается,
+        когда ее место нужно обычной задаче.
+
+        Raises:
+            QueueFullError: Если очередь (общая или пользователя) переполнена
+        """
+        if len(self._pending) >= self.max_queue:
+            raise QueueFullError("Очередь загрузок переполнена, попробуйте позже")
+        user_queued = sum(1 for job in self._pending if job.user_id == user_id)
+        if user_queued >= self.max_queued_per_user:
+            raise QueueFullError("У вас слишком много загрузок в очереди, дождитесь их завершения")
+
+        job = Job(next(self._ids), user_id, func, on_position, limit or self.per_user, preempt)
+        self._pending.append(job)
+        self._dispatch()
+        if not job.started and preempt is None:
+            self._make_room(job)
+        return job
+
+    def _make_room(self, job: Job):
+        """Просит спекулятивную задачу уступить место обычной задаче job."""
+        speculative = [running for running in self._started if running.preempt is not None]
+        if self._running.get(job.user_id, 0) >= job.limit:
+            # Пользователь уперся в свой лимит - уступает его же спекулятивная задача
+            speculative = [running for running in speculative if running.user_id == job.user_id]
+        if speculative:
+            victim = speculative[0]
+            preempt, victim.preempt = victim.preempt, None
+            preempt()
+
+    def _pick(self) -> Job | None:
+        """Выбирает следующую задачу, которую можно запустить."""
+        eligible = [job for job in self._pending if self._running.get(job.user_id, 0) < job.limit]
+        if not eligible:
+            return None
+        if self.policy == "fifo":
+            return eligible[0]
+        # fair: сначала пользователи с меньшим числом запущенных задач,
+        # затем те, кого обслуживали давнее всего
+        return min(
+            eligible,
+            key=lambda job: (
+                self._running.get(job.user_id, 0),
+                self._last_served.get(job.user_id, 0),
+                job.id,
+            ),
+        )
+
+    def _order(self) -> list[Job]:
+        """Ожидающие задачи в том порядке, в каком они будут запущены."""
+        if self.policy == "fifo":
+            return list(self._pending)
+        # Для fair: по очереди по одной задаче каждого пользователя
+        by_user: dict[int, list[Job]] = {}
+        for job in self._pending:
+            by_user.setdefault(job.user_id, []).append(job)
+        users = sorted(by_user, key=lambda uid: (self._last_served.get(uid, 0), by_user[uid][0].id))
+        order = []
+        while any(by_user[uid] for uid in users):
+            for uid in users:
+                if by_user[uid]:
+                    order.append(by_user[uid].pop(0))
+        return order
+
+    def _dispatch(self):
+        while self._active < self.workers:
+            job = self._pick()
+            if job is None:
+                break
+            self._pending.remove(job)
+            self._active += 1
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+            self._last_served[job.user_id] = next(self._served)
+            job.started = True
+            self._started.add(job)
+            STAGE_SECONDS.observe(time.monotonic() - job.submitted, stage="queue")
+            self._spawn(self._run(job), job.context)
+            self._notify(job, 0)
+
+        for position, job in enumerate(self._order(), start=1):
+            self._notify(job, position)
+
+    def _notify(self, job: Job, position: int):
+        if job.position == position and position:
+            return
+        job.position = position
+        if job.on_position is None:
+            return
+        try:
+            result = job.on_position(position)
+            if asyncio.iscoroutine(result):
+                self._spawn(result)
+        except Exception as e:
+            print(f"⚠️ Ошибка уведомления о позиции задачи {job.id}: {e}")
+
+    def _spawn(self, coro, context=None):
+        # Храним ссылки на задачи, чтобы их не собрал сборщик мусора
+        task = asyncio.create_task(coro, context=context)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Job):
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._started.discard(job)
+            self._active -= 1
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+            self._dispatch()
+
+    def cancel(self, job: Job) -> bool:
+        """Убирает еще не запущенную задачу из очереди."""
+        if job in self._pending:
+            self._pending.remove(job)
+            job.future.cancel()
+            self._dispatch()
+            return True
+        return False
+
+    def stats(self) -> dict:
+        """Текущее состояние очереди."""
+        return {
+            'active': self._active,
+            'queued': len(self._pending),
+            'workers': self.workers,
+            'speculative': sum(1 for job in self._started if job.preempt is not None),
+            'policy': self.policy,
+        }
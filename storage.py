@@ -0,0 +1,458 @@
+"""
+Общее хранилище состояния для нескольких экземпляров бота.
+
+Ключ-значение с TTL и распределенной блокировкой. Значения хранятся
+в JSON. Бэкенды выбираются через STORE_URL:
+
+    memory://                 - в памяти процесса (один экземпляр, по умолчанию)
+    sqlite:///path/store.db   - файл SQLite (несколько процессов на одном хосте)
+    redis://host:6379/0       - любой сервер с протоколом Redis (кластер)
+"""
+import asyncio
+import json
+import os
+import re
+import select
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+STORE_URL = os.getenv("STORE_URL", "memory://")
+
+
+class Store(ABC):
+    """Базовый интерфейс хранилища: бэкенд обязан реализовать все абстрактные методы."""
+
+    @abstractmethod
+    def get(self, key: str):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float | None = None):
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        """Сохраняет значение, только если ключа еще нет. Returns: True, если сохранено."""
+
+    @abstractmethod
+    def delete(self, key: str, expected=None) -> bool:
+        """Удаляет ключ (если задан expected - только при совпадении значения)."""
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        """Атомарно увеличивает счетчик и возвращает новое значение."""
+
+    @abstractmethod
+    def extend(self, key: str, expected, ttl: float) -> bool:
+        """Продлевает TTL ключа, только если его значение - expected. Returns: True, если продлен."""
+
+    @abstractmethod
+    def keys(self, prefix: str) -> list[str]:
+        """Живые ключи с заданным префиксом (для статистики и сброса)."""
+
+    def purge_expired(self) -> int:
+        """
+        Удаляет просроченные записи (вызывается периодически).
+
+        Returns:
+            int: Сколько записей удалено (Redis удаляет их сам - 0)
+        """
+        return 0
+
+    def close(self):
+        pass
+
+    def lock(self, name: str, ttl: float = 900) -> "DistributedLock":
+        return DistributedLock(self, name, ttl)
+
+
+class MemoryStore(Store):
+    """Хранилище в памяти процесса."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, str]] = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, raw = item
+        if expires is not None and expires < time.time():
+            del self._data[key]
+            return None
+        return raw
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        with self._lock:
+            raw = self._alive(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self._expires(ttl), json.dumps(value))
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._alive(key) is not None:
+                return False
+            self._data[key] = (self._expires(ttl), json.dumps(value))
+            return True
+
+    def delete(self, key, expected=None):
+        with self._lock:
+            raw = self._alive(key)
+            if raw is None or (expected is not None and json.loads(raw) != expected):
+                return False
+            del self._data[key]
+            return True
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            raw = self._alive(key)
+            value = (json.loads(raw) if raw is not None else 0) + amount
+            expires = self._data[key][0] if raw is not None else self._expires(ttl)
+            self._data[key] = (expires, json.dumps(value))
+            return value
+
+    def extend(self, key, expected, ttl):
+        with self._lock:
+            raw = self._alive(key)
+            if raw is None or json.loads(raw) != expected:
+                return False
+            self._data[key] = (self._expires(ttl), raw)
+            return True
+
+    def keys(self, prefix):
+        with self._lock:
+            return [key for key in list(self._data) if key.startswith(prefix) and self._alive(key) is not None]
+
+    def purge_expired(self):
+        # Просроченные ключи иначе удаляются только при чтении
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires, _) in self._data.items() if expires is not None and expires < now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class SQLiteStore(Store):
+    """Хранилище в файле SQLite - общее для процессов одного хоста."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def _read(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)",
+            (key, time.time()),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, key):
+        with self._lock:
+            raw = self._read(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), self._expires(ttl)),
+            )
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            # BEGIN IMMEDIATE - атомарность между процессами
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM kv WHERE key = ? AND expires < ?", (key, time.time()))
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), self._expires(ttl)),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cur.rowcount == 1
+
+    def delete(self, key, expected=None):
+        with self._lock:
+            if expected is None:
+                cur = self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            else:
+                cur = self._conn.execute(
+                    "DELETE FROM kv WHERE key = ? AND value = ?", (key, json.dumps(expected))
+                )
+            return cur.rowcount == 1
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                raw = self._read(key)
+                value = (json.loads(raw) if raw is not None else 0) + amount
+                if raw is None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), self._expires(ttl)),
+                    )
+                else:
+                    self._conn.execute("UPDATE kv SET value = ? WHERE key = ?", (json.dumps(value), key))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return value
+
+    def extend(self, key, expected, ttl):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE kv SET expires = ? WHERE key = ? AND value = ? AND (expires IS NULL OR expires >= ?)",
+                (self._expires(ttl), key, json.dumps(expected), time.time()),
+            )
+            return cur.rowcount == 1
+
+    def keys(self, prefix):
+        # Префикс сравнивается через substr, чтобы не экранировать % и _ для LIKE
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM kv WHERE substr(key, 1, ?) = ? AND (expires IS NULL OR expires >= ?)",
+                (len(prefix), prefix, time.time()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_expired(self):
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE expires < ?", (time.time(),)).rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+class RedisError(Exception):
+    """Ошибка, возвращенная сервером Redis."""
+
+
+class RedisStore(Store):
+    """Хранилище на сервере с протоколом Redis (RESP2), без внешних зависимостей."""
+
+    # Удаление ключа только если он все еще принадлежит нам
+    _DELETE_IF_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
+    # Продление ключа только если он все еще принадлежит нам
+    _EXTEND_IF_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2])"
+        " else return 0 end"
+    )
+    # Команды, которые можно повторить, если ответ на них не получен
+    _RETRYABLE = {"GET", "SCAN"}
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self._lock = threading.Lock()
+        self._sock: socket.socket | None = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=10)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", str(self.db))
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Соединение с Redis закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(payload)
+            return None if count == -1 else [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Неизвестный ответ Redis: {line!r}")
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+
+    def _call(self, *args):
+        self._send(*args)
+        return self._read_reply()
+
+    def _stale(self) -> bool:
+        # Простаивающее соединение, закрытое сервером, читается сразу (EOF)
+        readable, _, _ = select.select([self._sock], [], [], 0)
+        return bool(readable)
+
+    def command(self, *args):
+        """
+        Выполняет команду Redis.
+
+        Обрыв до отправки команды - переподключение и повтор. Если команда
+        отправлена, но ответа нет, повторяются только чтения: SET NX, INCRBY
+        или DEL могли уже выполниться.
+        """
+        with self._lock:
+            for attempt in range(2):
+                sent = False
+                try:
+                    if self._sock is not None and self._stale():
+                        self._reset()
+                    if self._sock is None:
+                        self._connect()
+                    self._send(*args)
+                    sent = True
+                    return self._read_reply()
+                except (ConnectionError, OSError):
+                    self._reset()
+                    if attempt or (sent and args[0] not in self._RETRYABLE):
+                        raise
+
+    def _reset(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    @staticmethod
+    def _px(ttl):
+        return ["PX", str(int(ttl * 1000))] if ttl else []
+
+    def get(self, key):
+        raw = self.command("GET", key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.command("SET", key, json.dumps(value), *self._px(ttl))
+
+    def add(self, key, value, ttl=None):
+        return self.command("SET", key, json.dumps(value), "NX", *self._px(ttl)) == "OK"
+
+    def delete(self, key, expected=None):
+        if expected is None:
+            return self.command("DEL", key) == 1
+        return self.command("EVAL", self._DELETE_IF_SCRIPT, "1", key, json.dumps(expected)) == 1
+
+    def extend(self, key, expected, ttl):
+        return self.command(
+            "EVAL", self._EXTEND_IF_SCRIPT, "1", key, json.dumps(expected), str(int(ttl * 1000))
+        ) == 1
+
+    def incr(self, key, amount=1, ttl=None):
+        value = self.command("INCRBY", key, str(amount))
+        if ttl and value == amount:
+            self.command("PEXPIRE", key, str(int(ttl * 1000)))
+        return value
+
+    def keys(self, prefix):
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", prefix) + "*"
+        found, cursor = set(), "0"
+        while True:
+            cursor, batch = self.command("SCAN", cursor, "MATCH", pattern, "COUNT", "500")
+            found.update(batch)
+            if cursor == "0":
+                return sorted(found)
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+
+class DistributedLock:
+    """
+    Блокировка через хранилище: ключ с TTL и уникальным владельцем.
+
+    TTL защищает от вечной блокировки, если экземпляр упал, не сняв ее;
+    пока блокировка нужна, ее продлевает keep() (поэтому TTL может быть коротким).
+    """
+
+    def __init__(self, store: Store, name: str, ttl: float = 900):
+        self.store = store
+        self.key = f"lock:{name}"
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+        self.keeper: asyncio.Task | None = None  # Задача keep(), если запущена
+
+    def try_acquire(self) -> bool:
+        self.acquired = self.store.add(self.key, self.token, self.ttl)
+        return self.acquired
+
+    def renew(self) -> bool:
+        """Продлевает блокировку еще на ttl. Returns: False, если она уже не наша."""
+        if self.acquired:
+            self.acquired = self.store.extend(self.key, self.token, self.ttl)
+        return self.acquired
+
+    async def keep(self):
+        """Продлевает блокировку каждую треть TTL, пока она захвачена."""
+        while self.acquired:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await asyncio.to_thread(self.renew)
+            except Exception as e:
+                print(f"⚠️ Не удалось продлить блокировку {self.key}: {e}")
+
+    def release(self):
+        if self.acquired:
+            self.store.delete(self.key, expected=self.token)
+            self.acquired = False
+
+
+def create_store(url: str = STORE_URL) -> Store:
+    """Создает хранилище по STORE_URL."""
+    scheme = urlsplit(url).scheme
+    if scheme == "memory":
+        return MemoryStore()
+    if scheme == "sqlite":
+        # sqlite:///relative.db или sqlite:////absolute/path.db
+        return SQLiteStore(url[len("sqlite:///"):] or "store.db")
+    if scheme in ("redis", "rediss"):
+        if scheme == "rediss":
+            raise ValueError("TLS (rediss://) не поддерживается, используйте redis://")
+        return RedisStore(url)
+    raise ValueError(f"Неизвестный STORE_URL: {url}")
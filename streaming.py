@@ -0,0 +1,180 @@
+"""
+Потоковая загрузка в Telegram.
+
+Данные читаются из источника (прямая http-ссылка или вывод ffmpeg) и сразу
+отправляются в Bot API в multipart-запросе через ограниченный буфер.
+Файл целиком не попадает ни на диск, ни в память, а отправка начинается,
+пока скачивание еще идет. Склейка видео с аудио и перекодирование в MP3
+выполняются ffmpeg в конвейере, без отдельного прохода по файлу.
+"""
+import asyncio
+import json
+import os
+import re
+import uuid
+
+import httpx
+from telegram import Message
+
+# Включение потоковой загрузки и размер буфера
+STREAM_UPLOAD = os.getenv("STREAM_UPLOAD", "0") == "1"
+STREAM_BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", "16"))
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_END = object()
+
+
+class StreamTooLargeError(Exception):
+    """Поток превысил допустимый размер файла."""
+
+
+def _ffmpeg_command(plan: dict) -> list[str]:
+    """Команда ffmpeg, пишущая результат в stdout."""
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    for source in plan['sources']:
+        headers = ''.join(f'{k}: {v}\r\n' for k, v in source['headers'].items())
+        if headers:
+            cmd += ['-headers', headers]
+        cmd += ['-i', source['url']]
+    if plan['mode'] == 'mp3':
+        cmd += ['-vn', '-c:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3']
+    else:
+        for index in range(len(plan['sources'])):
+            cmd += ['-map', str(index)]
+        # Фрагментированный mp4 можно писать в канал без перемотки
+        cmd += ['-c', 'copy', '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov']
+    return cmd + ['pipe:1']
+
+
+async def _http_source(plan: dict, queue: asyncio.Queue):
+    source = plan['sources'][0]
+    async with httpx.AsyncClient(follow_redirects=True, timeout=httpx.Timeout(30.0)) as client:
+        async with client.stream('GET', source['url'], headers=source['headers']) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                await queue.put(chunk)
+
+
+async def _ffmpeg_source(plan: dict, queue: asyncio.Queue):
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_command(plan),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        while True:
+            chunk = await process.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            await queue.put(chunk)
+        stderr = await process.stderr.read()
+        if await process.wait() != 0:
+            raise Exception(f"ffmpeg завершился с ошибкой: {stderr.decode(errors='replace').strip()}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def _produce(plan: dict, queue: asyncio.Queue):
+    """Заполняет буфер данными источника; в конце кладет _END или исключение."""
+    try:
+        if plan['mode'] == 'direct':
+            await _http_source(plan, queue)
+        else:
+            await _ffmpeg_source(plan, queue)
+    except Exception as e:
+        await queue.put(e)
+    else:
+        await queue.put(_END)
+
+
+def _safe_filename(title: str, ext: str) -> str:
+    name = re.sub(r'[\\/:*?"<>|\r\n]+', '_', title).strip() or 'video'
+    return f"{name[:100]}.{ext}"
+
+
+async def _multipart_body(boundary: str, fields: dict, file_field: str, filename: str,
+                          queue: asyncio.Queue, max_size: int):
+    """Тело multipart-запроса: поля формы, затем файл из буфера."""
+    for name, value in fields.items():
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode()
+    quoted = filename.replace('"', "'")
+    yield (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{file_field}"; filename="{quoted}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    sent = 0
+    while True:
+        item = await queue.get()
+        if item is _END:
+            break
+        if isinstance(item, Exception):
+            raise item
+        sent += len(item)
+        if sent > max_size:
+            raise StreamTooLargeError(f"Файл больше {max_size // (1024 * 1024)} MB")
+        yield item
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+async def stream_upload(bot, chat_id: int, plan: dict, caption: str, max_size: int,
+                        audio: bool = False) -> Message:
+    """
+    Скачивает файл по плану resolve_stream и одновременно отправляет его в чат.
+
+    Args:
+        bot: telegram.Bot
+        chat_id: Чат, в который отправляется файл
+        plan: Результат downloader.resolve_stream
+        caption: Подпись (HTML)
+        max_size: Максимальный размер файла; при превышении отправка прерывается
+        audio: Отправить как аудио (sendAudio), иначе как видео (sendVideo)
+
+    Returns:
+        Message: Отправленное сообщение
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+    producer = asyncio.create_task(_produce(plan, queue))
+
+    fields = {'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'}
+    if plan.get('duration'):
+        fields['duration'] = int(plan['duration'])
+    if audio:
+        method, file_field = 'sendAudio', 'audio'
+        fields['title'] = plan['title']
+    else:
+        method, file_field = 'sendVideo', 'video'
+        fields['supports_streaming'] = 'true'
+
+    boundary = uuid.uuid4().hex
+    body = _multipart_body(
+        boundary, fields, file_field, _safe_filename(plan['title'], plan['ext']), queue, max_size
+    )
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=300.0)) as client:
+            response = await client.post(
+                f"{bot.base_url}/{method}",
+                content=body,
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            )
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        data = response.json()
+    except json.JSONDecodeError:
+        raise Exception(f"Некорректный ответ Bot API: HTTP {response.status_code}")
+    if not data.get('ok'):
+        raise Exception(f"Bot API: {data.get('description', response.status_code)}")
+    return Message.de_json(data['result'], bot)
@@ -0,0 +1,289 @@
+"""
+Заглушка сервера Bot API для локальной проверки без Telegram.
+
+Принимает те же запросы, что и telegram-bot-api (в том числе с --local -
+файлы по пути file://), отвечает правдоподобными объектами и считает
+вызовы и загруженные байты:
+
+    python stub_bot_api.py --port 8081 --max-upload-mb 2000
+    BOT_API_URL=http://127.0.0.1:8081 BOT_API_LOCAL=1 MAX_FILE_SIZE_MB=2000 python main.py
+
+Статистика: GET /stub/stats. Класс StubBotApi можно запускать и в своем
+event loop (например, в бенчмарке).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from web_server import HttpServer, Response
+
+MB = 1024 * 1024
+
+# Метод отправки файла -> поле с файлом
+MEDIA_METHODS = {'sendVideo': 'video', 'sendAudio': 'audio', 'sendDocument': 'document'}
+
+
+class StubError(Exception):
+    """Ошибка Bot API, которую заглушка возвращает клиенту."""
+
+    def __init__(self, code: int, description: str, retry_after: int = 0):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+def parse_params(content_type: str, body: bytes, query: dict) -> tuple[dict, dict]:
+    """
+    Параметры и файлы запроса Bot API (json, form-urlencoded или multipart).
+
+    Returns:
+        tuple: (параметры, файлы: имя поля -> содержимое)
+    """
+    params = {key: values[0] for key, values in query.items()}
+    files = {}
+    if content_type.startswith('application/json'):
+        params.update(json.loads(body or b'{}'))
+    elif content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if part.get_filename() is not None:
+                files[name] = payload
+            else:
+                params[name] = payload.decode()
+    elif body:
+        params.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+    return params, files
+
+
+class StubBotApi:
+    """Заглушка Bot API на HttpServer."""
+
+    def __init__(self, max_upload_mb: int = 2000, latency: float = 0.0, local: bool = True,
+                 flood_every: int = 0):
+        """
+        Args:
+            max_upload_mb: Максимальный размер принимаемого файла
+            latency: Задержка ответа на каждый вызов (секунды)
+            local: Принимать файлы по пути file:// (как telegram-bot-api --local)
+            flood_every: Отвечать флуд-контролем (429, retry_after 1с) на каждую
+                flood_every-ю отправку файла; 0 - никогда
+        """
+        self.max_upload = max_upload_mb * MB
+        self.latency = latency
+        self.local = local
+        self.flood_every = flood_every
+        self.floods = 0
+        self._media_calls = 0
+        self.calls: dict[str, int] = {}
+        self.uploads = 0
+        self.local_uploads = 0
+        self.uploaded_bytes = 0
+        # Последний текст, отправленный или записанный в сообщение, по чатам
+        self.last_text: dict[int, str] = {}
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        # Тело принимается с запасом, чтобы на слишком большой файл ответить ошибкой Bot API
+        self.server = HttpServer(max_body_size=self.max_upload * 2 + MB)
+        self.server.add_route("POST", "/bot*", self._handle)
+        self.server.add_route("GET", "/bot*", self._handle)
+        self.server.add_route("GET", "/stub/stats", self._stats)
+
+    @property
+    def port(self) -> int | None:
+        return self.server.port
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        await self.server.start(host, port)
+
+    async def stop(self):
+        await self.server.stop()
+
+    def stats(self) -> dict:
+        """Счетчики вызовов и загрузок."""
+        return {
+            'calls': dict(self.calls),
+            'uploads': self.uploads,
+            'local_uploads': self.local_uploads,
+            'uploaded_bytes': self.uploaded_bytes,
+            'floods': self.floods,
+        }
+
+    async def _stats(self, request):
+        return Response.json(self.stats())
+
+    async def _handle(self, request):
+        _token, _, method = request.path[len("/bot"):].partition("/")
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            params, files = parse_params(request.headers.get('content-type', ''), request.body, request.query)
+            handler = getattr(self, f"_api_{method}", None)
+            if handler is None:
+                raise StubError(404, "Not Found: method not found")
+            result = await handler(params, files)
+        except StubError as e:
+            body = {'ok': False, 'error_code': e.code, 'description': e.description}
+            if e.retry_after:
+                body['parameters'] = {'retry_after': e.retry_after}
+            return Response.json(body, e.code)
+        return Response.json({'ok': True, 'result': result})
+
+    # --- Вспомогательные объекты ---
+
+    def _message(self, params: dict, **extra) -> dict:
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id') or 1), 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Stub'},
+        }
+        message.update(extra)
+        return message
+
+    def _file_size(self, value: str, files: dict) -> int:
+        """Размер отправляемого файла; для уже загруженного file_id - 0."""
+        if value.startswith('attach://'):
+            value = value[len('attach://'):]
+        if value in files:
+            size = len(files[value])
+            self.uploads += 1
+        elif value.startswith('file://'):
+            if not self.local:
+                raise StubError(400, "Bad Request: local files are not allowed")
+            path = Path(unquote(urlsplit(value).path))
+            if not path.is_file():
+                raise StubError(400, f"Bad Request: file not found: {path}")
+            size = path.stat().st_size
+            self.local_uploads += 1
+        else:
+            return 0  # file_id
+        if size > self.max_upload:
+            raise StubError(400, "Bad Request: file is too big")
+        self.uploaded_bytes += size
+        return size
+
+    def _media(self, kind: str, value: str, files: dict, params: dict) -> dict:
+        size = self._file_size(value, files)
+        if size:
+            file_id = f"stub-{kind}-{next(self._file_ids)}"
+        else:
+            file_id = value
+        media = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': size}
+        duration = int(float(params.get('duration') or 0))
+        if kind == 'video':
+            media.update({'width': 1280, 'height': 720, 'duration': duration})
+        elif kind == 'audio':
+            media.update({'duration': duration, 'title': params.get('title')})
+        return media
+
+    # --- Методы Bot API ---
+
+    async def _api_getMe(self, params, files):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+
+    async def _api_getUpdates(self, params, files):
+        await asyncio.sleep(min(float(params.get('timeout') or 0), 10))
+        return []
+
+    async def _api_setWebhook(self, params, files):
+        return True
+
+    async def _api_deleteWebhook(self, params, files):
+        return True
+
+    async def _api_answerCallbackQuery(self, params, files):
+        return True
+
+    async def _api_sendChatAction(self, params, files):
+        return True
+
+    async def _api_sendMessage(self, params, files):
+        message = self._message(params, text=params.get('text', ''))
+        self.last_text[message['chat']['id']] = message['text']
+        return message
+
+    async def _api_editMessageText(self, params, files):
+        message = self._message(params, text=params.get('text', ''))
+        self.last_text[message['chat']['id']] = message['text']
+        return message
+
+    def _check_flood(self):
+        self._media_calls += 1
+        if self.flood_every and self._media_calls % self.flood_every == 0:
+            self.floods += 1
+            raise StubError(429, "Too Many Requests: retry after 1", retry_after=1)
+
+    async def _send_media(self, method, params, files):
+        self._check_flood()
+        kind = MEDIA_METHODS[method]
+        value = params.get(kind) or (kind if kind in files else '')
+        if not value:
+            raise StubError(400, f"Bad Request: there is no {kind} in the request")
+        media = self._media(kind, value, files, params)
+        return self._message(params, caption=params.get('caption'), **{kind: media})
+
+    async def _api_sendVideo(self, params, files):
+        return await self._send_media('sendVideo', params, files)
+
+    async def _api_sendAudio(self, params, files):
+        return await self._send_media('sendAudio', params, files)
+
+    async def _api_sendDocument(self, params, files):
+        return await self._send_media('sendDocument', params, files)
+
+    async def _api_sendMediaGroup(self, params, files):
+        self._check_flood()
+        items = params.get('media')
+        if isinstance(items, str):
+            items = json.loads(items)
+        if not items or not 2 <= len(items) <= 10:
+            raise StubError(400, "Bad Request: media group must contain 2-10 items")
+        messages = []
+        for item in items:
+            kind = item.get('type', 'document')
+            media = self._media(kind, item['media'], files, item)
+            messages.append(self._message(params, caption=item.get('caption'), **{kind: media}))
+        return messages
+
+
+async def _serve(args):
+    stub = StubBotApi(args.max_upload_mb, args.latency_ms / 1000, local=not args.no_local,
+                      flood_every=args.flood_every)
+    await stub.start(args.host, args.port)
+    print(f"Заглушка Bot API: http://{args.host}:{stub.port} (лимит файла {args.max_upload_mb}MB)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка сервера Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--max-upload-mb', type=int, default=2000, help='Максимальный размер файла')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Задержка каждого ответа')
+    parser.add_argument('--no-local', action='store_true', help='Не принимать файлы по пути file://')
+    parser.add_argument('--flood-every', type=int, default=0,
+                        help='Отвечать 429 на каждую N-ю отправку файла (проверка повторов)')
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Медиасервер-заглушка с ограничением скорости каждого соединения.
+
+Отдает сгенерированные файлы так, как их отдает YouTube: прогрессивный
+файл с поддержкой Range и HLS-плейлист из фрагментов. Каждое соединение
+ограничено по скорости, поэтому видно, сколько дают параллельные фрагменты
+и Range-запросы (см. bench.py --engine):
+
+    python stub_media.py --port 8090 --size-mb 50 --per-connection-mbps 16
+    http://127.0.0.1:8090/video.mp4, http://127.0.0.1:8090/stream.m3u8
+
+Соединения keep-alive: клиент с пулом соединений не платит за новое
+подключение на каждый запрос. Счетчики: GET /stats.
+"""
+import argparse
+import asyncio
+import json
+import re
+
+MB = 1024 * 1024
+# Шаг отправки данных
+WRITE_CHUNK = 64 * 1024
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+SEGMENT_RE = re.compile(r'^/seg/(\d+)\.ts$')
+
+
+class StubMediaServer:
+    """HTTP/1.1 сервер с файлами заданного размера и лимитом скорости соединения."""
+
+    def __init__(self, size_mb: float = 50, per_connection_mbps: float = 16,
+                 segments: int = 50, latency: float = 0.0):
+        """
+        Args:
+            size_mb: Размер файла (и всех фрагментов HLS вместе)
+            per_connection_mbps: Лимит скорости одного соединения (Мбит/с), 0 - без лимита
+            segments: Число фрагментов HLS
+            latency: Задержка перед ответом на каждый запрос (секунды)
+        """
+        self.size = int(size_mb * MB)
+        self.rate = per_connection_mbps * 1_000_000 / 8
+        self.segments = segments
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def port(self) -> int | None:
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {'connections': self.connections, 'requests': self.requests, 'bytes_sent': self.bytes_sent}
+
+    def _segment_size(self, index: int) -> int:
+        base = self.size // self.segments
+        return base + (self.size - base * self.segments if index == self.segments - 1 else 0)
+
+    def _playlist(self) -> bytes:
+        duration = 4
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{duration}', '#EXT-X-MEDIA-SEQUENCE:0']
+        for index in range(self.segments):
+            lines += [f'#EXTINF:{duration}.0,', f'/seg/{index}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        return ('\n'.join(lines) + '\n').encode()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self.connections += 1
+        # Лимит на соединение: учитываются все ответы, отправленные по нему
+        state = {'sent': 0, 'started': asyncio.get_running_loop().time()}
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, method, path.split('?')[0], headers, keep_alive, state)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Клиент отключился или сервер останавливается
+        finally:
+            writer.close()
+            self._tasks.discard(task)
+
+    async def _respond(self, writer, method: str, path: str, headers: dict, keep_alive: bool, state: dict):
+        if path == '/video.mp4':
+            size, content_type = self.size, 'video/mp4'
+        elif path == '/stream.m3u8':
+            body = self._playlist()
+            await self._send(writer, 200, 'application/vnd.apple.mpegurl', body, keep_alive)
+            return
+        elif SEGMENT_RE.match(path) and int(SEGMENT_RE.match(path).group(1)) < self.segments:
+            size, content_type = self._segment_size(int(SEGMENT_RE.match(path).group(1))), 'video/mp2t'
+        elif path == '/stats':
+            await self._send(writer, 200, 'application/json', json.dumps(self.stats()).encode(), keep_alive)
+            return
+        else:
+            await self._send(writer, 404, 'text/plain', b'not found', keep_alive)
+            return
+
+        start, end, status = 0, size - 1, 200
+        match = RANGE_RE.match(headers.get('range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                await self._send(writer, 416, 'text/plain', b'', keep_alive, {'Content-Range': f'bytes */{size}'})
+                return
+            status = 206
+        length = end - start + 1
+        extra = {'Accept-Ranges': 'bytes'}
+        if status == 206:
+            extra['Content-Range'] = f'bytes {start}-{end}/{size}'
+        self._write_head(writer, status, content_type, length, keep_alive, extra)
+        if method == 'HEAD':
+            await writer.drain()
+            return
+        chunk = b'\0' * WRITE_CHUNK
+        remaining = length
+        loop = asyncio.get_running_loop()
+        while remaining > 0:
+            step = min(WRITE_CHUNK, remaining)
+            writer.write(chunk[:step])
+            await writer.drain()
+            remaining -= step
+            state['sent'] += step
+            self.bytes_sent += step
+            if self.rate:
+                delay = state['started'] + state['sent'] / self.rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    def _write_head(self, writer, status: int, content_type: str, length: int, keep_alive: bool,
+                    extra: dict | None = None):
+        reason = {200: 'OK', 206: 'Partial Content', 404: 'Not Found', 416: 'Range Not Satisfiable'}[status]
+        lines = [
+            f'HTTP/1.1 {status} {reason}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {length}',
+            f'Connection: {"keep-alive" if keep_alive else "close"}',
+        ]
+        lines += [f'{name}: {value}' for name, value in (extra or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def _send(self, writer, status: int, content_type: str, body: bytes, keep_alive: bool,
+                    extra: dict | None = None):
+        self._write_head(writer, status, content_type, len(body), keep_alive, extra)
+        writer.write(body)
+        await writer.drain()
+
+
+async def _serve(args):
+    server = StubMediaServer(args.size_mb, args.per_connection_mbps, args.segments, args.latency_ms / 1000)
+    await server.start(args.host, args.port)
+    print(f"Медиасервер-заглушка: http://{args.host}:{server.port}/video.mp4, /stream.m3u8 "
+          f"({args.per_connection_mbps:g} Мбит/с на соединение)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Медиасервер-заглушка с лимитом скорости соединения")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--size-mb', type=float, default=50, help='Размер файла')
+    parser.add_argument('--per-connection-mbps', type=float, default=16, help='Лимит скорости соединения')
+    parser.add_argument('--segments', type=int, default=50, help='Число фрагментов HLS')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Задержка ответа на запрос')
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Общие настройки тестов: модули бота импортируются из корня репозитория."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Временные файлы и кэш тестов - не в рабочих папках бота
+_TMP = Path(tempfile.mkdtemp(prefix="ytbot-tests-"))
+os.environ.setdefault("TEMP_DIR", str(_TMP / "temp_downloads"))
+os.environ.setdefault("FILE_CACHE_PATH", str(_TMP / "file_cache.db"))
+os.environ.setdefault("STORE_URL", "memory://")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,160 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+import cache
+from cache import FileIdCache, MetadataCache
+from storage import MemoryStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет часы в cache: TTL проверяется без ожидания."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: clock.now, time=lambda: clock.now))
+    return clock
+
+
+def test_ttl(clock):
+    metadata = MetadataCache(max_size=10, ttl=60)
+    metadata.put("a", {'title': "A"})
+    clock.now += 59
+    assert metadata.get("a") == {'title': "A"}
+    clock.now += 2
+    assert metadata.get("a") is None
+    assert metadata.stats()['size'] == 0
+
+
+def test_lru_eviction(clock):
+    metadata = MetadataCache(max_size=2, ttl=60)
+    metadata.put("a", {})
+    metadata.put("b", {})
+    metadata.get("a")  # "a" использовалась позже "b"
+    metadata.put("c", {})
+    assert metadata.get("b") is None
+    assert metadata.get("a") == {} and metadata.get("c") == {}
+
+
+def test_hit_after_fetch(clock):
+    metadata = MetadataCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {'title': "A"}
+
+    async def main():
+        assert await metadata.get_or_fetch("a", fetch) == {'title': "A"}
+        assert await metadata.get_or_fetch("a", fetch) == {'title': "A"}
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert (metadata.hits, metadata.misses) == (1, 1)
+
+
+def test_concurrent_requests_share_one_fetch(clock):
+    metadata = MetadataCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'title': "A"}
+
+    async def main():
+        return await asyncio.gather(*(metadata.get_or_fetch("a", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{'title': "A"}] * 5
+    assert len(calls) == 1
+    assert metadata.coalesced == 4
+
+
+def test_leader_failure_reaches_waiters_and_is_not_cached(clock):
+    metadata = MetadataCache()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("нет видео")
+
+    async def main():
+        results = await asyncio.gather(*(metadata.get_or_fetch("a", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await metadata.get_or_fetch("a", lambda: asyncio.sleep(0, {'title': "A"})) == {'title': "A"}
+
+    asyncio.run(main())
+
+
+def test_leader_cancel_does_not_cancel_waiters(clock):
+    metadata = MetadataCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'title': "A"}
+
+    async def main():
+        leader = asyncio.create_task(metadata.get_or_fetch("a", fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(metadata.get_or_fetch("a", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == [{'title': "A"}] * 2
+    assert len(calls) == 2  # Один из ожидающих извлек заново, второй дождался его
+
+
+def test_waiter_cancel_does_not_cancel_leader(clock):
+    metadata = MetadataCache()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return {'title': "A"}
+
+    async def main():
+        leader = asyncio.create_task(metadata.get_or_fetch("a", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(metadata.get_or_fetch("a", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == {'title': "A"}
+
+
+@pytest.fixture(params=["sqlite", "store"])
+def file_ids(request, tmp_path, clock):
+    if request.param == "store":
+        return FileIdCache(max_entries=2, max_age=30 * 24 * 3600, store=MemoryStore())
+    return FileIdCache(str(tmp_path / "file_cache.db"), max_entries=2, max_age=30 * 24 * 3600)
+
+
+def test_file_id_roundtrip_and_invalidate(file_ids):
+    file_ids.put("vid", "720", "FILE", "video", title="T", duration=61, filesize=10)
+    assert file_ids.get("vid", "720") == {'file_id': "FILE", 'kind': "video", 'title': "T",
+                                          'duration': 61, 'filesize': 10}
+    assert file_ids.get("vid", "audio") is None
+    assert file_ids.invalidate("vid") == 1
+    assert file_ids.get("vid", "720") is None
+
+
+def test_file_id_cap_evicts_least_recently_used(file_ids, clock):
+    for number in range(2):
+        clock.now += cache.FILE_CACHE_TOUCH_INTERVAL * 2
+        file_ids.put(f"v{number}", "720", f"F{number}", "video")
+    clock.now += cache.FILE_CACHE_TOUCH_INTERVAL * 2
+    file_ids.get("v0", "720")  # v0 использовалась позже v1
+    clock.now += cache.FILE_CACHE_TOUCH_INTERVAL * 2
+    file_ids.put("v2", "720", "F2", "video")
+    file_ids.evict()
+    assert len(file_ids) == 2
+    assert file_ids.get("v1", "720") is None
+    assert file_ids.get("v0", "720")['file_id'] == "F0"
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("telegram")
+
+from bot import parse_clip, parse_timestamp, split_clip  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1:20-2:10", (80, 130)),
+    ("80-130", (80, 130)),
+    (" 0:05-0:59 ", (5, 59)),
+    ("1:02:03-1:05:00", (3723, 3900)),
+    ("90:00-91:00", (5400, 5460)),  # Минуты без часов могут быть больше 59
+])
+def test_valid_clips(text, expected):
+    assert parse_clip(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "1:75-2:00",  # Секунды больше 59
+    "0:30-0:60",
+    "1:60:00-2:00:00",  # Минуты больше 59 при указанных часах
+    "1:00:60-1:01:00",
+    "2:10-1:20",  # Конец раньше начала
+    "1:20-1:20",
+    "1:20",
+    "a-b",
+])
+def test_invalid_clips(text):
+    assert parse_clip(text) is None
+
+
+def test_parse_timestamp_rejects_overflow():
+    with pytest.raises(ValueError):
+        parse_timestamp("1:60")
+
+
+def test_split_clip_from_url():
+    url, clip = split_clip("https://www.youtube.com/watch?v=abcdefghijk&t=1:20-2:10")
+    assert (url, clip) == ("https://www.youtube.com/watch?v=abcdefghijk", (80, 130))
+
+
+def test_split_clip_keeps_plain_timestamp():
+    url = "https://www.youtube.com/watch?v=abcdefghijk&t=80"
+    assert split_clip(url) == (url, None)
@@ -0,0 +1,73 @@
+import asyncio
+import types
+
+import pytest
+
+pytest.importorskip("telegram")
+import bot
+
+
+class FakeSpace:
+    def __init__(self):
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+class FakeKept:
+    """finished_downloads: запоминает оставленные для повтора файлы."""
+
+    def __init__(self):
+        self.kept = []
+
+    def keep(self, key, space, file_path, info):
+        self.kept.append(key)
+
+
+@pytest.fixture
+def delivery(tmp_path, monkeypatch):
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(b"x")
+    finished = FakeKept()
+    monkeypatch.setattr(bot, "finished_downloads", finished)
+    edits = []
+
+    async def edit_message_text(text, **kwargs):
+        edits.append(text)
+
+    query = types.SimpleNamespace(data="dl", edit_message_text=edit_message_text, message=types.SimpleNamespace())
+    space = FakeSpace()
+    kept = {'space': space, 'file_path': str(file_path),
+            'info': {'filesize': 1, 'duration': 61, 'title': "Видео"}}
+
+    def deliver():
+        asyncio.run(bot.deliver_download(query, "", "url", "vid", "720", kept, estimated_size=1))
+
+    return types.SimpleNamespace(query=query, space=space, finished=finished, edits=edits, deliver=deliver)
+
+
+def test_upload_failure_keeps_file_for_retry(delivery):
+    async def reply_video(**kwargs):
+        raise RuntimeError("сеть")
+
+    delivery.query.message.reply_video = reply_video
+    delivery.deliver()
+    assert delivery.finished.kept == [("vid", "720")]
+    assert not delivery.space.released
+    assert "Файл сохранен" in delivery.edits[-1]
+
+
+def test_bookkeeping_failure_does_not_offer_resend(delivery, monkeypatch):
+    async def reply_video(**kwargs):
+        return types.SimpleNamespace()
+
+    async def remember_file_id(*args):
+        raise RuntimeError("хранилище недоступно")
+
+    delivery.query.message.reply_video = reply_video
+    monkeypatch.setattr(bot, "remember_file_id", remember_file_id)
+    delivery.deliver()
+    assert delivery.finished.kept == []
+    assert delivery.space.released
+    assert delivery.edits[-1].startswith("✅")
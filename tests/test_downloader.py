@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+yt_dlp = pytest.importorskip("yt_dlp")
+
+from downloader import estimate_choice_sizes  # noqa: E402
+from estimator import MP3_BITRATE_KBPS  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def fmt(format_id, ext, height, size, has_video=True):
+    return {
+        'format_id': format_id, 'ext': ext, 'height': height if has_video else None,
+        'vcodec': 'avc1' if has_video else 'none', 'acodec': 'none' if has_video else 'mp4a',
+        'filesize': size, 'url': f'https://example.com/{format_id}', 'protocol': 'https',
+    }
+
+
+@pytest.fixture
+def info():
+    return {
+        'id': 'abcdefghijk', 'title': 'test', 'duration': 600, 'extractor': 'generic',
+        'extractor_key': 'Generic', 'webpage_url': 'https://example.com', 'epoch': int(time.time()),
+        'formats': [
+            fmt('137', 'mp4', 1080, 120 * MB), fmt('136', 'mp4', 720, 40 * MB),
+            fmt('135', 'mp4', 480, 20 * MB), fmt('140', 'm4a', None, 9 * MB, has_video=False),
+        ],
+    }
+
+
+@pytest.fixture
+def ydl():
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        yield ydl
+
+
+def test_sizes_of_selected_formats(ydl, info):
+    sizes = estimate_choice_sizes(ydl, info, ["best", "720", "480", "audio"])
+    assert sizes == {'best': 129 * MB, '720': 49 * MB, '480': 29 * MB, 'audio': 9 * MB}
+
+
+def test_mp3_size_from_duration(ydl, info):
+    sizes = estimate_choice_sizes(ydl, info, ["audio_mp3"])
+    assert sizes == {'audio_mp3': int(MP3_BITRATE_KBPS * 1000 / 8 * 600)}
+
+
+def test_unavailable_choice_is_skipped(ydl, info):
+    info['formats'] = [f for f in info['formats'] if f['format_id'] in ('137', '140')]
+    assert estimate_choice_sizes(ydl, info, ["480", "best"]) == {'best': 129 * MB}
+
+
+def test_format_selector_is_restored(ydl, info):
+    selector = ydl.format_selector
+    estimate_choice_sizes(ydl, info, ["720"])
+    assert ydl.format_selector is selector
@@ -0,0 +1,56 @@
+from fitter import SIZE_MARGIN, fit_formats
+
+MB = 1024 * 1024
+
+
+def video(format_id, height, size, ext="mp4"):
+    return {'format_id': format_id, 'ext': ext, 'height': height, 'vcodec': 'avc1', 'acodec': 'none',
+            'filesize': size}
+
+
+def audio(format_id, size, ext="m4a"):
+    return {'format_id': format_id, 'ext': ext, 'vcodec': 'none', 'acodec': 'mp4a', 'filesize': size}
+
+
+def info(*formats, duration=600):
+    return {'duration': duration, 'formats': list(formats)}
+
+
+def test_picks_highest_pair_that_fits():
+    result = fit_formats(info(video('137', 1080, 80 * MB), video('136', 720, 35 * MB),
+                              video('135', 480, 15 * MB), audio('140', 9 * MB)), 50 * MB)
+    assert result == {'format': '136+140', 'size': 44 * MB, 'height': 720}
+
+
+def test_margin_is_applied():
+    # 48MB помещается в 50MB, но не в 50MB с запасом на контейнер
+    assert 48 * MB > 50 * MB * SIZE_MARGIN
+    result = fit_formats(info(video('136', 720, 39 * MB), video('135', 480, 15 * MB), audio('140', 9 * MB)), 50 * MB)
+    assert result['format'] == '135+140'
+
+
+def test_nothing_fits():
+    assert fit_formats(info(video('137', 1080, 80 * MB), audio('140', 9 * MB)), 50 * MB) is None
+
+
+def test_unknown_sizes_are_skipped():
+    unknown = video('136', 720, None)
+    assert fit_formats(info(unknown, audio('140', 9 * MB), duration=None), 50 * MB) is None
+
+
+def test_max_height():
+    result = fit_formats(info(video('136', 720, 20 * MB), video('135', 480, 10 * MB), audio('140', 5 * MB)),
+                         50 * MB, max_height=480)
+    assert result['height'] == 480
+
+
+def test_muxed_format_without_audio_pair():
+    muxed = {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a',
+             'filesize': 20 * MB}
+    assert fit_formats(info(muxed, video('137', 1080, 90 * MB)), 50 * MB)['format'] == '18'
+
+
+def test_prefers_compatible_codecs_at_same_height():
+    result = fit_formats(info(video('247', 720, 20 * MB, ext='webm'), video('136', 720, 18 * MB),
+                              audio('251', 8 * MB, ext='webm'), audio('140', 9 * MB)), 50 * MB)
+    assert result['format'] == '136+140'
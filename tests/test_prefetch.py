@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+import workspace
+from bandwidth import LocalValue
+from prefetch import Prefetcher
+from scheduler import DownloadScheduler
+from storage import MemoryStore
+from workspace import StorageManager
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "TEMP_DIR", tmp_path)
+    monkeypatch.setattr(workspace, "INSTANCE_DIR", tmp_path / "me")
+    return StorageManager(root=tmp_path / "me", quota=100 * MB, wait=1)
+
+
+def make_prefetcher(storage, workers=2, ttl=60) -> Prefetcher:
+    scheduler = DownloadScheduler(workers=workers, per_user=2)
+    return Prefetcher(scheduler, storage, MemoryStore(), LocalValue, enabled=True, ttl=ttl)
+
+
+def make_download(done: asyncio.Event, fail: bool = False):
+    """Скачивание, которое идет до done и прерывается флагом отмены."""
+
+    async def download(workdir, cancel):
+        while not done.is_set():
+            if cancel.value:
+                raise RuntimeError("Скачивание отменено")
+            await asyncio.sleep(0.005)
+        if fail:
+            raise RuntimeError("HTTP Error 403")
+        path = workdir / "video.mp4"
+        path.write_bytes(b"x")
+        return str(path), {'filesize': 1}
+
+    return download
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+
+
+def test_claim_matching_choice(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage)
+        done = asyncio.Event()
+        prefetch = prefetcher.start("vid", 1, "720", 10 * MB, make_download(done))
+        assert prefetch is not None
+        assert prefetcher.start("vid", 1, "720", 10 * MB, make_download(done)) is None  # Одна на видео
+        await settle()
+        assert prefetcher.claim("vid", "720") is prefetch
+        assert len(prefetcher) == 0 and prefetch.space.preempt is None
+        done.set()
+        file_path, info = await prefetch.result()
+        assert info['filesize'] == 1
+        assert storage.committed == 20 * MB  # Место освобождает забравший
+        prefetch.space.release()
+
+    asyncio.run(main())
+
+
+def test_other_choice_cancels_running_download(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage)
+        prefetch = prefetcher.start("vid", 1, "720", 10 * MB, make_download(asyncio.Event()))
+        await settle()
+        assert prefetcher.claim("vid", "audio") is None
+        assert prefetch.cancel.value == 1
+        with pytest.raises(RuntimeError):
+            await prefetch.job.wait()
+        await settle()
+        assert storage.committed == 0 and len(prefetcher) == 0
+
+    asyncio.run(main())
+
+
+def test_regular_job_preempts_prefetch(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage, workers=1)
+        prefetch = prefetcher.start("vid", 1, "720", 10 * MB, make_download(asyncio.Event()))
+        await settle()
+        assert not prefetcher.scheduler.idle
+
+        async def regular():
+            return "done"
+
+        job = prefetcher.scheduler.submit(2, regular)
+        assert prefetch.cancel.value == 1
+        assert await asyncio.wait_for(job.wait(), 1) == "done"
+        await settle()
+        assert storage.committed == 0 and len(prefetcher) == 0
+
+    asyncio.run(main())
+
+
+def test_skipped_without_free_worker(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage, workers=1)
+        done = asyncio.Event()
+        prefetcher.scheduler.submit(2, lambda: done.wait())
+        assert prefetcher.start("vid", 1, "720", 10 * MB, make_download(done)) is None
+        assert storage.committed == 0
+        done.set()
+
+    asyncio.run(main())
+
+
+def test_failed_prefetch_releases_space(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage)
+        done = asyncio.Event()
+        done.set()
+        prefetcher.start("vid", 1, "720", 10 * MB, make_download(done, fail=True))
+        await settle()
+        assert storage.committed == 0 and len(prefetcher) == 0
+
+    asyncio.run(main())
+
+
+def test_unclaimed_prefetch_expires(storage):
+    async def main():
+        prefetcher = make_prefetcher(storage, ttl=0.02)
+        done = asyncio.Event()
+        done.set()
+        prefetcher.start("vid", 1, "720", 10 * MB, make_download(done))
+        await settle()
+        assert storage.committed == 0 and len(prefetcher) == 0
+
+    asyncio.run(main())
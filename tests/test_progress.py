@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+import progress  # noqa: E402
+from progress import ProgressReporter, render_progress  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter(monkeypatch):
+    # Общий лимитер привязан к event loop - в каждом тесте свой
+    monkeypatch.setattr(progress, "_rate_limiter", None)
+
+
+def snapshot(downloaded, total=100):
+    return {'status': 'downloading', 'downloaded': downloaded, 'total': total, 'speed': 1024, 'eta': 10}
+
+
+def test_render_progress():
+    assert "[▓▓▓▓▓░░░░░] 50%" in render_progress(snapshot(50))
+    assert render_progress({'status': 'finished'}).endswith("100% - обработка...")
+
+
+def test_updates_are_coalesced_per_interval():
+    edits = []
+
+    async def edit(text):
+        edits.append(text)
+
+    async def main():
+        reporter = ProgressReporter(edit, "Скачиваю", interval=0.05)
+        reporter.start()
+        for downloaded in range(0, 101):
+            reporter.update(snapshot(downloaded))
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.12)
+        await reporter.stop()
+
+    asyncio.run(main())
+    # Около сотни обновлений - несколько редактирований, последнее с итоговым состоянием
+    assert 1 <= len(edits) <= 6
+    assert edits[-1] == f"Скачиваю\n\n{render_progress(snapshot(100))}"
+
+
+def test_same_text_is_not_edited_again():
+    edits = []
+
+    async def edit(text):
+        edits.append(text)
+
+    async def main():
+        reporter = ProgressReporter(edit, "Скачиваю", interval=0.01)
+        reporter.update(snapshot(10))
+        reporter.start()
+        await asyncio.sleep(0.08)
+        await reporter.stop()
+
+    asyncio.run(main())
+    assert len(edits) == 1
+
+
+def test_edit_errors_do_not_stop_reporting():
+    edits = []
+
+    async def edit(text):
+        edits.append(text)
+        if len(edits) == 1:
+            raise progress.BadRequest("Message is not modified")
+
+    async def main():
+        reporter = ProgressReporter(edit, "", interval=0.01)
+        reporter.update(snapshot(10))
+        reporter.start()
+        await asyncio.sleep(0.05)
+        reporter.update(snapshot(20))
+        await asyncio.sleep(0.05)
+        await reporter.stop()
+
+    asyncio.run(main())
+    assert len(edits) >= 2
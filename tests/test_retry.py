@@ -0,0 +1,102 @@
+import asyncio
+import types
+
+import pytest
+
+pytest.importorskip("telegram")
+from telegram.error import RetryAfter
+
+import retry
+from retry import CircuitBreaker, CircuitOpenError, classify, retry_call
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время автоматов отключения."""
+    now = [1000.0]
+    monkeypatch.setattr(retry, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(retry, "BREAKERS", {})
+    monkeypatch.setattr(retry, "backoff_delay", lambda attempt: 0.0)
+
+
+def test_classify():
+    assert classify(RetryAfter(7)) == (True, 7.0)
+    assert classify(Exception("HTTP Error 429: Too Many Requests")) == (True, 0.0)
+    assert classify(Exception("Sign in to confirm you're not a bot")) == (True, 0.0)
+    assert classify(Exception("Read timed out")) == (True, 0.0)
+    assert classify(Exception("Video unavailable")) == (False, 0.0)
+    assert classify(CircuitOpenError("extraction", 30)) == (False, 0.0)
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    circuit = CircuitBreaker("extraction", threshold=2, cooldown=60)
+    circuit.failure()
+    assert circuit.state == "closed"
+    circuit.check()
+    circuit.failure()
+    assert circuit.state == "open"
+    with pytest.raises(CircuitOpenError) as info:
+        circuit.check()
+    assert info.value.retry_in == 60
+
+    clock[0] += 61
+    assert circuit.state == "half_open"
+    circuit.check()  # Пробный вызов проходит...
+    with pytest.raises(CircuitOpenError):
+        circuit.check()  # ...а остальные ждут его результата
+    circuit.success()
+    assert circuit.state == "closed" and circuit.failures == 0
+
+
+def test_failed_probe_reopens(clock):
+    circuit = CircuitBreaker("upload", threshold=1, cooldown=60)
+    circuit.failure(pause=90)  # Сервер просил ждать дольше паузы
+    assert circuit.retry_in() == 90
+    clock[0] += 91
+    circuit.check()
+    circuit.failure()
+    assert circuit.state == "open" and circuit.retry_in() == 60
+
+
+def test_retry_call_retries_transient_errors(clock):
+    calls = []
+
+    async def flaky():
+        calls.append(True)
+        if len(calls) < 3:
+            raise Exception("HTTP Error 503")
+        return "ok"
+
+    assert asyncio.run(retry_call("extraction", flaky, attempts=4)) == "ok"
+    assert len(calls) == 3
+    assert retry.breaker("extraction").failures == 0
+
+
+def test_retry_call_does_not_retry_permanent_errors(clock):
+    calls = []
+
+    async def broken():
+        calls.append(True)
+        raise ValueError("Video unavailable")
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_call("extraction", broken))
+    assert len(calls) == 1
+
+
+def test_retry_call_opens_breaker(clock, monkeypatch):
+    monkeypatch.setitem(retry.BREAKERS, "extraction", CircuitBreaker("extraction", threshold=2, cooldown=60))
+
+    async def throttled():
+        raise Exception("HTTP Error 429")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(retry_call("extraction", throttled, attempts=4))
+    # Пока цель отключена, вызов даже не делается
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(retry_call("extraction", throttled))
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from scheduler import DownloadScheduler, QueueFullError
+
+
+def run_jobs(scheduler: DownloadScheduler, users: list[int]) -> list[tuple[int, int]]:
+    """Ставит по задаче на каждого user_id из users и возвращает порядок запуска (пользователь, номер)."""
+    started = []
+
+    async def main():
+        jobs = []
+        for number, user_id in enumerate(users):
+            async def func(user_id=user_id, number=number):
+                started.append((user_id, number))
+                await asyncio.sleep(0)
+            jobs.append(scheduler.submit(user_id, func))
+        await asyncio.gather(*(job.wait() for job in jobs))
+
+    asyncio.run(main())
+    return started
+
+
+def test_fair_policy_alternates_users():
+    scheduler = DownloadScheduler(workers=1, per_user=1, policy="fair")
+    assert run_jobs(scheduler, [1, 1, 1, 2]) == [(1, 0), (2, 3), (1, 1), (1, 2)]
+
+
+def test_fifo_policy_keeps_order():
+    scheduler = DownloadScheduler(workers=1, per_user=1, policy="fifo")
+    assert run_jobs(scheduler, [1, 1, 1, 2]) == [(1, 0), (1, 1), (1, 2), (2, 3)]
+
+
+def test_per_user_limit():
+    async def main():
+        scheduler = DownloadScheduler(workers=3, per_user=1)
+        release = asyncio.Event()
+
+        async def func():
+            await release.wait()
+
+        jobs = [scheduler.submit(1, func), scheduler.submit(1, func), scheduler.submit(2, func)]
+        await asyncio.sleep(0)
+        assert (scheduler.active, scheduler.queued) == (2, 1)
+        assert jobs[1].position == 1
+        release.set()
+        await asyncio.gather(*(job.wait() for job in jobs))
+        assert (scheduler.active, scheduler.queued) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_rejects_when_queue_is_full():
+    async def main():
+        scheduler = DownloadScheduler(workers=1, max_queue=2, max_queued_per_user=5)
+        release = asyncio.Event()
+
+        async def func():
+            await release.wait()
+
+        jobs = [scheduler.submit(user_id, func) for user_id in (1, 2, 3)]
+        with pytest.raises(QueueFullError):
+            scheduler.submit(4, func)
+        release.set()
+        await asyncio.gather(*(job.wait() for job in jobs))
+
+    asyncio.run(main())
+
+
+def test_rejects_user_over_own_queue_limit():
+    async def main():
+        scheduler = DownloadScheduler(workers=1, per_user=1, max_queue=10, max_queued_per_user=2)
+        release = asyncio.Event()
+
+        async def func():
+            await release.wait()
+
+        jobs = [scheduler.submit(1, func) for _ in range(3)]  # Одна выполняется, две ждут
+        with pytest.raises(QueueFullError):
+            scheduler.submit(1, func)
+        jobs.append(scheduler.submit(2, func))  # Другой пользователь не ограничен чужой очередью
+        release.set()
+        await asyncio.gather(*(job.wait() for job in jobs))
+
+    asyncio.run(main())
+
+
+def test_speculative_job_is_preempted():
+    async def main():
+        scheduler = DownloadScheduler(workers=1)
+        release = asyncio.Event()
+        preempted = []
+
+        async def func():
+            await release.wait()
+
+        speculative = scheduler.submit(1, func, preempt=lambda: (preempted.append(True), release.set()))
+        await asyncio.sleep(0)
+        assert not scheduler.idle
+        regular = scheduler.submit(2, func)
+        assert preempted == [True]
+        await asyncio.gather(speculative.wait(), regular.wait())
+
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+import time
+import types
+
+import pytest
+
+import storage
+from storage import DistributedLock, MemoryStore, SQLiteStore
+
+
+class Clock:
+    """Подменяет time.time в storage: TTL проверяются без ожидания."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(storage, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, clock):
+    store = MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "store.db"))
+    yield store
+    store.close()
+
+
+def test_set_get_delete(store):
+    store.set("key", {'a': 1})
+    assert store.get("key") == {'a': 1}
+    assert store.delete("key")
+    assert store.get("key") is None
+    assert not store.delete("key")
+
+
+def test_ttl_expires(store, clock):
+    store.set("key", "value", ttl=10)
+    clock.now += 9
+    assert store.get("key") == "value"
+    clock.now += 2
+    assert store.get("key") is None
+    assert store.keys("k") == []
+
+
+def test_add_only_if_absent_or_expired(store, clock):
+    assert store.add("key", "first", ttl=10)
+    assert not store.add("key", "second", ttl=10)
+    assert store.get("key") == "first"
+    clock.now += 11
+    assert store.add("key", "third", ttl=10)
+    assert store.get("key") == "third"
+
+
+def test_delete_expected(store):
+    store.set("key", "mine")
+    assert not store.delete("key", expected="other")
+    assert store.get("key") == "mine"
+    assert store.delete("key", expected="mine")
+
+
+def test_incr_keeps_first_ttl(store, clock):
+    assert store.incr("counter", ttl=10) == 1
+    clock.now += 5
+    assert store.incr("counter", 2, ttl=10) == 3
+    clock.now += 6
+    assert store.get("counter") is None
+    assert store.incr("counter", ttl=10) == 1
+
+
+def test_keys_by_prefix(store):
+    store.set("a:1", 1)
+    store.set("a:2", 2)
+    store.set("b:1", 3)
+    assert store.keys("a:") == ["a:1", "a:2"]
+
+
+def test_purge_expired(store, clock):
+    store.set("old", 1, ttl=5)
+    store.set("new", 2, ttl=50)
+    store.set("forever", 3)
+    clock.now += 10
+    assert store.purge_expired() == 1
+    assert sorted(store.keys("")) == ["forever", "new"]
+
+
+def test_lock_is_exclusive(store):
+    first, second = DistributedLock(store, "video", ttl=30), DistributedLock(store, "video", ttl=30)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    first.release()  # Чужую блокировку release не снимает
+    assert store.get("lock:video") == second.token
+
+
+def test_lock_expires_without_renewal(store, clock):
+    first, second = DistributedLock(store, "video", ttl=30), DistributedLock(store, "video", ttl=30)
+    assert first.try_acquire()
+    clock.now += 31
+    assert second.try_acquire()
+    assert not first.renew()
+    first.release()
+    assert store.get("lock:video") == second.token
+
+
+def test_lock_renewal_extends_ttl(store, clock):
+    first, second = DistributedLock(store, "video", ttl=30), DistributedLock(store, "video", ttl=30)
+    assert first.try_acquire()
+    clock.now += 20
+    assert first.renew()
+    clock.now += 20
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+
+
+def test_incomplete_backend_fails_on_creation():
+    class Partial(storage.Store):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+from web_server import HttpServer, Response
+
+
+async def request(port: int, raw: bytes) -> tuple[int, bytes]:
+    """Отправляет сырой HTTP-запрос и возвращает (статус, тело)."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split()[1])
+    length = int(next(line.split(b":")[1] for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")))
+    body = await reader.readexactly(length)
+    writer.close()
+    await writer.wait_closed()
+    return status, body
+
+
+def get(path: str) -> bytes:
+    return f"GET {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode()
+
+
+def post(path: str, body: bytes, headers: str = "") -> bytes:
+    return (f"POST {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n{headers}"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+def serve(server: HttpServer, scenario):
+    async def main():
+        await server.start("127.0.0.1", 0)
+        try:
+            return await scenario(server.port)
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def server():
+    server = HttpServer(max_body_size=1024)
+
+    async def hello(request):
+        return Response(200, f"hello {request.query.get('name', ['?'])[0]}")
+
+    async def echo(request):
+        return Response.json({'path': request.path, 'body': request.json()})
+
+    async def broken(request):
+        raise RuntimeError("сломался")
+
+    server.add_route("GET", "/hello", hello)
+    server.add_route("POST", "/echo", echo)
+    server.add_route("POST", "/files/*", echo)
+    server.add_route("GET", "/broken", broken)
+    return server
+
+
+def test_routes(server):
+    async def scenario(port):
+        assert await request(port, get("/hello?name=bot")) == (200, b"hello bot")
+        assert (await request(port, get("/missing")))[0] == 404
+        assert (await request(port, get("/echo")))[0] == 405
+        assert (await request(port, get("/broken")))[0] == 500
+        status, body = await request(port, post("/files/a/b", b'{"x": 1}'))
+        assert status == 200 and json.loads(body) == {'path': "/files/a/b", 'body': {'x': 1}}
+
+    serve(server, scenario)
+
+
+def test_body_limits_and_chunked(server):
+    async def scenario(port):
+        assert (await request(port, post("/echo", b"x" * 2048)))[0] == 413
+        chunked = (b"POST /echo HTTP/1.1\r\nHost: x\r\nConnection: close\r\nTransfer-Encoding: chunked\r\n\r\n"
+                   b"4\r\n[1, \r\n2\r\n2]\r\n0\r\n\r\n")
+        status, body = await request(port, chunked)
+        assert status == 200 and json.loads(body)['body'] == [1, 2]
+
+    serve(server, scenario)
+
+
+def test_keep_alive_serves_several_requests(server):
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for name in ("a", "b"):
+            writer.write(f"GET /hello?name={name} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+            assert await reader.readexactly(7) == f"hello {name}".encode()
+        writer.close()
+        await writer.wait_closed()
+
+    serve(server, scenario)
+
+
+def test_webhook_secret(monkeypatch):
+    pytest.importorskip("telegram")
+    import bot
+
+    monkeypatch.setattr(bot, "BOT_MODE", "webhook")
+    monkeypatch.setattr(bot, "WEBHOOK_SECRET", "s3cret")
+    queue = asyncio.Queue()
+    application = types.SimpleNamespace(bot=None, update_queue=queue, running=True)
+    update = json.dumps({'update_id': 1}).encode()
+
+    async def scenario(port):
+        path = bot.WEBHOOK_PATH
+        assert (await request(port, post(path, update)))[0] == 403
+        wrong = "X-Telegram-Bot-Api-Secret-Token: nope\r\n"
+        assert (await request(port, post(path, update, wrong)))[0] == 403
+        assert queue.empty()
+        right = "X-Telegram-Bot-Api-Secret-Token: s3cret\r\n"
+        assert (await request(port, post(path, update, right)))[0] == 200
+        assert (await request(port, post(path, b"[]", right)))[0] == 400
+        assert (await request(port, post(path, b"{", right)))[0] == 400
+        assert queue.get_nowait().update_id == 1
+
+    serve(bot.build_http_server(application), scenario)
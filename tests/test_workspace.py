@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import workspace
+from workspace import JOB_DIR_PREFIX, INSTANCE_MARKER, QuotaExceededError, StorageManager
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    """Свои TEMP_DIR и папка экземпляра для каждого теста."""
+    temp_dir = tmp_path / "temp"
+    instance_dir = temp_dir / "me"
+    temp_dir.mkdir()
+    monkeypatch.setattr(workspace, "TEMP_DIR", temp_dir)
+    monkeypatch.setattr(workspace, "INSTANCE_DIR", instance_dir)
+    return temp_dir, instance_dir
+
+
+def make_manager(dirs, quota=100 * MB, wait=0.05) -> StorageManager:
+    return StorageManager(root=dirs[1], quota=quota, wait=wait)
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_reserve_and_release(dirs):
+    manager = make_manager(dirs)
+
+    async def main():
+        space = manager.job_space(20 * MB)  # Резерв - вдвое больше оценки
+        path = await space.acquire()
+        assert path.is_dir() and path.parent == dirs[1]
+        assert manager.committed == 40 * MB
+        space.release()
+        assert not path.exists()
+        assert manager.committed == 0
+        space.release()  # Повторный release безопасен
+
+    asyncio.run(main())
+
+
+def test_rejects_when_quota_does_not_free_up(dirs):
+    manager = make_manager(dirs)
+
+    async def main():
+        first = manager.job_space(30 * MB)
+        await first.acquire()
+        waited = []
+        with pytest.raises(QuotaExceededError):
+            await manager.job_space(30 * MB).acquire(on_wait=lambda: waited.append(True))
+        assert waited == [True]
+        assert manager.rejected == 1
+        first.release()
+
+    asyncio.run(main())
+
+
+def test_release_wakes_waiting_job(dirs):
+    manager = make_manager(dirs, wait=5)
+
+    async def main():
+        first = manager.job_space(30 * MB)
+        await first.acquire()
+        second = manager.job_space(30 * MB)
+        waiting = asyncio.create_task(second.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and manager.stats()['waiting'] == 1
+        # Пока кто-то ждет, спекулятивная задача не занимает место
+        assert not manager.job_space(1).try_acquire()
+        first.release()
+        assert (await asyncio.wait_for(waiting, 1)).is_dir()
+        second.release()
+
+    asyncio.run(main())
+
+
+def test_speculative_space_is_preempted(dirs):
+    manager = make_manager(dirs, wait=5)
+
+    async def main():
+        speculative = manager.job_space(30 * MB)
+        assert speculative.try_acquire()
+        preempted = []
+        speculative.preempt = lambda: (preempted.append(True), speculative.release())
+        regular = manager.job_space(30 * MB)
+        await asyncio.wait_for(regular.acquire(), 1)
+        assert preempted == [True]
+        assert manager.committed == 60 * MB
+        regular.release()
+
+    asyncio.run(main())
+
+
+def test_scan_accounts_real_size_and_evicts_orphans(dirs):
+    manager = make_manager(dirs)
+
+    async def main():
+        space = manager.job_space(1 * MB)  # Резерв 2MB
+        path = await space.acquire()
+        (path / "video.mp4").write_bytes(b"x" * (3 * MB))
+        old = dirs[1] / f"{JOB_DIR_PREFIX}old"
+        old.mkdir()
+        (old / "a.part").write_bytes(b"x" * 1000)
+        age(old, workspace.ORPHAN_GRACE + 10)
+        young = dirs[1] / f"{JOB_DIR_PREFIX}young"
+        young.mkdir()
+        (young / "b.part").write_bytes(b"x" * 500)
+
+        manager._apply_scan(await asyncio.to_thread(manager.scan))
+        assert not old.exists() and young.exists()
+        assert (dirs[1] / INSTANCE_MARKER).exists()  # Метка экземпляра - не забытая папка
+        assert space.used == 3 * MB
+        assert manager.untracked == 500
+        assert manager.committed == 3 * MB + 500  # Файлы выросли больше резерва
+        assert manager.usage == 3 * MB + 500
+        space.release()
+
+    asyncio.run(main())
+
+
+def test_sweep_orphans_touches_only_bot_dirs(dirs):
+    temp_dir, instance_dir = dirs
+    stale = workspace.STALE_INSTANCE_AGE + 10
+    mine = workspace.new_job_dir()
+
+    other_live = temp_dir / "other-live"
+    other_live.mkdir()
+    (other_live / INSTANCE_MARKER).touch()
+    other_dead = temp_dir / "other-dead"
+    (other_dead / f"{JOB_DIR_PREFIX}x").mkdir(parents=True)
+    (other_dead / INSTANCE_MARKER).touch()
+    age(other_dead, stale)
+    legacy = temp_dir / f"{JOB_DIR_PREFIX}legacy"
+    legacy.mkdir()
+    age(legacy, stale)
+    foreign_dir = temp_dir / "someone-else"
+    foreign_dir.mkdir()
+    age(foreign_dir, stale)
+    foreign_file = temp_dir / "notes.txt"
+    foreign_file.write_text("не наше")
+    age(foreign_file, stale)
+
+    assert workspace.sweep_orphans() == 3
+    assert not mine.exists() and (instance_dir / INSTANCE_MARKER).exists()
+    assert not other_dead.exists() and not legacy.exists()
+    assert other_live.exists() and foreign_dir.exists() and foreign_file.exists()
+
+
+def test_remove_job_dir_refuses_outside_instance_dir(dirs, tmp_path):
+    outside = tmp_path / "keep"
+    outside.mkdir()
+    workspace.remove_job_dir(outside)
+    assert outside.exists()
@@ -6,7 +6,7 @@ $username = "YOUR_USERNAME"  # Замени на свой GitHub username
 $repo = "telegram-bot-maxwin"  # Замени на имя репозитория
 
 git init
-git add main.py requirements.txt help_screenshot.jpg .gitignore
+git add main.py bot.py requirements.txt help_screenshot.jpg .gitignore
 git commit -m "Initial commit: Telegram bot MaxWIN Radar"
 git branch -M main
 git remote add origin "https://github.com/$username/$repo.git"
@@ -0,0 +1,200 @@
+"""
+Минимальный асинхронный HTTP-сервер на asyncio.
+
+Работает в том же event loop, что и бот: принимает вебхуки Telegram и
+отвечает на проверки здоровья (/health, /ready). Заменяет Flask-сервер
+keep-alive, которому нужен был отдельный поток.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+
+# Ограничения на размер запроса
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 10 * 1024 * 1024
+READ_TIMEOUT = 30
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class Request:
+    """Входящий HTTP-запрос."""
+
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = parse_qs(parts.query)
+        self.headers = headers  # Имена заголовков в нижнем регистре
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+class Response:
+    """Ответ обработчика."""
+
+    def __init__(self, status: int = 200, body: bytes | str = b"", content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> "Response":
+        return cls(status, json.dumps(data, ensure_ascii=False), "application/json")
+
+
+class HttpServer:
+    """
+    HTTP/1.1 сервер с таблицей маршрутов.
+
+    Обработчик маршрута - корутина handler(request) -> Response.
+    Путь, оканчивающийся на "*", задает маршрут по префиксу.
+    """
+
+    def __init__(self, max_body_size: int = MAX_BODY_SIZE):
+        self.max_body_size = max_body_size
+        self._routes: dict[tuple[str, str], object] = {}
+        self._prefix_routes: list[tuple[str, str, object]] = []
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    def add_route(self, method: str, path: str, handler):
+        if path.endswith("*"):
+            self._prefix_routes.append((method.upper(), path[:-1], handler))
+        else:
+            self._routes[(method.upper(), path)] = handler
+
+    @property
+    def port(self) -> int | None:
+        """Фактический порт (полезно при запуске с портом 0)."""
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"✅ HTTP-сервер слушает {host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Открытые keep-alive соединения закрываем сами
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Request | Response | None:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _version = request_line.decode("latin-1").split()
+        except ValueError:
+            return Response(400, "bad request line")
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            return Response(400, "too many headers")
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+            if body is None:
+                return Response(413, "body too large")
+            return Request(method.upper(), target, headers, body)
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body_size:
+            return Response(413, "body too large")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target, headers, body)
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes | None:
+        """Тело с Transfer-Encoding: chunked; None, если оно больше лимита."""
+        chunks = []
+        total = 0
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Завершающие заголовки (trailer) до пустой строки
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            total += size
+            if total > self.max_body_size:
+                return None
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()  # \r\n после блока
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            handler = next(
+                (h for method, prefix, h in self._prefix_routes
+                 if method == request.method and request.path.startswith(prefix)),
+                None,
+            )
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return Response(405, "method not allowed")
+            return Response(404, "not found")
+        try:
+            return await handler(request)
+        except Exception as e:
+            print(f"❌ Ошибка обработчика {request.method} {request.path}: {e}")
+            return Response(500, "internal error")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    break
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    await self._write(writer, request, keep_alive=False)
+                    break
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, 'Unknown')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
+        await writer.drain()
@@ -0,0 +1,411 @@
+"""
+Временные рабочие папки задач и квота на диск.
+
+Каждая загрузка получает собственную папку внутри папки своего экземпляра
+бота (INSTANCE_DIR в TEMP_DIR), поэтому одновременные задачи не видят файлов
+друг друга, а экземпляры с общим TEMP_DIR не трогают чужие задачи. Папка
+удаляется целиком после завершения задачи, а при запуске бота удаляются
+остатки от аварийно завершенных запусков.
+
+StorageManager ограничивает TEMP_DIR квотой: задача резервирует оценку
+своего размера до начала скачивания и ждет, пока место освободится (или
+получает отказ). Фоновый проход считает реальный размер папок задач и
+удаляет папки, не принадлежащие ни одной задаче. FinishedDownloads
+придерживает папки задач, файл которых не удалось отправить.
+
+Спекулятивное место (с preempt, например предзагрузка) занимается только
+без ожидания (try_acquire) и уступается задаче, которой не хватает места.
+"""
+import asyncio
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from metrics import DISK_EVICTED_BYTES
+
+# Папка для временных файлов
+TEMP_DIR = Path(os.getenv("TEMP_DIR", "temp_downloads"))
+TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
+# Папка этого экземпляра бота: несколько экземпляров с общим TEMP_DIR
+# считают и чистят только свои задачи. С постоянным INSTANCE_ID перезапуск
+# убирает остатки своего прошлого запуска сразу
+INSTANCE_DIR = TEMP_DIR / re.sub(
+    r"[^\w.-]", "_", os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+)
+
+JOB_DIR_PREFIX = "job-"
+# Файл-метка в папке экземпляра: sweep_orphans удаляет из TEMP_DIR только
+# папки с меткой и папки задач - TEMP_DIR может быть общей папкой (/tmp)
+INSTANCE_MARKER = ".ytbot-instance"
+
+MB = 1024 * 1024
+
+# Квота на TEMP_DIR; 0 - 80% свободного места на диске при запуске
+TEMP_QUOTA_MB = int(os.getenv("TEMP_QUOTA_MB", "0"))
+# Сколько задача ждет свободного места, прежде чем получить отказ (секунды)
+QUOTA_WAIT = float(os.getenv("QUOTA_WAIT", "300"))
+# Резерв - во столько раз больше оценки размера: видео и аудио скачиваются
+# отдельно и склеиваются, а перекодирование или нарезка создают еще копию
+RESERVE_FACTOR = 2.0
+# Резерв для задачи с неизвестным размером
+DEFAULT_RESERVATION_MB = int(os.getenv("DEFAULT_RESERVATION_MB", "200"))
+# Как часто пересчитывать занятое место и удалять забытые папки (секунды)
+EVICT_INTERVAL = float(os.getenv("EVICT_INTERVAL", "60"))
+# Папки без задачи моложе этого возраста не трогаем - их могли только что создать
+ORPHAN_GRACE = 120
+# Папку другого экземпляра, которую он не отмечал столько секунд, удаляем при
+# запуске: экземпляр завершился (живой отмечает ее каждые EVICT_INTERVAL)
+STALE_INSTANCE_AGE = max(3600, EVICT_INTERVAL * 10)
+# Сколько хранится скачанный, но не отправленный файл (секунды): повтор задачи
+# отправляет его без нового скачивания. 0 - не хранить
+KEEP_FINISHED = float(os.getenv("KEEP_FINISHED", "600"))
+
+
+def new_job_dir() -> Path:
+    """Создает пустую рабочую папку для одной задачи."""
+    if not (INSTANCE_DIR / INSTANCE_MARKER).exists():
+        INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
+        (INSTANCE_DIR / INSTANCE_MARKER).touch()
+    return Path(tempfile.mkdtemp(prefix=JOB_DIR_PREFIX, dir=INSTANCE_DIR))
+
+
+def remove_job_dir(path: Path | str | None):
+    """Удаляет рабочую папку задачи вместе со всеми файлами (в том числе .part)."""
+    if not path:
+        return
+    path = Path(path)
+    # Защита от удаления чего-либо за пределами папки экземпляра
+    if path.resolve().parent != INSTANCE_DIR.resolve():
+        print(f"⚠️ Отказ удалять папку вне {INSTANCE_DIR}: {path}")
+        return
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def temp_dir_usage() -> int:
+    """Сколько байт сейчас занято в TEMP_DIR (файлы, которые уже удалены, пропускаются)."""
+    return _entry_size(TEMP_DIR)
+
+
+def _entry_size(path: Path) -> int:
+    if path.is_file():
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class QuotaExceededError(Exception):
+    """Для задачи не нашлось места на диске."""
+
+
+class JobSpace:
+    """
+    Место на диске одной задачи: резерв в квоте и рабочая папка.
+
+    Папка создается в acquire(); release() удаляет ее со всеми файлами
+    (в том числе .part и промежуточными файлами ffmpeg) и возвращает резерв.
+    release() можно вызывать при любом исходе и повторно.
+    """
+
+    def __init__(self, manager: "StorageManager", reserved: int):
+        self.manager = manager
+        self.reserved = reserved
+        self.path: Path | None = None
+        self.used = 0  # Реальный размер по последнему проходу
+        # Для спекулятивного места - просит освободить его для другой задачи
+        self.preempt = None
+
+    @property
+    def accounted(self) -> int:
+        """Сколько места задача занимает в квоте: резерв или больше, если файлы выросли."""
+        return max(self.reserved, self.used)
+
+    async def acquire(self, on_wait=None) -> Path:
+        """
+        Ждет места в квоте, резервирует его и создает рабочую папку.
+
+        Args:
+            on_wait: Вызывается (или ожидается, если вернула корутину) один раз,
+                если места сразу нет
+
+        Raises:
+            QuotaExceededError: Если место не освободилось за QUOTA_WAIT
+        """
+        if self.path is None:
+            await self.manager._reserve(self, on_wait)
+        return self.path
+
+    def try_acquire(self) -> bool:
+        """
+        Резервирует место и создает папку, только если место есть сразу
+        и никто не ждет своей очереди.
+        """
+        if self.path is None:
+            if self.manager._waiters or not self.manager._fits(self):
+                return False
+            self.manager._take(self)
+        return True
+
+    def release(self):
+        """Удаляет папку задачи и возвращает резерв."""
+        self.manager._release(self)
+
+
+class StorageManager:
+    """Квота на папку экземпляра в TEMP_DIR, резервы задач и фоновая очистка."""
+
+    def __init__(self, root: Path = INSTANCE_DIR, quota: int | None = None, wait: float = QUOTA_WAIT):
+        self.root = root
+        if quota is None:
+            quota = TEMP_QUOTA_MB * MB or int(shutil.disk_usage(TEMP_DIR).free * 0.8)
+        self.quota = quota
+        self.wait = wait
+        self.untracked = 0  # Папки без задачи (по последнему проходу)
+        self.usage = 0  # Занято в TEMP_DIR (по последнему проходу)
+        self.rejected = 0
+        self._spaces: set[JobSpace] = set()
+        self._waiters: list[asyncio.Future] = []
+
+    def job_space(self, estimated_size: int = 0) -> JobSpace:
+        """
+        Место для задачи с оценкой размера файла estimated_size (0 - неизвестен).
+
+        Резерв не больше всей квоты: такая задача просто дождется, пока диск освободится.
+        """
+        reserve = int(estimated_size * RESERVE_FACTOR) if estimated_size else DEFAULT_RESERVATION_MB * MB
+        return JobSpace(self, min(reserve, self.quota))
+
+    @property
+    def committed(self) -> int:
+        """Занято в квоте: резервы (или реальный размер) задач и чужие папки."""
+        return sum(space.accounted for space in self._spaces) + self.untracked
+
+    def _fits(self, space: JobSpace) -> bool:
+        return self.committed + space.reserved <= self.quota
+
+    async def _reserve(self, space: JobSpace, on_wait=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait
+        notified = False
+        while not self._fits(space):
+            if self._preempt():
+                continue  # Место могло освободиться сразу
+            if not notified and on_wait is not None:
+                notified = True
+                result = on_wait()
+                if asyncio.iscoroutine(result):
+                    await result
+                continue  # Пока уведомляли, место могло освободиться
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.rejected += 1
+                raise QuotaExceededError("Недостаточно места на диске для загрузки, попробуйте позже")
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._take(space)
+
+    def _take(self, space: JobSpace):
+        space.path = new_job_dir()
+        self._spaces.add(space)
+
+    def _preempt(self) -> bool:
+        """
+        Просит спекулятивные задачи освободить место (release разбудит ждущих).
+
+        Returns:
+            bool: Была ли хоть одна такая задача
+        """
+        preempted = False
+        for space in list(self._spaces):
+            if space.preempt is not None:
+                preempt, space.preempt = space.preempt, None
+                preempt()
+                preempted = True
+        return preempted
+
+    def _release(self, space: JobSpace):
+        if space.path is not None:
+            remove_job_dir(space.path)
+        if space in self._spaces:
+            self._spaces.remove(space)
+            self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def scan(self) -> dict:
+        """
+        Пересчитывает размер папок задач и удаляет забытые.
+
+        Забытые - папки задач (JOB_DIR_PREFIX) в папке экземпляра, которые
+        не принадлежат ни одной задаче и старше ORPHAN_GRACE (например, папки download_video без
+        workdir или остатки задач, которые завершились аварийно). Папки
+        других экземпляров не трогаются. Выполняется в рабочем потоке.
+
+        Returns:
+            dict: Размеры по папкам задач и итог прохода
+        """
+        owned = {space.path.resolve(): space for space in list(self._spaces) if space.path is not None}
+        sizes = {}
+        untracked = evicted = 0
+        now = time.time()
+        if self.root.exists():
+            os.utime(self.root)  # Экземпляр жив - sweep_orphans других экземпляров не удалит папку
+        for entry in self.root.iterdir() if self.root.exists() else []:
+            if not entry.name.startswith(JOB_DIR_PREFIX):
+                continue  # Метка экземпляра или чужой файл
+            size = _entry_size(entry)
+            space = owned.get(entry.resolve())
+            if space is not None:
+                sizes[space] = size
+                continue
+            try:
+                young = now - entry.stat().st_mtime < ORPHAN_GRACE
+            except OSError:
+                continue  # Уже удалена
+            if young:
+                untracked += size
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            evicted += size
+        return {'sizes': sizes, 'untracked': untracked, 'evicted': evicted}
+
+    def _apply_scan(self, result: dict):
+        for space, size in result['sizes'].items():
+            space.used = size
+        self.untracked = result['untracked']
+        self.usage = sum(result['sizes'].values()) + result['untracked']
+        if result['evicted']:
+            DISK_EVICTED_BYTES.inc(result['evicted'])
+            print(f"🧹 Удалено забытых временных файлов: {result['evicted'] / MB:.1f}MB")
+        self._wake()  # Место могло освободиться
+
+    async def run(self, interval: float = EVICT_INTERVAL):
+        """Периодический проход scan() - запускается вместе с ботом."""
+        while True:
+            try:
+                self._apply_scan(await asyncio.to_thread(self.scan))
+            except Exception as e:
+                print(f"⚠️ Ошибка очистки временных файлов: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        """Состояние квоты."""
+        return {
+            'quota': self.quota,
+            'committed': self.committed,
+            'reserved': sum(space.reserved for space in self._spaces),
+            'jobs': len(self._spaces),
+            'waiting': len(self._waiters),
+            'rejected': self.rejected,
+        }
+
+
+def sweep_orphans() -> int:
+    """
+    Удаляет все, что осталось от прошлых запусков.
+
+    Вызывается при старте, когда ни одной задачи еще нет: удаляет папки
+    задач этого экземпляра, а из TEMP_DIR - папки других экземпляров (с
+    INSTANCE_MARKER) и папки задач старых версий бота, не отмеченные дольше
+    STALE_INSTANCE_AGE. Остальное в TEMP_DIR не трогается.
+
+    Returns:
+        int: Количество удаленных файлов и папок
+    """
+    removed = 0
+    if not TEMP_DIR.exists():
+        return removed
+    entries = [
+        entry for entry in (INSTANCE_DIR.iterdir() if INSTANCE_DIR.exists() else [])
+        if entry.name.startswith(JOB_DIR_PREFIX)
+    ]
+    now = time.time()
+    for entry in TEMP_DIR.iterdir():
+        if entry == INSTANCE_DIR:
+            continue
+        if not (entry.name.startswith(JOB_DIR_PREFIX) or (entry / INSTANCE_MARKER).is_file()):
+            continue  # Не папка бота
+        try:
+            if now - entry.stat().st_mtime >= STALE_INSTANCE_AGE:
+                entries.append(entry)
+        except OSError:
+            pass  # Уже удалена
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+            removed += 1
+        except OSError as e:
+            print(f"⚠️ Не удалось удалить {entry}: {e}")
+    return removed
+
+
+class FinishedDownloads:
+    """
+    Скачанные файлы, которые не удалось отправить.
+
+    Файл остается в папке своей задачи (и ее резерв - в квоте) до повтора
+    или до истечения KEEP_FINISHED, поэтому повтор начинается с отправки.
+    """
+
+    def __init__(self, ttl: float = KEEP_FINISHED):
+        self.ttl = ttl
+        self._entries: dict[tuple, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keep(self, key: tuple, space: JobSpace, file_path: str, info: dict):
+        """Сохраняет результат задачи; space освобождается при истечении или discard()."""
+        self.discard(key)
+        if self.ttl <= 0:
+            space.release()
+            return
+        expiry = asyncio.get_running_loop().call_later(self.ttl, self.discard, key)
+        self._entries[key] = {'space': space, 'file_path': file_path, 'info': info, 'expiry': expiry}
+
+    def take(self, key: tuple) -> dict | None:
+        """
+        Забирает сохраненный результат: освободить его space - забота вызывающего.
+
+        Returns:
+            dict: {'space', 'file_path', 'info'} или None
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        entry['expiry'].cancel()
+        return entry
+
+    def discard(self, key: tuple):
+        entry = self.take(key)
+        if entry is not None:
+            entry['space'].release()